@@ -0,0 +1,66 @@
+import logging
+import os
+import statistics
+import time
+
+import src.server.agent_registry as sc_agent_registry
+
+
+logging.basicConfig(level=logging.INFO)
+
+
+def _time_call(func, repeats: int) -> list[float]:
+    """Returns the duration in milliseconds of each of `repeats` calls."""
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        durations.append((time.perf_counter() - start) * 1000)
+    return durations
+
+
+def benchmark_agent(agent_class: type, repeats: int = 20) -> dict[str, float]:
+    """Measure the startup overhead of an agent with and without the registry.
+
+    Args:
+        agent_class (type): The agent class to benchmark.
+        repeats (int): Number of measured constructions. Defaults to 20.
+
+    Returns:
+        dict[str, float]: Cold-start, per-request construction and per-request
+            registry lookup times in milliseconds.
+    """
+    logging.info(f"Benchmarking {agent_class.__name__}")
+
+    registry = sc_agent_registry.AgentRegistry()
+    cold_start_ms = _time_call(lambda: registry.get(agent_class), repeats=1)[0]
+    construct_ms = _time_call(agent_class, repeats)
+    registry_ms = _time_call(lambda: registry.get(agent_class), repeats)
+
+    return {
+        "cold_start_ms": cold_start_ms,
+        "construct_p50_ms": statistics.median(construct_ms),
+        "registry_p50_ms": statistics.median(registry_ms),
+    }
+
+
+if __name__ == "__main__":
+    # Constructing the agents does not call any API, so placeholder keys suffice.
+    for key in ["OPENAI_API_KEY", "GOOGLE_API_KEY", "GOOGLE_CSE_ID"]:
+        os.environ.setdefault(key, "benchmark")
+
+    start = time.perf_counter()
+    import src.server.create_recipe as sc_create_recipe
+    import src.server.extract_items as sc_extract_items
+
+    logging.info(f"Imported agents in {(time.perf_counter() - start) * 1000:.1f}ms")
+
+    for agent_class in [
+        sc_create_recipe.CreateRecipeAgent,
+        sc_extract_items.ExtractItemsAgent,
+    ]:
+        results = benchmark_agent(agent_class)
+        logging.info(
+            f"{agent_class.__name__}: "
+            + ", ".join(f"{name}={value:.2f}" for name, value in results.items())
+        )
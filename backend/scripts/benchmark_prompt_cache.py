@@ -0,0 +1,195 @@
+import datetime
+import hashlib
+import http.server
+import json
+import logging
+import math
+import os
+import statistics
+import threading
+import time
+
+import src.data_models.item as sc_item
+import src.data_models.quantity as sc_quantity
+import src.data_models.user as sc_user
+import src.server.llm_scheduler as sc_llm_scheduler
+import src.server.prompt_layout as sc_prompt_layout
+import src.utils.search_cache as sc_search_cache
+import src.utils.types as sc_types
+
+
+logging.basicConfig(level=logging.INFO)
+# Each recipe stream is closed after its first part, which cancels the run.
+logging.getLogger("langchain_core.callbacks.manager").setLevel(logging.ERROR)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# Like OpenAI, prefixes are cached in blocks of 128 tokens from 1024 tokens on.
+CACHE_BLOCK_TOKENS = 128
+MIN_CACHED_TOKENS = 1024
+CHARS_PER_TOKEN = 4
+# Time to first token: a fixed overhead plus the prefill of the uncached tokens.
+BASE_LATENCY_SECONDS = 0.05
+PREFILL_SECONDS_PER_TOKEN = 0.0001
+
+RECIPE = json.dumps(
+    {
+        "name": "Rice and Beans",
+        "description": "Rice with black beans.",
+        "ingredients": [
+            {"name": "Brown Rice", "quantity": 0.5, "unit": "lb"},
+            {"name": "Black Beans", "quantity": 15, "unit": "oz"},
+        ],
+        "instructions": {"1": "Cook the rice.", "2": "Add the beans."},
+    }
+)
+
+
+class PromptCacheServer(http.server.ThreadingHTTPServer):
+    """
+    Stands in for an OpenAI endpoint with prompt caching.
+
+    Each request reuses the longest prefix it shares with earlier requests,
+    and its time to first token grows with the tokens that are not cached.
+    """
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _PromptCacheHandler)
+        self.lock = threading.Lock()
+        self.prefixes = set()
+        # (prompt tokens, cached tokens) of each request.
+        self.requests = []
+
+    def serve(self, prompt: str) -> tuple[int, int]:
+        """Returns the prompt tokens and cached tokens of a prompt."""
+        block_chars = CACHE_BLOCK_TOKENS * CHARS_PER_TOKEN
+        digests = [
+            hashlib.sha256(prompt[:end].encode()).hexdigest()
+            for end in range(block_chars, len(prompt) + 1, block_chars)
+        ]
+        with self.lock:
+            cached_blocks = 0
+            for digest in digests:
+                if digest not in self.prefixes:
+                    break
+                cached_blocks += 1
+            self.prefixes.update(digests)
+            tokens = math.ceil(len(prompt) / CHARS_PER_TOKEN)
+            cached = cached_blocks * CACHE_BLOCK_TOKENS
+            if cached < MIN_CACHED_TOKENS:
+                cached = 0
+            self.requests.append((tokens, cached))
+        return tokens, cached
+
+
+class _PromptCacheHandler(http.server.BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        # Tools are sent ahead of the messages, as providers place them.
+        prompt = json.dumps(body.get("tools", []), sort_keys=True) + "".join(
+            f"{message['role']}:{json.dumps(message['content'])}"
+            for message in body["messages"]
+        )
+        tokens, cached = self.server.serve(prompt)
+        time.sleep(BASE_LATENCY_SECONDS + (tokens - cached) * PREFILL_SECONDS_PER_TOKEN)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for start in range(0, len(RECIPE), 16):
+            self._send_chunk({"content": RECIPE[start : start + 16]}, None)
+        self._send_chunk({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_chunk(self, delta: dict, finish_reason: str | None):
+        chunk = {
+            "id": "chatcmpl-benchmark",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def _pantry(i: int) -> list[sc_item.Item]:
+    """Returns a pantry that differs from call to call."""
+    names = [("Brown Rice", 2, sc_types.Unit.POUNDS)]
+    names += [("Black Beans", 15, sc_types.Unit.OUNCES)]
+    names += [(f"Vegetable {i}-{j}", 1, sc_types.Unit.POUNDS) for j in range(5)]
+    return [
+        sc_item.Item(
+            name=name,
+            quantity=sc_quantity.Quantity(
+                quantity=quantity, unit=unit, type=sc_types.UNIT_TYPE_MAPPINGS[unit]
+            ),
+            shelf_life=datetime.timedelta(days=7),
+            storage=sc_types.StorageType.PANTRY,
+        )
+        for name, quantity, unit in names
+    ]
+
+
+def benchmark_layout(
+    layout: sc_prompt_layout.PromptLayout, calls: int = 20
+) -> dict[str, float]:
+    """Measure prompt caching of the recipe agent with a prompt layout.
+
+    Args:
+        layout (sc_prompt_layout.PromptLayout): The prompt layout to benchmark.
+        calls (int): Number of recipes created, each for a different pantry.
+            Defaults to 20.
+
+    Returns:
+        dict[str, float]: Cached share of the prompt tokens after the first call,
+            and the median time to the first streamed part of the recipe in
+            milliseconds, for the first call and the later calls.
+    """
+    import src.server.create_recipe as sc_create_recipe
+
+    server = PromptCacheServer()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ["OPENAI_API_BASE"] = f"http://127.0.0.1:{server.server_address[1]}/v1"
+    agent = sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+        prompt_layout=layout,
+    )
+    preferences = sc_user.UserPreferences(
+        dietary_restrictions=[],
+        favorite_cuisines=["Mexican"],
+        favorite_recipes=[],
+        kitchen_appliances=["Stove"],
+        number_of_people=2,
+    )
+
+    first_event_ms = []
+    for i in range(calls):
+        start = time.perf_counter()
+        for _ in agent.create_recipe_stream(_pantry(i), preferences):
+            first_event_ms.append((time.perf_counter() - start) * 1000)
+            break
+    server.shutdown()
+
+    later = server.requests[1:]
+    return {
+        "prompt_tokens": server.requests[0][0],
+        "cached_ratio": sum(c for _, c in later) / sum(t for t, _ in later),
+        "first_call_ms": first_event_ms[0],
+        "later_calls_p50_ms": statistics.median(first_event_ms[1:]),
+    }
+
+
+if __name__ == "__main__":
+    # The stand-in server does not check keys, so placeholder keys suffice.
+    for key in ["OPENAI_API_KEY", "GOOGLE_API_KEY", "GOOGLE_CSE_ID"]:
+        os.environ.setdefault(key, "benchmark")
+
+    for layout in sc_prompt_layout.PromptLayout:
+        results = benchmark_layout(layout)
+        logging.info(
+            f"{layout.name}: "
+            + ", ".join(f"{name}={value:.2f}" for name, value in results.items())
+        )
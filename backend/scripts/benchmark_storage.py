@@ -0,0 +1,249 @@
+"""Benchmarks the item stores.
+
+Runs against the Firestore emulator, or a local SQLite database with
+`--store sqlite`:
+
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 python -m scripts.benchmark_storage
+
+Each operation is measured at every pantry size and concurrency level, and
+reported as p50/p99 latency and documents per second. With `--save`, the
+results become the baseline of the store; later runs are compared with it and
+exit with an error if an operation got slower by more than `--tolerance`.
+"""
+
+import argparse
+import concurrent.futures
+import datetime
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import typing
+import uuid
+
+import src.data_models.item as sc_item
+import src.data_models.quantity as sc_quantity
+import src.server.item_storage as sc_item_storage
+import src.server.sqlite_store_items as sc_sqlite_store_items
+import src.server.store_items as sc_store_items
+import src.utils.types as sc_types
+
+
+logging.basicConfig(level=logging.INFO)
+
+PANTRY_SIZES = [10, 100, 1000]
+CONCURRENCY = [1, 8, 32]
+# Calls of each operation per worker.
+CALLS = 20
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+
+# Runs an operation once, given the pantry size and the index of the call, and
+# returns the number of documents read or written.
+Operation = typing.Callable[[sc_item_storage.ItemStorage, int, int], int]
+
+
+def _item(name: str, quantity: float = 1.0) -> sc_item.Item:
+    return sc_item.Item(
+        name=name,
+        quantity=sc_quantity.Quantity(quantity=quantity, unit=sc_types.Unit.POUNDS),
+        shelf_life=datetime.timedelta(days=7),
+        storage=sc_types.StorageType.PANTRY,
+    )
+
+
+def _pantry(size: int) -> list[sc_item.Item]:
+    return [_item(f"item {i:05}") for i in range(size)]
+
+
+def _add_items(store: sc_item_storage.ItemStorage, size: int, call: int) -> int:
+    store.add_items(_pantry(size))
+    return size
+
+
+def _get_items(store: sc_item_storage.ItemStorage, size: int, call: int) -> int:
+    return len(store.get_items())
+
+
+def _get_item(store: sc_item_storage.ItemStorage, size: int, call: int) -> int:
+    store.get_item(f"item {random.randrange(size):05}")
+    return 1
+
+
+def _update_item(store: sc_item_storage.ItemStorage, size: int, call: int) -> int:
+    store.update_item(_item(f"item {random.randrange(size):05}", random.random()))
+    return 1
+
+
+def _delete_item(store: sc_item_storage.ItemStorage, size: int, call: int) -> int:
+    # With more calls than items, the later calls rewrite tombstones.
+    store.delete_item(f"item {call % size:05}")
+    return 1
+
+
+# add_items writes the whole pantry; the other operations read or write the
+# pantry written before the measured calls.
+OPERATIONS: dict[str, Operation] = {
+    "add_items": _add_items,
+    "get_items": _get_items,
+    "get_item": _get_item,
+    "update_item": _update_item,
+    "delete_item": _delete_item,
+}
+
+
+def _percentile(durations: list[float], percent: int) -> float:
+    if len(durations) < 2:
+        return durations[0]
+    return statistics.quantiles(durations, n=100, method="inclusive")[percent - 1]
+
+
+def benchmark_operation(
+    make_store: typing.Callable[[], sc_item_storage.ItemStorage],
+    operation: Operation,
+    size: int,
+    concurrency: int,
+    calls: int = CALLS,
+) -> dict[str, float]:
+    """Measure an operation of a store.
+
+    Each worker uses the store of its own user, whose pantry holds `size` items
+    before the measured calls.
+
+    Args:
+        make_store (Callable[[], ItemStorage]): Creates the store of a new user.
+        operation (Operation): Runs the operation once.
+        size (int): The number of items in each pantry.
+        concurrency (int): The number of workers calling the operation.
+        calls (int): The number of calls of each worker. Defaults to 20.
+
+    Returns:
+        dict[str, float]: The p50 and p99 latency of the calls in milliseconds,
+            and the documents read or written per second by all the workers.
+    """
+    stores = [make_store() for _ in range(concurrency)]
+    if operation is not _add_items:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda store: store.add_items(_pantry(size)), stores))
+
+    def work(store: sc_item_storage.ItemStorage) -> tuple[list[float], int]:
+        durations, docs = [], 0
+        for call in range(calls):
+            start = time.perf_counter()
+            docs += operation(store, size, call)
+            durations.append((time.perf_counter() - start) * 1000)
+        return durations, docs
+
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(work, stores))
+    elapsed = time.perf_counter() - start
+    for store in stores:
+        store.close()
+
+    durations = [duration for worker, _ in results for duration in worker]
+    return {
+        "p50_ms": _percentile(durations, 50),
+        "p99_ms": _percentile(durations, 99),
+        "docs_per_s": sum(docs for _, docs in results) / elapsed,
+    }
+
+
+def compare(
+    results: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    tolerance: float,
+) -> list[str]:
+    """Compare benchmark results with a baseline.
+
+    p99 latencies are too noisy to compare, so only the p50 latency and the
+    throughput are.
+
+    Args:
+        results (dict[str, dict[str, float]]): The results of each benchmark.
+        baseline (dict[str, dict[str, float]]): The baseline results.
+        tolerance (float): The allowed relative slowdown, e.g. 0.25 for 25%.
+
+    Returns:
+        list[str]: A description of each regression.
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result["p50_ms"] > before["p50_ms"] * (1 + tolerance):
+            regressions.append(
+                f"{name}: p50 {before['p50_ms']:.2f}ms -> {result['p50_ms']:.2f}ms"
+            )
+        if result["docs_per_s"] < before["docs_per_s"] / (1 + tolerance):
+            regressions.append(
+                f"{name}: {before['docs_per_s']:.0f} -> "
+                f"{result['docs_per_s']:.0f} docs/s"
+            )
+    return regressions
+
+
+def _store_factory(
+    store: str, path: str
+) -> typing.Callable[[], sc_item_storage.ItemStorage]:
+    if store == "sqlite":
+        return lambda: sc_sqlite_store_items.SqliteItemStore(
+            user_id=f"user-{uuid.uuid4()}", path=path
+        )
+
+    if not os.environ.get("FIRESTORE_EMULATOR_HOST"):
+        sys.exit("Set FIRESTORE_EMULATOR_HOST to benchmark against the emulator.")
+    from google.cloud import firestore
+
+    db = firestore.Client(project="souchef-benchmark")
+    return lambda: sc_store_items.ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--store", choices=["firestore", "sqlite"], default="firestore")
+    parser.add_argument("--sizes", type=int, nargs="+", default=PANTRY_SIZES)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=CONCURRENCY)
+    parser.add_argument("--calls", type=int, default=CALLS)
+    parser.add_argument("--operations", nargs="+", choices=list(OPERATIONS))
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument(
+        "--save", action="store_true", help="Save the results as the baseline."
+    )
+    args = parser.parse_args()
+
+    baseline_path = os.path.join(BASELINE_DIR, f"storage_{args.store}.json")
+    with tempfile.TemporaryDirectory() as directory:
+        make_store = _store_factory(args.store, os.path.join(directory, "items.db"))
+        results = {}
+        for operation in args.operations or list(OPERATIONS):
+            for size in args.sizes:
+                for concurrency in args.concurrency:
+                    name = f"{operation}/size={size}/concurrency={concurrency}"
+                    results[name] = result = benchmark_operation(
+                        make_store, OPERATIONS[operation], size, concurrency, args.calls
+                    )
+                    logging.info(
+                        f"{name}: p50={result['p50_ms']:.2f}ms"
+                        f" p99={result['p99_ms']:.2f}ms"
+                        f" {result['docs_per_s']:.0f} docs/s"
+                    )
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(baseline_path, "w") as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        logging.info(f"Saved the baseline to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        with open(baseline_path) as file:
+            regressions = compare(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            logging.warning(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        logging.info(f"No regression from {baseline_path}")
@@ -104,6 +104,52 @@ class Item(pydantic.BaseModel):
         """
         self._nutritional_facts = value
 
+    def to_dict(self) -> dict[str, typing.Any]:
+        """
+        Converts the item to a dictionary of plain values, as stored in Firestore.
+
+        Returns:
+            dict[str, typing.Any]: The name, quantity, shelf life in days,
+                expiration date in ISO format, storage type name and nutritional
+                facts of the item.
+        """
+        return {
+            "name": self.name,
+            "quantity": self.quantity.model_dump(mode="json"),
+            "shelf_life_days": self.shelf_life.total_seconds() / 86400,
+            "expiration_date": self._expiration_date.isoformat(),
+            "storage": self.storage.name,
+            "nutritional_facts": self._nutritional_facts.model_dump(mode="json"),
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict[str, typing.Any]) -> "Item":
+        """
+        Creates an item from a dictionary created by `to_dict`.
+
+        Args:
+            data (dict[str, typing.Any]): The dictionary. Other keys are ignored.
+
+        Returns:
+            Item: The item.
+        """
+        item = cls(
+            name=data["name"],
+            quantity=sc_quantity.Quantity.model_validate(data["quantity"]),
+            shelf_life=datetime.timedelta(days=data["shelf_life_days"]),
+            storage=data["storage"],
+        )
+        # Dictionaries without an expiration date keep the one computed from now.
+        if "expiration_date" in data:
+            item._expiration_date = datetime.date.fromisoformat(data["expiration_date"])
+        if "nutritional_facts" in data:
+            item.nutritional_facts = (
+                sc_nutritional_facts.NutritionalFacts.model_validate(
+                    data["nutritional_facts"]
+                )
+            )
+        return item
+
     def get_shelf_life_remaining(self) -> int:
         """
         Calculates the remaining shelf life of the item.
@@ -47,6 +47,12 @@ class Quantity(pydantic.BaseModel):
             try:
                 return sc_types.Unit[cleaned_value.upper()]
             except KeyError:
+                pass
+
+            # Try enum value matching, as produced by model_dump
+            try:
+                return sc_types.Unit(cleaned_value)
+            except ValueError:
                 # If no match found, default to NONE
                 return sc_types.Unit.NONE
         return value
@@ -1,6 +1,7 @@
 import uuid
 import logging
 import pydantic
+import re
 
 import src.data_models.item as sc_item
 import src.data_models.quantity as sc_quantity
@@ -8,6 +9,42 @@ import src.data_models.nutritional_facts as sc_nutritional_facts
 import src.utils.types as sc_types
 
 
+# Ingredients every kitchen is assumed to have. Recipes may use them even if
+# they are not among the items.
+PANTRY_STAPLES = frozenset(
+    {
+        "salt",
+        "kosher salt",
+        "sea salt",
+        "table salt",
+        "pepper",
+        "black pepper",
+        "ground black pepper",
+        "salt and pepper",
+        "water",
+        "oil",
+        "cooking oil",
+        "olive oil",
+        "vegetable oil",
+        "canola oil",
+        "cooking spray",
+    }
+)
+
+
+def is_staple(name: str) -> bool:
+    """
+    Returns whether an ingredient is a pantry staple, ignoring case and punctuation.
+
+    Args:
+        name (str): The name of the ingredient.
+
+    Returns:
+        bool: True if the ingredient is in PANTRY_STAPLES.
+    """
+    return " ".join(re.findall(r"[a-z]+", name.lower())) in PANTRY_STAPLES
+
+
 class RecipeIngredient(pydantic.BaseModel):
     """
     Class representing an ingredient in a recipe with its quantity.
@@ -25,14 +62,15 @@ class Recipe(pydantic.BaseModel):
     Attributes:
         name (str): Name of the recipe.
         description (str): Description of the recipe.
-        instructions (dict[int, str]): Step-by-step instructions for the recipe.
         ingredients (list[RecipeIngredient]): Ingredients and their quantities.
+        instructions (dict[int, str]): Step-by-step instructions for the recipe.
     """
 
     name: str
     description: str
-    instructions: dict[int, str]
+    # Ingredients come before instructions so that streamed output lists them first.
     ingredients: list[RecipeIngredient]
+    instructions: dict[int, str]
     nutritional_facts: sc_nutritional_facts.NutritionalFacts = pydantic.Field(
         default_factory=sc_nutritional_facts.NutritionalFacts
     )
@@ -60,6 +98,8 @@ class Recipe(pydantic.BaseModel):
         """
         Check if the recipe is feasible based on available ingredient quantities.
 
+        Pantry staples that are not among the items are assumed to be available.
+
         Args:
             existing_items (list[sc_item.Item]): List of available items to check against
 
@@ -70,6 +110,8 @@ class Recipe(pydantic.BaseModel):
 
         for recipe_ingredient in self.ingredients:
             if recipe_ingredient.name not in item_lookup:
+                if is_staple(recipe_ingredient.name):
+                    continue
                 logging.warning(f"Missing ingredient: {recipe_ingredient.name}")
                 return False
 
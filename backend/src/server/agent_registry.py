@@ -0,0 +1,148 @@
+import concurrent.futures
+import enum
+import logging
+import threading
+import typing
+
+
+T = typing.TypeVar("T")
+
+# Registry shared by all request handlers unless they are given their own.
+_default_registry: "AgentRegistry | None" = None
+_default_registry_lock = threading.Lock()
+
+
+def _freeze(value: typing.Any) -> typing.Hashable:
+    """
+    Returns a hashable key for a config value.
+
+    Plain data, including lists and dicts, is compared by value. Other objects,
+    such as caches or user preferences, are compared by identity: a custom
+    `__repr__` or `__eq__` could make distinct objects equal.
+    """
+    if value is None or isinstance(value, (bool, int, float, str, bytes, enum.Enum)):
+        return (type(value), value)
+    if isinstance(value, (list, tuple)):
+        return (type(value), tuple(_freeze(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return (type(value), frozenset(_freeze(item) for item in value))
+    if isinstance(value, dict):
+        return (
+            dict,
+            frozenset((_freeze(k), _freeze(v)) for k, v in value.items()),
+        )
+    return (object, id(value))
+
+
+class AgentRegistry:
+    """
+    Builds each agent configuration once and shares it across requests.
+
+    Building an agent creates its language model client, search tool, prompt and
+    executor, which takes hundreds of milliseconds. Agents hold no per-request
+    state, so one instance per configuration can serve every request. The
+    registry is safe to use from multiple threads; concurrent requests for a
+    configuration that is still being built wait for that build instead of
+    starting their own.
+    """
+
+    def __init__(self):
+        """
+        Initializes the AgentRegistry.
+        """
+        self._lock = threading.Lock()
+        # The build of each configuration, with the config it was built from.
+        # Keeping the config alive means the ids in the key are not reused.
+        self._agents: dict[
+            tuple, tuple[concurrent.futures.Future, dict[str, typing.Any]]
+        ] = {}
+
+    @staticmethod
+    def _key(agent_class: type, config: dict[str, typing.Any]) -> tuple:
+        return (
+            agent_class,
+            tuple(sorted((name, _freeze(value)) for name, value in config.items())),
+        )
+
+    def get(self, agent_class: type[T], **config: typing.Any) -> T:
+        """
+        Returns the agent for a configuration, building it on first use.
+
+        Args:
+            agent_class (type[T]): The agent class, such as CreateRecipeAgent.
+            **config: Keyword arguments for the agent's constructor.
+
+        Returns:
+            T: The shared agent.
+
+        Raises:
+            Exception: Any error raised while building the agent. A failed build
+                is not cached, so the next call tries again.
+        """
+        key = self._key(agent_class, config)
+        with self._lock:
+            entry = self._agents.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._agents[key] = (concurrent.futures.Future(), config)
+        future = entry[0]
+
+        if owner:
+            try:
+                future.set_result(agent_class(**config))
+            except BaseException as e:
+                try:
+                    # `clear` may have dropped the build, or another build
+                    # may have replaced it since.
+                    with self._lock:
+                        if self._agents.get(key) is entry:
+                            del self._agents[key]
+                finally:
+                    future.set_exception(e)
+        return future.result()
+
+    def warm_up(
+        self, configs: list[tuple[type, dict[str, typing.Any]]]
+    ) -> threading.Thread:
+        """
+        Builds agents in a background thread, for example at process start.
+
+        Args:
+            configs (list[tuple[type, dict[str, Any]]]): Pairs of agent class and
+                constructor keyword arguments.
+
+        Returns:
+            threading.Thread: The thread building the agents.
+        """
+
+        def build_all():
+            for agent_class, config in configs:
+                try:
+                    self.get(agent_class, **config)
+                except Exception as e:
+                    logging.warning(f"Failed to warm up {agent_class.__name__}: {e}")
+
+        thread = threading.Thread(target=build_all, name="agent-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def clear(self):
+        """
+        Drops all shared agents, so that they are rebuilt on next use.
+        """
+        with self._lock:
+            self._agents.clear()
+
+
+def get_default_registry() -> AgentRegistry:
+    """
+    Returns the agent registry shared by the whole process.
+
+    Returns:
+        AgentRegistry: The shared registry.
+    """
+    global _default_registry
+    with _default_registry_lock:
+        if _default_registry is None:
+            _default_registry = AgentRegistry()
+        return _default_registry
@@ -0,0 +1,90 @@
+import queue
+import threading
+import typing
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+import src.server.invocation as sc_invocation
+
+
+class CancellationCallbackHandler(BaseCallbackHandler):
+    """
+    Aborts the runs it is attached to once cancelled, or once the invocation
+    they run in passes its deadline (see `sc_invocation.deadline`).
+
+    The run is stopped at its next model call, streamed token or tool call, so
+    work that nobody is waiting for any more does not keep using the model.
+    """
+
+    # Errors raised by the handler must stop the run instead of being logged.
+    raise_error = True
+
+    def __init__(self):
+        """
+        Initializes the CancellationCallbackHandler.
+        """
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self) -> bool:
+        """
+        Returns whether the handler was cancelled.
+
+        Returns:
+            bool: True once `cancel` has been called.
+        """
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """
+        Stops the runs on their next callback.
+        """
+        self._cancelled.set()
+
+    def _check_cancelled(self):
+        if self._cancelled.is_set():
+            raise RuntimeError("The run was cancelled.")
+        sc_invocation.check_deadline()
+
+    def on_chat_model_start(
+        self, serialized: dict[str, typing.Any], messages: list, **kwargs: typing.Any
+    ):
+        self._check_cancelled()
+
+    def on_llm_new_token(self, token: str, **kwargs: typing.Any):
+        self._check_cancelled()
+
+    def on_tool_start(
+        self, serialized: dict[str, typing.Any], input_str: str, **kwargs: typing.Any
+    ):
+        self._check_cancelled()
+
+
+class TokenQueueCallbackHandler(CancellationCallbackHandler):
+    """
+    Forwards the tokens of streamed model replies to a queue.
+
+    Each reply is announced with a ("start", None) entry, followed by a
+    ("token", text) entry per token. Cancelling the handler aborts the run on the
+    next callback, which lets a consumer stop generation early.
+    """
+
+    def __init__(self, tokens: queue.Queue):
+        """
+        Initializes the TokenQueueCallbackHandler.
+
+        Args:
+            tokens (queue.Queue): The queue the tokens are put on.
+        """
+        super().__init__()
+        self._tokens = tokens
+
+    def on_chat_model_start(
+        self, serialized: dict[str, typing.Any], messages: list, **kwargs: typing.Any
+    ):
+        self._check_cancelled()
+        self._tokens.put(("start", None))
+
+    def on_llm_new_token(self, token: str, **kwargs: typing.Any):
+        self._check_cancelled()
+        self._tokens.put(("token", token))
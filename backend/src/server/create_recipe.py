@@ -1,23 +1,52 @@
-import json
-from langchain.agents import create_openai_tools_agent, AgentExecutor
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
-from langchain_community.tools import Tool
-from langchain_google_community import GoogleSearchAPIWrapper
-from langchain.output_parsers import PydanticOutputParser
-
 import src.data_models.recipe as sc_recipe
 import src.data_models.item as sc_item
 import src.data_models.quantity as sc_quantity
 import src.data_models.user as sc_user
 import src.utils.types as sc_types
+import src.server.ingredient_ranking as sc_ingredient_ranking
+import src.server.invocation as sc_invocation
+import src.server.llm_scheduler as sc_llm_scheduler
+import src.server.model_cascade as sc_model_cascade
+import src.server.prompt_layout as sc_prompt_layout
+import src.server.recipe_cache as sc_recipe_cache
+import src.server.recipe_repair as sc_recipe_repair
+import src.server.recipe_stream as sc_recipe_stream
+import src.utils.json_output as sc_json_output
+import src.utils.search_cache as sc_search_cache
 
+import concurrent.futures
+import contextvars
 import datetime
 import dotenv
+import json
+import logging
 import pprint
+import queue
+import threading
+import time
+import typing
+
+# LangChain takes seconds to import, so it is only loaded once an agent is created.
+if typing.TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_openai import ChatOpenAI
+
+    # Loads NumPy, which only agents with a corpus need.
+    import src.server.recipe_corpus as sc_recipe_corpus
 
 dotenv.load_dotenv()
 
+# Steer the candidates of `create_recipes` that no favorite cuisine sets apart.
+_CANDIDATE_HINTS = [
+    "a one-bowl meal",
+    "a soup or stew",
+    "a baked or roasted dish",
+    "a stir-fry or skillet dish",
+    "a salad",
+    "a wrap or sandwich",
+]
+
 
 class CreateRecipeAgent:
     """
@@ -30,13 +59,36 @@ class CreateRecipeAgent:
         _llm: The language model used for processing.
         _create_recipe_prompt: The prompt template for recipe creation.
         _tools: A list of tools available to the agent.
-        _create_recipe_agent: The agent responsible for recipe creation.
         _create_recipe_agent_executor: The executor for the recipe agent.
         _schema_parser: Parser for the recipe schema.
+        _search_cache: Cache for the results of the google_search tool.
+        _cascade: Cascade of executors tried cheapest first, if enabled.
+        _structured_output: Whether the model is constrained to the recipe schema.
+        _recipe_cache: Cache of generated recipes, if enabled.
+        _recipe_corpus: Corpus of known recipes searched before generating, if enabled.
+        _repair_attempts: The number of patches asked of the model per recipe.
+        _timeout: The deadline of a recipe in seconds, if any.
+        _invoker: Runs agent invocations with the deadline and hedging.
     """
 
     def __init__(
-        self, model: str = "gpt-4o", temperature: float = 0.5, verbose: bool = False
+        self,
+        model: str = "gpt-4o",
+        temperature: float = 0.5,
+        verbose: bool = False,
+        search_cache: sc_search_cache.SearchCache | None = None,
+        scheduler: sc_llm_scheduler.LLMScheduler | None = None,
+        priority: sc_llm_scheduler.Priority = sc_llm_scheduler.Priority.INTERACTIVE,
+        cascade_tiers: list[str] | None = None,
+        structured_output: bool = False,
+        recipe_cache: sc_recipe_cache.RecipeCache | None = None,
+        recipe_corpus: "sc_recipe_corpus.RecipeCorpus | None" = None,
+        max_ingredients: int = 30,
+        ingredient_token_budget: int = 1500,
+        repair_attempts: int = 1,
+        prompt_layout: sc_prompt_layout.PromptLayout = sc_prompt_layout.PromptLayout.SPLIT,
+        timeout: float | None = None,
+        hedge_quantile: float | None = None,
     ):
         """
         Initializes the CreateRecipeAgent.
@@ -45,127 +97,700 @@ class CreateRecipeAgent:
             model (str): The name of the language model to use.
             temperature (float): The temperature setting for the language model.
             verbose (bool): Whether to enable verbose output.
+            search_cache (sc_search_cache.SearchCache | None): Cache for search results.
+                Defaults to the cache shared by all agents in the process.
+            scheduler (sc_llm_scheduler.LLMScheduler | None): Scheduler that rate
+                limits model requests. Defaults to the scheduler shared by all agents
+                in the process.
+            priority (sc_llm_scheduler.Priority): The scheduling priority of this
+                agent's requests. Defaults to INTERACTIVE.
+            cascade_tiers (list[str] | None): Models to try in order, cheapest first.
+                A recipe is only re-generated on the next model if it cannot be
+                parsed or fails schema validation; feasibility problems are
+                repaired as without a cascade. The last tier replaces `model` for
+                streaming and repairs. Defaults to no cascade, which uses `model`
+                alone. See `sc_model_cascade.DEFAULT_CASCADE_TIERS`.
+            structured_output (bool): Whether to constrain the model to the recipe
+                JSON schema through the provider's structured output support,
+                instead of sending format instructions in the prompt.
+            recipe_cache (sc_recipe_cache.RecipeCache | None): Cache of generated
+                recipes. If given, a feasible recipe cached for the same or a
+                near-identical pantry and the same preferences is returned without
+                calling the model. Defaults to no cache.
+            recipe_corpus (sc_recipe_corpus.RecipeCorpus | None): Corpus of known
+                recipes. If given, it is searched before the model is called, and a
+                similar recipe that is feasible with the items is returned. Generated
+                recipes are added to it, and only found again for the same user and
+                dietary restrictions. Defaults to no corpus.
+            max_ingredients (int): The maximum number of items put in the prompt.
+                Items are ranked by expiry, fit with the preferences and pairing
+                with the rest of the pantry. Defaults to 30.
+            ingredient_token_budget (int): The maximum number of tokens of the
+                ingredient table in the prompt. Defaults to 1500.
+            repair_attempts (int): The number of times the model is asked to patch
+                the ingredients of a recipe whose problems cannot be repaired
+                locally. Defaults to 1.
+            prompt_layout (sc_prompt_layout.PromptLayout): The layout of the prompt.
+                CACHED keeps a byte-stable, versioned prefix that providers can
+                serve from their prompt cache. Defaults to SPLIT.
+            timeout (float | None): The time in seconds a recipe may take to
+                generate and repair. Model calls and tool calls stop once it
+                passes. Defaults to no deadline.
+            hedge_quantile (float | None): If given, a duplicate request is sent
+                when a request takes longer than this quantile of past latencies,
+                such as 0.95, and the first valid recipe is used. Defaults to no
+                hedging.
         """
-        self._llm = ChatOpenAI(model=model, temperature=temperature)
+        from langchain.output_parsers import PydanticOutputParser
+        from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+        from langchain_openai import ChatOpenAI
+
+        if scheduler is None:
+            scheduler = sc_llm_scheduler.get_default_scheduler()
+        self._structured_output = structured_output
         self._schema_parser = PydanticOutputParser(pydantic_object=sc_recipe.Recipe)
-        self._create_recipe_prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    "You are a creative chef who creates recipes based on available ingredients.",
-                ),
-                (
-                    "system",
-                    "Given a list of ingredients with their quantities and nutritional information, "
-                    "create a recipe that uses these ingredients in reasonable proportions.",
-                ),
-                (
-                    "system",
-                    "Make sure the recipe instructions are clear and numbered steps.",
-                ),
-                (
-                    "system",
-                    "The recipe should use realistic quantities that make sense for a meal.",
-                ),
-                (
-                    "system",
-                    "If you need additional common ingredients (salt, pepper, etc.), you can include them and include the quantity in the recipe.",
-                ),
-                (
-                    "system",
-                    "The recipe should also take into account the preferences of the user.",
-                ),
-                (
-                    "system",
-                    "The recipe should also include the nutritional facts of the recipe. Use the nutritional facts of the ingredients and the proportions used in the recipe to determine the nutritional value of the recipe.",
-                ),
-                (
-                    "system",
-                    "{format_instructions}",
-                ),
-                (
-                    "human",
-                    "Please recommend a recipe using the following available ingredients: {ingredients}. Here are my preferences: {user_preferences}. Please also include the nutritional facts of the recipe.",
-                ),
-                MessagesPlaceholder(variable_name="agent_scratchpad"),
-            ]
+        self._format_instructions = self._schema_parser.get_format_instructions()
+        instructions = [
+            "You are a creative chef who creates recipes based on available ingredients.",
+            "Given a list of ingredients with their quantities and nutritional information, "
+            "create a recipe that uses these ingredients in reasonable proportions.",
+            "Make sure the recipe instructions are clear and numbered steps.",
+            "The recipe should use realistic quantities that make sense for a meal.",
+            "If you need pantry staples (salt, pepper, oil or water), you can include them and include the quantity in the recipe. Any other ingredient must be one of the available items.",
+            "The recipe should also take into account the preferences of the user.",
+            "The recipe should also include the nutritional facts of the recipe. Use the nutritional facts of the ingredients and the proportions used in the recipe to determine the nutritional value of the recipe.",
+        ]
+        # The response format already carries the schema.
+        format_instructions = None if structured_output else self._format_instructions
+        if prompt_layout == sc_prompt_layout.PromptLayout.CACHED:
+            # Preferences change less often than the pantry, so they come first.
+            human = "Here are my preferences: {user_preferences}.\nPlease recommend a recipe using the following available ingredients, with nutrition per serving:\n{ingredients}\nPlease also include the nutritional facts of the recipe.{variation}"
+        else:
+            human = "Please recommend a recipe using the following available ingredients, with nutrition per serving:\n{ingredients}\nHere are my preferences: {user_preferences}. Please also include the nutritional facts of the recipe.{variation}"
+        messages = sc_prompt_layout.prompt_messages(
+            "create_recipe", instructions, human, prompt_layout, format_instructions
         )
+        messages.append(MessagesPlaceholder(variable_name="agent_scratchpad"))
+        self._create_recipe_prompt = ChatPromptTemplate.from_messages(messages)
+
+        llm_kwargs = scheduler.chat_model_kwargs(priority)
+        if structured_output:
+            llm_kwargs["model_kwargs"] = {
+                "response_format": sc_json_output.response_format(sc_recipe.Recipe)
+            }
+        if prompt_layout == sc_prompt_layout.PromptLayout.CACHED:
+            static_text = sc_prompt_layout.static_prompt(
+                "create_recipe", instructions, format_instructions
+            )
+            llm_kwargs["extra_body"] = {
+                "prompt_cache_key": sc_prompt_layout.prompt_key(
+                    "create_recipe", static_text
+                )
+            }
+        if cascade_tiers:
+            model = cascade_tiers[-1]
+        self._llm = ChatOpenAI(model=model, temperature=temperature, **llm_kwargs)
+        if search_cache is None:
+            search_cache = sc_search_cache.get_default_cache()
+        self._search_cache = search_cache
+        self._recipe_cache = recipe_cache
+        self._recipe_corpus = recipe_corpus
+        self._model = model
+        self._max_ingredients = max_ingredients
+        self._ingredient_token_budget = ingredient_token_budget
+        self._repair_attempts = repair_attempts
+        self._timeout = timeout
+        self._invoker = sc_invocation.AgentInvoker(timeout, hedge_quantile)
         self._tools = []
         self._setup_tools()
-        self._create_recipe_agent = create_openai_tools_agent(
-            self._llm, self._tools, prompt=self._create_recipe_prompt
+        self._verbose = verbose
+        self._create_recipe_agent_executor = self._create_agent_executor(self._llm)
+        self._cascade = None
+        if cascade_tiers is not None:
+            # The executor of the last tier is the one built above.
+            self._cascade = sc_model_cascade.agent_cascade(
+                cascade_tiers,
+                lambda tier_model: (
+                    self._create_recipe_agent_executor
+                    if tier_model == model
+                    else self._create_agent_executor(
+                        ChatOpenAI(
+                            model=tier_model, temperature=temperature, **llm_kwargs
+                        )
+                    )
+                ),
+            )
+
+    def _create_agent_executor(self, llm: "ChatOpenAI") -> "AgentExecutor":
+        """
+        Creates an executor for a recipe agent backed by the given model.
+
+        Args:
+            llm (ChatOpenAI): The language model used by the agent.
+
+        Returns:
+            AgentExecutor: The executor for the agent.
+        """
+        from langchain.agents import AgentExecutor, create_openai_tools_agent
+
+        # OpenAI only accepts tools alongside a response format if they are strict.
+        agent = create_openai_tools_agent(
+            llm,
+            self._tools,
+            prompt=self._create_recipe_prompt,
+            strict=True if self._structured_output else None,
         )
-        self._create_recipe_agent_executor = AgentExecutor(
-            agent=self._create_recipe_agent, tools=self._tools, verbose=verbose
+        return AgentExecutor(
+            agent=agent,
+            tools=self._tools,
+            verbose=self._verbose,
+            max_execution_time=self._timeout,
         )
 
     def _setup_tools(self):
         """
         Sets up the tools used by the agent.
         """
+        from langchain_community.tools import Tool
+        from langchain_google_community import GoogleSearchAPIWrapper
+
         google_search_api = GoogleSearchAPIWrapper()
         self._tools.append(
             Tool(
                 name="google_search",
                 description="Search for recipe ideas and cooking techniques.",
-                func=google_search_api.run,
+                func=sc_invocation.guard(
+                    self._search_cache.wrap(google_search_api.run)
+                ),
             )
         )
 
     def create_recipe(
-        self, items: list[sc_item.Item], user_preferences: sc_user.UserPreferences
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        user_id: str | None = None,
     ) -> sc_recipe.Recipe:
         """
         Creates a recipe from a list of available items.
 
+        The generated recipe is verified against the items and repaired locally
+        where possible, see `sc_recipe_repair.verify_recipe`. Remaining problems
+        are sent back to the model for a patch of the ingredients only.
+
         Args:
             items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            user_id (str | None): The user, whose recipes the recipe corpus is
+                searched for. Defaults to no user.
 
         Returns:
             sc_recipe.Recipe: A generated recipe using the available ingredients.
 
         Raises:
-            ValueError: If the output cannot be parsed into a valid recipe.
+            ValueError: If the output cannot be parsed into a valid recipe, or the
+                recipe is still not feasible after the repair attempts.
+            sc_invocation.DeadlineExceeded: If the recipe took longer than `timeout`.
+        """
+        recipe = self._find_known_recipe(items, user_preferences, user_id)
+        if recipe is not None:
+            return recipe
+
+        import src.server.callbacks as sc_callbacks
+
+        inputs = self._recipe_inputs(items, user_preferences)
+
+        def run() -> str:
+            return self._create_recipe_agent_executor.invoke(
+                inputs,
+                config={"callbacks": [sc_callbacks.CancellationCallbackHandler()]},
+            )["output"]
+
+        # Repairs share the deadline of the generation.
+        with sc_invocation.deadline(self._timeout):
+            if self._cascade is not None:
+                recipe = self._cascade.run(inputs, self._parse_recipe)
+            else:
+                recipe = self._invoker.invoke(run, self._parse_recipe)
+            recipe = self._repair_recipe(recipe, items, inputs["ingredients"])
+
+        self._remember_recipe(items, user_preferences, recipe, user_id)
+        return recipe
+
+    def _find_known_recipe(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        user_id: str | None = None,
+    ) -> sc_recipe.Recipe | None:
+        """
+        Looks up a recipe in the recipe cache, then in the recipe corpus.
+
+        Args:
+            items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            user_id (str | None): The user. Defaults to no user.
+
+        Returns:
+            sc_recipe.Recipe | None: A feasible known recipe, or None.
         """
-        # Format ingredients for the prompt
-        ingredients_info = []
-        for item in items:
-            ingredient_info = (
-                f"{item.name}: {item.quantity.quantity} {item.quantity.unit.value}, "
-                f"(per serving: {item.per_serving_macros[sc_types.Macro.CALORIES].quantity} calories, "
-                f"{item.per_serving_macros[sc_types.Macro.PROTEIN].quantity}g protein, "
-                f"{item.per_serving_macros[sc_types.Macro.CARB].quantity}g carbs, "
-                f"{item.per_serving_macros[sc_types.Macro.FAT].quantity}g fat)"
+        if self._recipe_cache is not None:
+            recipe = self._recipe_cache.get(items, user_preferences)
+            if recipe is not None:
+                return recipe
+        if self._recipe_corpus is not None:
+            recipe = self._recipe_corpus.find(items, user_preferences, user_id=user_id)
+            if recipe is not None:
+                if self._recipe_cache is not None:
+                    self._recipe_cache.set(items, user_preferences, recipe)
+                return recipe
+        return None
+
+    def _remember_recipe(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        recipe: sc_recipe.Recipe,
+        user_id: str | None = None,
+    ):
+        """
+        Adds a generated recipe to the recipe cache and the recipe corpus.
+
+        Args:
+            items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            recipe (sc_recipe.Recipe): The generated recipe.
+            user_id (str | None): The user. Defaults to no user.
+        """
+        if self._recipe_cache is not None:
+            self._recipe_cache.set(items, user_preferences, recipe)
+        if self._recipe_corpus is not None:
+            self._recipe_corpus.add([recipe], user_id, user_preferences)
+
+    def _recipe_inputs(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        hint: str | None = None,
+    ) -> dict[str, str]:
+        """
+        Builds the prompt inputs of the recipe agent.
+
+        Args:
+            items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            hint (str | None): Optional kind of dish to ask for, such as "a salad".
+
+        Returns:
+            dict[str, str]: The prompt inputs.
+        """
+        ingredients = sc_ingredient_ranking.compact_ingredients(
+            items,
+            user_preferences,
+            count_tokens=sc_ingredient_ranking.token_counter(self._model),
+            max_items=self._max_ingredients,
+            token_budget=self._ingredient_token_budget,
+        )
+        inputs = {
+            "ingredients": ingredients,
+            "user_preferences": user_preferences.model_dump_json(),
+            "variation": "" if hint is None else f" For variety, make it {hint}.",
+        }
+        if not self._structured_output:
+            inputs["format_instructions"] = self._format_instructions
+        return inputs
+
+    def create_recipe_stream(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        user_id: str | None = None,
+    ) -> typing.Iterator[sc_recipe_stream.RecipeStreamEvent]:
+        """
+        Creates a recipe from a list of available items, yielding it in stages.
+
+        The name and description are yielded first, then each ingredient and each
+        numbered instruction as soon as the model has generated it. Each part is
+        validated as it completes, and the final recipe is parsed and validated in
+        full, then verified and repaired as in `create_recipe`. If the repair
+        changed the recipe, the stream ends with a REPLACED event instead of a
+        RECIPE event. Streaming uses the base model, without the cascade. Closing
+        the iterator stops generation, and so does the `timeout` of the agent. A
+        known recipe from the recipe cache or corpus is yielded at once.
+
+        Args:
+            items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            user_id (str | None): The user, whose recipes the recipe corpus is
+                searched for. Defaults to no user.
+
+        Yields:
+            sc_recipe_stream.RecipeStreamEvent: The completed parts of the recipe,
+                ending with a RECIPE or REPLACED event that carries the whole
+                recipe.
+
+        Raises:
+            ValueError: If a part or the final output is not a valid recipe, or
+                the recipe is still not feasible after the repair attempts.
+            sc_invocation.DeadlineExceeded: If generation and repair took longer
+                than `timeout`.
+        """
+        import src.server.callbacks as sc_callbacks
+
+        recipe = self._find_known_recipe(items, user_preferences, user_id)
+        if recipe is not None:
+            yield from sc_recipe_stream.RecipeStreamParser().finish(recipe)
+            return
+
+        inputs = self._recipe_inputs(items, user_preferences)
+        tokens = queue.Queue()
+        handler = sc_callbacks.TokenQueueCallbackHandler(tokens)
+        result = {}
+        deadline_at = None
+        if self._timeout is not None:
+            deadline_at = time.monotonic() + self._timeout
+
+        def run():
+            try:
+                # The handler stops the run once it passes the deadline.
+                with sc_invocation.deadline(self._timeout):
+                    result["output"] = self._create_recipe_agent_executor.invoke(
+                        inputs, config={"callbacks": [handler]}
+                    )["output"]
+            except Exception as e:
+                result["error"] = e
+            finally:
+                tokens.put(("end", None))
+
+        thread = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(run,),
+            name="recipe-stream",
+            daemon=True,
+        )
+        thread.start()
+        parser = sc_recipe_stream.RecipeStreamParser()
+        try:
+            while True:
+                # The model may stall without calling the handler.
+                timeout = None
+                if deadline_at is not None:
+                    timeout = max(deadline_at - time.monotonic(), 0)
+                try:
+                    kind, token = tokens.get(timeout=timeout)
+                except queue.Empty:
+                    raise sc_invocation.DeadlineExceeded(
+                        "The recipe stream passed its deadline."
+                    )
+                if kind == "end":
+                    break
+                if kind == "start":
+                    # The agent made a new model call, e.g. after a tool call.
+                    parser.reset()
+                else:
+                    yield from parser.feed(token)
+        finally:
+            handler.cancel()
+
+        if "error" in result:
+            raise result["error"]
+        recipe = self._parse_recipe(result["output"])
+        remaining = None
+        if deadline_at is not None:
+            remaining = deadline_at - time.monotonic()
+        with sc_invocation.deadline(remaining):
+            repaired = self._repair_recipe(recipe, items, inputs["ingredients"])
+        self._remember_recipe(items, user_preferences, repaired, user_id)
+        yield from parser.finish(recipe, repaired)
+
+    def create_recipes(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        n: int = 3,
+        k: int | None = None,
+        max_similarity: float = 0.7,
+    ) -> list[sc_recipe.Recipe]:
+        """
+        Creates several different recipes from a list of available items.
+
+        `n` candidates are generated concurrently. If the user has favorite
+        cuisines, each candidate is steered towards one of them; the candidates
+        left over are each asked for a different kind of dish. Candidates that
+        are invalid, not feasible with the items, or too similar to a recipe
+        already kept are dropped. Once `k` recipes are kept, the remaining
+        candidates are cancelled.
+
+        Args:
+            items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            n (int): The number of candidates to generate. Defaults to 3.
+            k (int | None): The number of recipes to return. Defaults to `n`.
+            max_similarity (float): Candidates whose ingredient names have a higher
+                Jaccard similarity with a kept recipe are dropped. Defaults to 0.7.
+
+        Returns:
+            list[sc_recipe.Recipe]: Up to `k` recipes, in the order they completed.
+
+        Raises:
+            ValueError: If `k` is not between 1 and `n`, or if no candidate is a
+                valid, feasible recipe.
+        """
+        import src.server.callbacks as sc_callbacks
+
+        k = n if k is None else k
+        if not 1 <= k <= n:
+            raise ValueError(f"Expected 1 <= k <= n, got k={k} and n={n}")
+        cuisines = user_preferences.favorite_cuisines
+        candidates = [
+            (
+                user_preferences.model_copy(
+                    update={"favorite_cuisines": [cuisines[i]]}
+                ),
+                None,
             )
-            ingredients_info.append(ingredient_info)
+            if i < len(cuisines)
+            else (user_preferences, _CANDIDATE_HINTS[i % len(_CANDIDATE_HINTS)])
+            for i in range(n)
+        ]
+
+        handler = sc_callbacks.CancellationCallbackHandler()
+        pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=n, thread_name_prefix="recipe-candidate"
+        )
+        futures = [
+            pool.submit(self._create_candidate, items, preferences, hint, handler)
+            for preferences, hint in candidates
+        ]
+        recipes = []
+        ingredient_sets = []
+        errors = []
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    recipe = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    logging.warning(f"Dropped recipe candidate: {e}")
+                    continue
+
+                ingredient_set = frozenset(
+                    " ".join(ingredient.name.lower().split())
+                    for ingredient in recipe.ingredients
+                )
+                if any(
+                    sc_recipe_cache.RecipeCache.similarity(ingredient_set, other)
+                    > max_similarity
+                    for other in ingredient_sets
+                ):
+                    logging.info(f"Dropped near-duplicate recipe {recipe.name}.")
+                    continue
+
+                recipes.append(recipe)
+                ingredient_sets.append(ingredient_set)
+                if len(recipes) == k:
+                    break
+        finally:
+            # Candidates still running stop at their next model or tool call.
+            handler.cancel()
+            pool.shutdown(wait=False, cancel_futures=True)
+
+        if not recipes:
+            raise ValueError(f"No valid recipe among {n} candidates: {errors}")
+        return recipes
+
+    def _create_candidate(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        hint: str | None,
+        handler: "BaseCallbackHandler",
+    ) -> sc_recipe.Recipe:
+        """
+        Generates one recipe candidate for `create_recipes`.
+
+        Args:
+            items (list[sc_item.Item]): List of available ingredients.
+            user_preferences (sc_user.UserPreferences): The preferences to steer
+                the candidate with.
+            hint (str | None): The kind of dish to ask for, if any.
+            handler (BaseCallbackHandler): Callback handler that cancels the run.
+
+        Returns:
+            sc_recipe.Recipe: The recipe, feasible with the items.
 
+        Raises:
+            ValueError: If the output is not a valid, feasible recipe.
+        """
+        inputs = self._recipe_inputs(items, user_preferences, hint)
+        if self._cascade is not None:
+            recipe = self._cascade.run(inputs, self._parse_recipe, callbacks=[handler])
+            return self._repair_recipe(recipe, items, attempts=0)
         output = self._create_recipe_agent_executor.invoke(
-            {
-                "ingredients": "\n".join(ingredients_info),
-                "format_instructions": self._schema_parser.get_format_instructions(),
-                "user_preferences": user_preferences.model_dump_json(),
-            }
+            inputs, config={"callbacks": [handler]}
         )
+        return self._parse_recipe(output["output"], items)
 
-        # Clean up the output text
-        output_text = output["output"]
+    def _parse_recipe(
+        self, output_text: str, items: list[sc_item.Item] | None = None
+    ) -> sc_recipe.Recipe:
+        """
+        Parses the agent output into a recipe.
 
-        # Find the JSON content between triple backticks
-        if "```json" in output_text:
-            start = output_text.find("```json") + 7
-            end = output_text.rfind("```")
-            output_text = output_text[start:end].strip()
+        Args:
+            output_text (str): The output of the recipe agent.
+            items (list[sc_item.Item] | None): If given, the recipe is verified and
+                repaired locally, and must then be feasible with these items.
 
+        Returns:
+            sc_recipe.Recipe: The parsed recipe.
+
+        Raises:
+            ValueError: If the output cannot be parsed into a valid recipe, or the
+                recipe is not feasible with the given items.
+        """
         try:
-            output_json = json.loads(output_text)
+            output_json = sc_json_output.parse_json_output(output_text)
             recipe = sc_recipe.Recipe.model_validate(output_json)
-            # recipe.populate_items(items)
-            return recipe
         except Exception as e:
             raise ValueError(
                 f"Failed to parse recipe output: {e}\nOutput text: {output_text}"
             )
 
+        if items is not None:
+            recipe = self._repair_recipe(recipe, items, attempts=0)
+
+        return recipe
+
+    def _repair_recipe(
+        self,
+        recipe: sc_recipe.Recipe,
+        items: list[sc_item.Item],
+        ingredients: str | None = None,
+        attempts: int | None = None,
+    ) -> sc_recipe.Recipe:
+        """
+        Verifies a recipe against the items, repairing it locally and then with
+        targeted patches from the model. Patches stop at the deadline of the
+        invocation, see `sc_invocation.deadline`.
+
+        Args:
+            recipe (sc_recipe.Recipe): The recipe.
+            items (list[sc_item.Item]): List of available ingredients.
+            ingredients (str | None): The ingredient table of the prompt, shown to
+                the model with the problems to fix. Required if `attempts` is not 0.
+            attempts (int | None): The number of patches asked of the model.
+                Defaults to `repair_attempts`.
+
+        Returns:
+            sc_recipe.Recipe: The repaired recipe, feasible with the items.
+
+        Raises:
+            ValueError: If the recipe is still not feasible after the attempts.
+            sc_invocation.DeadlineExceeded: If the deadline passed during a patch.
+        """
+        attempts = self._repair_attempts if attempts is None else attempts
+        for attempt in range(attempts + 1):
+            try:
+                verification = sc_recipe_repair.verify_recipe(recipe, items)
+            except (KeyError, TypeError, ValueError) as e:
+                raise ValueError(f"Failed to check recipe feasibility: {e}")
+            for repair in verification.repairs:
+                logging.info(f"Repaired recipe {recipe.name}: {repair}")
+            if verification.feasible:
+                return verification.recipe
+            if attempt == attempts:
+                break
+            recipe = self._patch_recipe(
+                verification.recipe, ingredients, verification.issues
+            )
+
+        raise ValueError(f"Recipe {recipe.name} is not feasible: {verification.issues}")
+
+    def _patch_recipe(
+        self, recipe: sc_recipe.Recipe, ingredients: str, issues: list[str]
+    ) -> sc_recipe.Recipe:
+        """
+        Asks the model to fix the ingredients of a recipe, instead of generating
+        the whole recipe again.
+
+        Args:
+            recipe (sc_recipe.Recipe): The recipe.
+            ingredients (str): The ingredient table of the prompt.
+            issues (list[str]): The problems the model must fix.
+
+        Returns:
+            sc_recipe.Recipe: The recipe with the ingredients from the model.
+
+        Raises:
+            ValueError: If the reply does not contain valid ingredients.
+            sc_invocation.DeadlineExceeded: If the deadline passed first.
+        """
+        import src.server.callbacks as sc_callbacks
+
+        current = [ingredient.model_dump() for ingredient in recipe.ingredients]
+        problems = "\n".join(f"- {issue}" for issue in issues)
+        messages = [
+            (
+                "system",
+                "You fix the ingredient lists of recipes so that they can be made "
+                "with the available ingredients. Only use names exactly as they "
+                "appear in the table, units the table uses, and no more than the "
+                'available quantity. Reply with JSON only: {"ingredients": '
+                '[{"name": ..., "quantity": ..., "unit": ...}]}, listing every '
+                "ingredient of the fixed recipe.",
+            ),
+            (
+                "human",
+                f"Available ingredients:\n{ingredients}\n"
+                f"Ingredients of the recipe {recipe.name}:\n{json.dumps(current)}\n"
+                f"Problems:\n{problems}",
+            ),
+        ]
+        # The request is bounded by the deadline too, so that the call guard
+        # abandons on a timeout does not keep running long after it.
+        remaining = sc_invocation.remaining_time()
+        kwargs = {} if remaining is None else {"timeout": max(remaining, 0.0)}
+        output_text = sc_invocation.guard(self._llm.invoke)(
+            messages,
+            config={"callbacks": [sc_callbacks.CancellationCallbackHandler()]},
+            **kwargs,
+        ).content
+        try:
+            output_json = sc_json_output.parse_json_output(output_text)
+            if isinstance(output_json, dict):
+                output_json = output_json["ingredients"]
+            patched = [
+                sc_recipe.RecipeIngredient.model_validate(ingredient)
+                for ingredient in output_json
+            ]
+            return recipe.model_copy(update={"ingredients": patched})
+        except Exception as e:
+            raise ValueError(
+                f"Failed to parse recipe patch: {e}\nOutput text: {output_text}"
+            )
+
+    def latency_stats(self) -> dict:
+        """
+        Returns the latency histogram of recipe generation, with the number of
+        hedged and timed out requests.
+
+        Returns:
+            dict: The invoker statistics, see `sc_invocation.AgentInvoker.stats`.
+        """
+        return self._invoker.stats()
+
+    def cascade_stats(self) -> dict | None:
+        """
+        Returns the escalation rate and per-model latency of the cascade.
+
+        Returns:
+            dict | None: The cascade statistics, or None if the cascade is disabled.
+        """
+        if self._cascade is None:
+            return None
+        return self._cascade.stats()
+
 
 if __name__ == "__main__":
     # Create test items
@@ -1,16 +1,21 @@
 import base64
-import httpx
-import json
+import typing
 import validators
 
-from langchain.agents import create_openai_tools_agent, AgentExecutor
-from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_openai import ChatOpenAI
-from langchain_community.tools import Tool
-from langchain_google_community import GoogleSearchAPIWrapper
-from langchain.output_parsers import PydanticOutputParser
+# LangChain takes seconds to import, so it is only loaded once an agent is created.
+if typing.TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain.prompts import ChatPromptTemplate
+    from langchain_openai import ChatOpenAI
 
 import src.data_models.receipt as sc_receipt
+import src.server.invocation as sc_invocation
+import src.server.llm_scheduler as sc_llm_scheduler
+import src.server.model_cascade as sc_model_cascade
+import src.server.prompt_layout as sc_prompt_layout
+import src.server.receipt_ocr as sc_receipt_ocr
+import src.utils.json_output as sc_json_output
+import src.utils.search_cache as sc_search_cache
 
 
 class ExtractItemsAgent:
@@ -24,15 +29,34 @@ class ExtractItemsAgent:
         _llm: The language model used for processing.
         _extract_items_prompt: The prompt template for item extraction.
         _tools: A list of tools available to the agent.
-        _extract_items_agent: The agent responsible for item extraction.
         _extract_items_agent_executor: The executor for the extraction agent.
         _schema: The schema definition for the output data.
         _branded_items_url: URL for branded items database.
         _foundation_items_url: URL for foundation items database.
+        _search_cache: Cache for the results of the google_search tool.
+        _cascade: Cascade of executors tried cheapest first, if enabled.
+        _structured_output: Whether the model is constrained to the receipt schema.
+        _template_store: Merchant templates used by two-stage extraction.
+        _ocr: Extracts the text of a receipt image for two-stage extraction.
+        _min_line_confidence: Confidence below which a line is sent to the model.
     """
 
     def __init__(
-        self, model: str = "gpt-4o-mini", temperature: float = 0, verbose: bool = False
+        self,
+        model: str = "gpt-4o-mini",
+        temperature: float = 0,
+        verbose: bool = False,
+        search_cache: sc_search_cache.SearchCache | None = None,
+        scheduler: sc_llm_scheduler.LLMScheduler | None = None,
+        priority: sc_llm_scheduler.Priority = sc_llm_scheduler.Priority.INTERACTIVE,
+        cascade_tiers: list[str] | None = None,
+        structured_output: bool = False,
+        template_store: sc_receipt_ocr.ReceiptTemplateStore | None = None,
+        ocr: typing.Callable[[bytes], str] = sc_receipt_ocr.ocr_image,
+        min_line_confidence: float = 0.8,
+        prompt_layout: sc_prompt_layout.PromptLayout = sc_prompt_layout.PromptLayout.SPLIT,
+        timeout: float | None = None,
+        hedge_quantile: float | None = None,
     ):
         """
         Initializes the ExtractItemsAgent.
@@ -41,61 +65,158 @@ class ExtractItemsAgent:
             model (str): The name of the language model to use. Defaults to "gpt-4o-mini".
             temperature (float): The temperature setting for the language model. Defaults to 0.
             verbose (bool): Whether to enable verbose output. Defaults to False.
+            search_cache (sc_search_cache.SearchCache | None): Cache for search results.
+                Defaults to the cache shared by all agents in the process.
+            scheduler (sc_llm_scheduler.LLMScheduler | None): Scheduler that rate
+                limits model requests. Defaults to the scheduler shared by all agents
+                in the process.
+            priority (sc_llm_scheduler.Priority): The scheduling priority of this
+                agent's requests. Defaults to INTERACTIVE. Use BATCH for backfills.
+            cascade_tiers (list[str] | None): Models to try in order, cheapest first.
+                A receipt, or the enrichment of its lines, is only re-extracted on
+                the next model if it fails schema validation. The last tier replaces
+                `model`. Defaults to no cascade, which uses `model` alone. See
+                `sc_model_cascade.DEFAULT_CASCADE_TIERS`.
+            structured_output (bool): Whether to constrain the model to the receipt
+                JSON schema through the provider's structured output support,
+                instead of sending format instructions in the prompt.
+            template_store (sc_receipt_ocr.ReceiptTemplateStore | None): Merchant
+                templates used by `extract_items_two_stage`. Defaults to an empty,
+                in-memory store.
+            ocr (Callable[[bytes], str]): Extracts the text of a receipt image.
+                Defaults to Tesseract.
+            min_line_confidence (float): Receipt lines matched with a lower
+                confidence are sent to the model. Defaults to 0.8.
+            prompt_layout (sc_prompt_layout.PromptLayout): The layout of the
+                prompts. CACHED keeps a byte-stable, versioned prefix that providers
+                can serve from their prompt cache. Defaults to SPLIT.
+            timeout (float | None): The time in seconds an extraction may take.
+                Model calls and tool calls stop once it passes. Defaults to no
+                deadline.
+            hedge_quantile (float | None): If given, a duplicate request is sent
+                when a request takes longer than this quantile of past latencies,
+                such as 0.95, and the first valid receipt is used. Defaults to no
+                hedging.
         """
-        self._llm = ChatOpenAI(model=model, temperature=temperature)
+        from langchain.output_parsers import PydanticOutputParser
+        from langchain.prompts import ChatPromptTemplate, MessagesPlaceholder
+        from langchain_openai import ChatOpenAI
+
+        if scheduler is None:
+            scheduler = sc_llm_scheduler.get_default_scheduler()
+        self._structured_output = structured_output
         self._schema_parser = PydanticOutputParser(pydantic_object=sc_receipt.Receipt)
-        self._extract_items_prompt = ChatPromptTemplate.from_messages(
+        self._format_instructions = self._schema_parser.get_format_instructions()
+        # The response format already carries the schema.
+        format_instructions = None if structured_output else self._format_instructions
+        instructions = [
+            "You are recieving a receipt and an image of the items on the receipt for a particular supermarket purchase.",
+            "Use the receipt and the following image to extract items. The receipt may be blurry, so use the image to help you. There should be one item per line on the receipt.",
+            "Be sure to extract the supermarket or merchat from the top of the receipt. This should be the name of a store or a chain of stores (for example: 'Target' or 'Walmart').",
+            "If you cannot find the amount of each item purchased, either use the image or estimate the amount or look up the item online to find typical purchase amounts.",
+            "If you look online for the amount purchesed, it often appears online as 'price / unit amount'. For example if the price is '$1.99 / 100g' then the unit amount is 100g. Use this information and the price to calculate the amount of each item purchased.",
+        ]
+        messages = sc_prompt_layout.prompt_messages(
+            "extract_items",
+            instructions,
             [
-                (
-                    "system",
-                    "You are recieving a receipt and an image of the items on the receipt for a particular supermarket purchase.",
-                ),
-                (
-                    "system",
-                    "Use the receipt and the following image to extract items. The receipt may be blurry, so use the image to help you. There should be one item per line on the receipt.",
-                ),
-                (
-                    "system",
-                    "Be sure to extract the supermarket or merchat from the top of the receipt. This should be the name of a store or a chain of stores (for example: 'Target' or 'Walmart').",
-                ),
-                (
-                    "system",
-                    "If you cannot find the amount of each item purchased, either use the image or estimate the amount or look up the item online to find typical purchase amounts.",
-                ),
-                (
-                    "system",
-                    "If you look online for the amount purchesed, it often appears online as 'price / unit amount'. For example if the price is '$1.99 / 100g' then the unit amount is 100g. Use this information and the price to calculate the amount of each item purchased.",
-                ),
-                (
-                    "system",
-                    "{format_instructions}",
-                ),
-                (
-                    "human",
-                    [
-                        {
-                            "type": "image_url",
-                            "image_url": {
-                                "url": "data:image/jpeg;base64,{receipt_data}"
-                            },
-                        },
-                        {
-                            "type": "image_url",
-                            "image_url": {"url": "data:image/jpeg;base64,{image_data}"},
-                        },
-                    ],
-                ),
-                MessagesPlaceholder(variable_name="agent_scratchpad"),
-            ]
+                {
+                    "type": "image_url",
+                    "image_url": {"url": "data:image/jpeg;base64,{receipt_data}"},
+                },
+                {
+                    "type": "image_url",
+                    "image_url": {"url": "data:image/jpeg;base64,{image_data}"},
+                },
+            ],
+            prompt_layout,
+            format_instructions,
+        )
+        messages.append(MessagesPlaceholder(variable_name="agent_scratchpad"))
+        self._extract_items_prompt = ChatPromptTemplate.from_messages(messages)
+        enrich_instructions = [
+            "You are receiving item lines printed on a receipt for a particular supermarket purchase. Each line has the name of the item as printed on the receipt, which may be abbreviated, and its price.",
+            "Extract exactly one item per line, in the same order as the lines. Use the full, readable name of the item.",
+            "Use the header of the receipt to extract the supermarket or merchant. This should be the name of a store or a chain of stores (for example: 'Target' or 'Walmart').",
+            "If you cannot find the amount of each item purchased, either estimate the amount or look up the item online to find typical purchase amounts.",
+        ]
+        enrich_messages = sc_prompt_layout.prompt_messages(
+            "enrich_items",
+            enrich_instructions,
+            "Receipt header:\n{receipt_header}\n\nItem lines:\n{receipt_lines}",
+            prompt_layout,
+            format_instructions,
         )
+        enrich_messages.append(MessagesPlaceholder(variable_name="agent_scratchpad"))
+        self._enrich_items_prompt = ChatPromptTemplate.from_messages(enrich_messages)
+
+        llm_kwargs = scheduler.chat_model_kwargs(priority)
+        if structured_output:
+            llm_kwargs["model_kwargs"] = {
+                "response_format": sc_json_output.response_format(sc_receipt.Receipt)
+            }
+        if prompt_layout == sc_prompt_layout.PromptLayout.CACHED:
+            # Both prompts share the model, and so the cache key.
+            static_text = sc_prompt_layout.static_prompt(
+                "extract_items", instructions, format_instructions
+            ) + sc_prompt_layout.static_prompt(
+                "enrich_items", enrich_instructions, format_instructions
+            )
+            llm_kwargs["extra_body"] = {
+                "prompt_cache_key": sc_prompt_layout.prompt_key(
+                    "extract_items", static_text
+                )
+            }
+        if cascade_tiers:
+            model = cascade_tiers[-1]
+        self._llm = ChatOpenAI(model=model, temperature=temperature, **llm_kwargs)
+        if template_store is None:
+            template_store = sc_receipt_ocr.ReceiptTemplateStore()
+        self._template_store = template_store
+        self._ocr = ocr
+        self._min_line_confidence = min_line_confidence
+        if search_cache is None:
+            search_cache = sc_search_cache.get_default_cache()
+        self._search_cache = search_cache
+        self._timeout = timeout
+        # Full and enrichment-only extractions have their own latency profiles.
+        self._extract_invoker = sc_invocation.AgentInvoker(timeout, hedge_quantile)
+        self._enrich_invoker = sc_invocation.AgentInvoker(timeout, hedge_quantile)
         self._tools = []
         self._setup_tools()
-        self._extract_items_agent = create_openai_tools_agent(
-            self._llm, self._tools, prompt=self._extract_items_prompt
-        )
-        self._extract_items_agent_executor = AgentExecutor(
-            agent=self._extract_items_agent, tools=self._tools, verbose=verbose
+        self._verbose = verbose
+        self._extract_items_agent_executor = self._create_agent_executor(self._llm)
+        self._enrich_items_agent_executor = self._create_agent_executor(
+            self._llm, self._enrich_items_prompt
         )
+        self._cascade = None
+        self._enrich_cascade = None
+        if cascade_tiers is not None:
+            # The last tier uses the model and executors built above.
+            tier_llms = {
+                tier_model: ChatOpenAI(
+                    model=tier_model, temperature=temperature, **llm_kwargs
+                )
+                for tier_model in cascade_tiers[:-1]
+            }
+            self._cascade = sc_model_cascade.agent_cascade(
+                cascade_tiers,
+                lambda tier_model: (
+                    self._extract_items_agent_executor
+                    if tier_model == model
+                    else self._create_agent_executor(tier_llms[tier_model])
+                ),
+            )
+            self._enrich_cascade = sc_model_cascade.agent_cascade(
+                cascade_tiers,
+                lambda tier_model: (
+                    self._enrich_items_agent_executor
+                    if tier_model == model
+                    else self._create_agent_executor(
+                        tier_llms[tier_model], self._enrich_items_prompt
+                    )
+                ),
+            )
         self._branded_items_url = (
             "https://fdc.nal.usda.gov/fdc-app.html#/food-search?query=&type=Branded"
         )
@@ -103,18 +224,53 @@ class ExtractItemsAgent:
             "https://fdc.nal.usda.gov/fdc-app.html#/food-search?query=&type=Foundation"
         )
 
+    def _create_agent_executor(
+        self, llm: "ChatOpenAI", prompt: "ChatPromptTemplate | None" = None
+    ) -> "AgentExecutor":
+        """
+        Creates an executor for an extraction agent backed by the given model.
+
+        Args:
+            llm (ChatOpenAI): The language model used by the agent.
+            prompt (ChatPromptTemplate | None): The prompt of the agent. Defaults to
+                the receipt extraction prompt.
+
+        Returns:
+            AgentExecutor: The executor for the agent.
+        """
+        from langchain.agents import AgentExecutor, create_openai_tools_agent
+
+        # OpenAI only accepts tools alongside a response format if they are strict.
+        agent = create_openai_tools_agent(
+            llm,
+            self._tools,
+            prompt=prompt or self._extract_items_prompt,
+            strict=True if self._structured_output else None,
+        )
+        return AgentExecutor(
+            agent=agent,
+            tools=self._tools,
+            verbose=self._verbose,
+            max_execution_time=self._timeout,
+        )
+
     def _setup_tools(self):
         """
         Sets up the tools used by the agent.
 
         This method initializes the Google Search API tool and adds it to the agent's toolkit.
         """
+        from langchain_community.tools import Tool
+        from langchain_google_community import GoogleSearchAPIWrapper
+
         google_search_api = GoogleSearchAPIWrapper()
         self._tools.append(
             Tool(
                 name="google_search",
                 description="Search the internet for nutritional and serving size information of food items.",
-                func=google_search_api.run,
+                func=sc_invocation.guard(
+                    self._search_cache.wrap(google_search_api.run)
+                ),
             )
         )
 
@@ -133,6 +289,7 @@ class ExtractItemsAgent:
 
         Raises:
             ValueError: If the provided URLs are not valid.
+            sc_invocation.DeadlineExceeded: If extraction took longer than `timeout`.
 
         Returns:
             list[str]: A list of extracted items with their details.
@@ -140,31 +297,187 @@ class ExtractItemsAgent:
         if not validators.url(receipt_url) or not validators.url(image_url):
             raise ValueError("Invalid URL provided.")
 
+        import httpx
+
         receipt_data = base64.b64encode(httpx.get(receipt_url).content).decode("utf-8")
         image_data = base64.b64encode(httpx.get(image_url).content).decode("utf-8")
 
-        output = self._extract_items_agent_executor.invoke(
-            {
-                "receipt_data": receipt_data,
-                "image_data": image_data,
-                "branded_items_url": self._branded_items_url,
-                "foundation_items_url": self._foundation_items_url,
-                "format_instructions": self._schema_parser.get_format_instructions(),
-            }
+        inputs = {
+            "receipt_data": receipt_data,
+            "image_data": image_data,
+            "branded_items_url": self._branded_items_url,
+            "foundation_items_url": self._foundation_items_url,
+        }
+        if not self._structured_output:
+            inputs["format_instructions"] = self._format_instructions
+        if self._cascade is not None:
+            with sc_invocation.deadline(self._timeout):
+                return self._cascade.run(inputs, self._parse_receipt)
+
+        return self._extract_invoker.invoke(
+            lambda: self._run_executor(self._extract_items_agent_executor, inputs),
+            self._parse_receipt,
+        )
+
+    def extract_items_two_stage(
+        self, receipt_url: str, image_url: str
+    ) -> sc_receipt.Receipt:
+        """
+        Extracts items from a receipt, reading clean printed lines locally.
+
+        The receipt is first read with OCR and its lines are matched against the
+        merchant's template, which is learned from past receipts. Only lines that
+        cannot be matched confidently are sent to the model, as text. If no item
+        lines can be read locally, the whole receipt and the image of the items are
+        sent to the model as in `extract_items_from_receipt`. The items are returned
+        in the order of their lines on the receipt.
+
+        Args:
+            receipt_url (str): URL of the receipt image.
+            image_url (str): URL of the image containing the items.
+
+        Raises:
+            ValueError: If the provided URLs are not valid.
+            sc_invocation.DeadlineExceeded: If extraction took longer than `timeout`.
+
+        Returns:
+            sc_receipt.Receipt: The extracted receipt.
+        """
+        if not validators.url(receipt_url) or not validators.url(image_url):
+            raise ValueError("Invalid URL provided.")
+
+        import httpx
+
+        text = self._ocr(httpx.get(receipt_url).content)
+        lines = sc_receipt_ocr.parse_receipt_text(text)
+        if not lines:
+            receipt = self.extract_items_from_receipt(receipt_url, image_url)
+            self._template_store.learn(receipt)
+            return receipt
+
+        # The header is everything printed above the first item line.
+        header = []
+        for raw_line in text.splitlines():
+            if raw_line.strip() == lines[0].text:
+                break
+            if raw_line.strip():
+                header.append(raw_line.strip())
+        template = self._template_store.find_merchant(header)
+        if template is not None:
+            lines = sc_receipt_ocr.parse_receipt_text(text, template)
+
+        ambiguous = [
+            line
+            for line in lines
+            if line.item is None or line.confidence < self._min_line_confidence
+        ]
+        if not ambiguous:
+            return sc_receipt.Receipt(
+                merchant=template.merchant,
+                items=sc_receipt_ocr.merge_line_items(
+                    lines, [], self._min_line_confidence
+                ),
+            )
+
+        inputs = {
+            "receipt_header": "\n".join(header),
+            "receipt_lines": "\n".join(line.text for line in ambiguous),
+        }
+        if not self._structured_output:
+            inputs["format_instructions"] = self._format_instructions
+        if self._enrich_cascade is not None:
+            with sc_invocation.deadline(self._timeout):
+                enriched = self._enrich_cascade.run(inputs, self._parse_receipt)
+        else:
+            enriched = self._enrich_invoker.invoke(
+                lambda: self._run_executor(self._enrich_items_agent_executor, inputs),
+                self._parse_receipt,
+            )
+
+        # The model returns one item per line, so the printed names can be learned
+        # as aliases when the counts agree.
+        receipt_names = None
+        if len(enriched.items) == len(ambiguous):
+            receipt_names = [line.name for line in ambiguous]
+        merchant = template.merchant if template is not None else enriched.merchant
+        self._template_store.learn(
+            sc_receipt.Receipt(merchant=merchant, items=enriched.items),
+            receipt_names=receipt_names,
+            header_line=header[0] if header else None,
+        )
+        return sc_receipt.Receipt(
+            merchant=merchant,
+            items=sc_receipt_ocr.merge_line_items(
+                lines, enriched.items, self._min_line_confidence
+            ),
         )
 
-        # Clean up the output text by removing markdown code block syntax and newlines
-        output_text = output["output"]
-        if output_text.startswith("```json\n"):
-            output_text = output_text[7:]  # Remove ```json\n prefix
-        if output_text.endswith("\n```"):
-            output_text = output_text[:-4]  # Remove \n``` suffix
+    def _run_executor(self, executor: "AgentExecutor", inputs: dict) -> str:
+        """
+        Runs an agent executor, stopping it when its invocation is cancelled.
+
+        Args:
+            executor (AgentExecutor): The executor.
+            inputs (dict): The prompt inputs.
+
+        Returns:
+            str: The output of the agent.
+        """
+        import src.server.callbacks as sc_callbacks
+
+        return executor.invoke(
+            inputs, config={"callbacks": [sc_callbacks.CancellationCallbackHandler()]}
+        )["output"]
+
+    def _parse_receipt(self, output_text: str) -> sc_receipt.Receipt:
+        """
+        Parses the agent output into a receipt.
 
+        Args:
+            output_text (str): The output of the extraction agent.
+
+        Returns:
+            sc_receipt.Receipt: The parsed receipt.
+
+        Raises:
+            ValueError: If the output cannot be parsed into a valid receipt.
+        """
         try:
-            output_json = json.loads(output_text)
+            output_json = sc_json_output.parse_json_output(output_text)
             receipt = sc_receipt.Receipt.model_validate(output_json)
             return receipt
         except Exception as e:
             raise ValueError(
                 f"Failed to parse JSON output: {e}\nOutput text: {output_text}"
             )
+
+    def latency_stats(self) -> dict:
+        """
+        Returns the latency histograms of full and enrichment-only extractions,
+        with the number of hedged and timed out requests.
+
+        Returns:
+            dict: The invoker statistics of "extract_items" and "enrich_items", see
+                `sc_invocation.AgentInvoker.stats`.
+        """
+        return {
+            "extract_items": self._extract_invoker.stats(),
+            "enrich_items": self._enrich_invoker.stats(),
+        }
+
+    def cascade_stats(self) -> dict | None:
+        """
+        Returns the escalation rate and per-model latency of the cascades of full
+        and enrichment-only extractions.
+
+        Returns:
+            dict | None: The cascade statistics of "extract_items" and
+                "enrich_items", see `sc_model_cascade.ModelCascade.stats`, or None
+                if the cascade is disabled.
+        """
+        if self._cascade is None:
+            return None
+        return {
+            "extract_items": self._cascade.stats(),
+            "enrich_items": self._enrich_cascade.stats(),
+        }
@@ -0,0 +1,286 @@
+import datetime
+import functools
+import logging
+import math
+import re
+import typing
+
+import src.data_models.item as sc_item
+import src.data_models.user as sc_user
+
+
+# Keywords that place an item in a food category, for pairing and diet checks.
+_CATEGORY_KEYWORDS = {
+    "meat": {"chicken", "beef", "pork", "turkey", "lamb", "bacon", "ham", "sausage"},
+    "seafood": {"salmon", "tuna", "shrimp", "fish", "cod", "tilapia", "crab"},
+    "egg": {"egg", "eggs"},
+    "plant_protein": {"tofu", "tempeh", "seitan"},
+    "legume": {"bean", "beans", "lentil", "lentils", "chickpea", "chickpeas"},
+    "grain": {"rice", "pasta", "bread", "quinoa", "oats", "noodles", "tortilla"},
+    "gluten": {"pasta", "bread", "flour", "wheat", "barley", "noodles", "couscous"},
+    "dairy": {"milk", "cheese", "yogurt", "butter", "cream"},
+    "vegetable": {
+        "tomato",
+        "tomatoes",
+        "onion",
+        "onions",
+        "pepper",
+        "peppers",
+        "spinach",
+        "broccoli",
+        "carrot",
+        "carrots",
+        "potato",
+        "potatoes",
+        "mushroom",
+        "mushrooms",
+        "zucchini",
+        "kale",
+        "cabbage",
+        "lettuce",
+        "celery",
+        "corn",
+        "cucumber",
+    },
+    "aromatic": {"garlic", "ginger", "shallot", "scallion", "basil", "cilantro"},
+    "fruit": {"apple", "banana", "lemon", "lime", "orange", "berries", "avocado"},
+}
+_PROTEINS = {"meat", "seafood", "egg", "plant_protein", "legume"}
+# Categories that make a meal together with each category.
+_COMPLEMENTS = {
+    **{protein: {"grain", "vegetable", "aromatic"} for protein in _PROTEINS},
+    "grain": _PROTEINS | {"vegetable"},
+    "vegetable": _PROTEINS | {"grain", "aromatic"},
+    "aromatic": _PROTEINS | {"vegetable"},
+    "dairy": {"grain", "vegetable"},
+    "fruit": {"dairy", "grain"},
+}
+# Categories excluded by common dietary restrictions.
+_DIET_EXCLUSIONS = {
+    "vegan": {"meat", "seafood", "egg", "dairy"},
+    "vegetarian": {"meat", "seafood"},
+    "pescatarian": {"meat"},
+    "gluten free": {"gluten"},
+    "dairy free": {"dairy"},
+}
+
+# Weights of the ranking signals.
+_EXPIRY_WEIGHT = 1.0
+_PREFERENCE_WEIGHT = 0.5
+_PAIRING_WEIGHT = 0.5
+# Low enough to rank excluded items below every allowed item.
+_RESTRICTED_PENALTY = -10.0
+
+_TABLE_HEADER = "name|quantity|days_left|serving|kcal|protein_g|carbs_g|fat_g"
+
+
+def _words(text: str) -> set[str]:
+    return set(re.findall(r"[a-z]+", text.lower()))
+
+
+def item_categories(item: sc_item.Item) -> set[str]:
+    """
+    Returns the food categories of an item, based on the words in its name.
+
+    Args:
+        item (sc_item.Item): The item.
+
+    Returns:
+        set[str]: The categories, such as "meat" or "grain". Empty if unknown.
+    """
+    words = _words(item.name)
+    return {
+        category
+        for category, keywords in _CATEGORY_KEYWORDS.items()
+        if words & keywords
+    }
+
+
+def days_left(item: sc_item.Item, today: datetime.date | None = None) -> int:
+    """
+    Returns the number of days until an item expires.
+
+    Args:
+        item (sc_item.Item): The item.
+        today (datetime.date | None): The current date. Defaults to today.
+
+    Returns:
+        int: The days until the item expires, negative if it has expired.
+    """
+    today = today or datetime.date.today()
+    return (item.expiration_date - today).days
+
+
+def score_item(
+    item: sc_item.Item,
+    user_preferences: sc_user.UserPreferences,
+    pantry_categories: set[str],
+    today: datetime.date | None = None,
+) -> float:
+    """
+    Scores how useful an item is for the next recipe.
+
+    Items score higher the sooner they expire, if they match the user's favorite
+    cuisines or recipes, and if the pantry has items that complete a meal with
+    them. Items excluded by a dietary restriction score lowest.
+
+    Args:
+        item (sc_item.Item): The item.
+        user_preferences (sc_user.UserPreferences): The preferences of the user.
+        pantry_categories (set[str]): The categories of the other items.
+        today (datetime.date | None): The current date. Defaults to today.
+
+    Returns:
+        float: The score of the item. Higher is better.
+    """
+    # 1.0 if the item expires today, 0.5 in a week, close to 0 in months.
+    expiry = 1 / (1 + max(days_left(item, today), 0) / 7)
+
+    categories = item_categories(item)
+    preference = 0.0
+    for restriction in user_preferences.dietary_restrictions:
+        diet = " ".join(re.findall(r"[a-z]+", restriction.lower()))
+        excluded = _DIET_EXCLUSIONS.get(diet, set())
+        if categories & excluded:
+            preference = _RESTRICTED_PENALTY
+            break
+    else:
+        favorites = " ".join(
+            user_preferences.favorite_recipes + user_preferences.favorite_cuisines
+        )
+        if _words(item.name) & _words(favorites):
+            preference = 1.0
+
+    complements = set().union(*(_COMPLEMENTS.get(c, set()) for c in categories))
+    pairing = (
+        len(complements & pantry_categories) / len(complements) if complements else 0.0
+    )
+
+    return (
+        _EXPIRY_WEIGHT * expiry
+        + _PREFERENCE_WEIGHT * preference
+        + _PAIRING_WEIGHT * pairing
+    )
+
+
+def rank_items(
+    items: list[sc_item.Item],
+    user_preferences: sc_user.UserPreferences,
+    today: datetime.date | None = None,
+) -> list[sc_item.Item]:
+    """
+    Orders items from most to least useful for the next recipe.
+
+    Args:
+        items (list[sc_item.Item]): The available items.
+        user_preferences (sc_user.UserPreferences): The preferences of the user.
+        today (datetime.date | None): The current date. Defaults to today.
+
+    Returns:
+        list[sc_item.Item]: The items, best first. See `score_item`.
+    """
+    categories = [item_categories(item) for item in items]
+    scored = []
+    for i, item in enumerate(items):
+        others = set().union(*(c for j, c in enumerate(categories) if j != i))
+        scored.append((score_item(item, user_preferences, others, today), item))
+    scored.sort(key=lambda entry: (-entry[0], entry[1].name))
+    return [item for _, item in scored]
+
+
+def _format_number(value: float) -> str:
+    return f"{value:.4g}"
+
+
+def format_item_row(item: sc_item.Item, today: datetime.date | None = None) -> str:
+    """
+    Formats an item as a row of the compact ingredient table.
+
+    Args:
+        item (sc_item.Item): The item.
+        today (datetime.date | None): The current date. Defaults to today.
+
+    Returns:
+        str: The row, with the columns of the table header.
+    """
+    facts = item.nutritional_facts
+    return "|".join(
+        [
+            item.name,
+            f"{_format_number(item.quantity.quantity)} {item.quantity.unit.value}",
+            str(days_left(item, today)),
+            f"{_format_number(facts.serving_size.quantity)} "
+            f"{facts.serving_size.unit.value}",
+            _format_number(facts.calories.quantity),
+            _format_number(facts.protein.quantity),
+            _format_number(facts.carbs.quantity),
+            _format_number(facts.fat.quantity),
+        ]
+    )
+
+
+@functools.lru_cache
+def token_counter(model: str) -> typing.Callable[[str], int]:
+    """
+    Returns a function that counts the tokens of a text for a model.
+
+    Args:
+        model (str): The name of the model, such as "gpt-4o".
+
+    Returns:
+        Callable[[str], int]: Counts tokens with the model's tiktoken encoding, or
+            estimates four characters per token if the encoding cannot be loaded.
+    """
+    import tiktoken
+
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except Exception as e:
+        logging.warning(
+            f"Estimating token counts, no tiktoken encoding for {model}: {e}"
+        )
+        return lambda text: math.ceil(len(text) / 4)
+    return lambda text: len(encoding.encode(text))
+
+
+def compact_ingredients(
+    items: list[sc_item.Item],
+    user_preferences: sc_user.UserPreferences,
+    count_tokens: typing.Callable[[str], int],
+    max_items: int = 30,
+    token_budget: int = 1500,
+    today: datetime.date | None = None,
+) -> str:
+    """
+    Builds a compact table of the most useful items within a token budget.
+
+    Items are ranked with `rank_items` and added best first until `max_items`
+    items are in the table or the next row would exceed the budget.
+
+    Args:
+        items (list[sc_item.Item]): The available items.
+        user_preferences (sc_user.UserPreferences): The preferences of the user.
+        count_tokens (Callable[[str], int]): Counts the tokens of a text.
+        max_items (int): The maximum number of items kept. Defaults to 30.
+        token_budget (int): The maximum number of tokens of the table. Defaults
+            to 1500.
+        today (datetime.date | None): The current date. Defaults to today.
+
+    Returns:
+        str: A header line and one row per kept item, with nutrition per serving.
+    """
+    lines = [_TABLE_HEADER]
+    tokens = count_tokens(_TABLE_HEADER)
+    for item in rank_items(items, user_preferences, today)[:max_items]:
+        row = format_item_row(item, today)
+        # Each row also costs a newline.
+        row_tokens = count_tokens(row) + 1
+        if tokens + row_tokens > token_budget:
+            break
+        lines.append(row)
+        tokens += row_tokens
+
+    kept = len(lines) - 1
+    if kept < len(items):
+        logging.info(f"Kept {kept} of {len(items)} items in the prompt.")
+    return "\n".join(lines)
@@ -0,0 +1,420 @@
+import bisect
+import contextlib
+import contextvars
+import functools
+import logging
+import queue
+import threading
+import time
+import typing
+
+
+T = typing.TypeVar("T")
+
+# How often a guarded call checks whether its invocation was cancelled.
+_POLL_SECONDS = 0.05
+
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when an invocation passes its deadline or is cancelled."""
+
+
+class _CallState:
+    """The deadline and cancellation of the invocation a thread is working on."""
+
+    def __init__(
+        self,
+        deadline: float | None,
+        cancelled: threading.Event,
+        parent: "_CallState | None" = None,
+    ):
+        self.deadline = deadline
+        self.cancelled = cancelled
+        self.parent = parent
+
+    def remaining(self) -> float | None:
+        remaining = None
+        state = self
+        while state is not None:
+            if state.deadline is not None:
+                left = state.deadline - time.monotonic()
+                remaining = left if remaining is None else min(remaining, left)
+            state = state.parent
+        return remaining
+
+    def check(self):
+        state = self
+        while state is not None:
+            if state.cancelled.is_set():
+                raise DeadlineExceeded("The invocation was cancelled.")
+            state = state.parent
+        remaining = self.remaining()
+        if remaining is not None and remaining <= 0:
+            raise DeadlineExceeded("The invocation passed its deadline.")
+
+
+_call_state: contextvars.ContextVar[_CallState | None] = contextvars.ContextVar(
+    "souchef_call_state", default=None
+)
+
+
+@contextlib.contextmanager
+def deadline(
+    seconds: float | None, cancelled: threading.Event | None = None
+) -> typing.Iterator[None]:
+    """
+    Sets a deadline for the code run in the context, including the threads it
+    starts with a copy of the context.
+
+    Deadlines nest: the earliest deadline and any cancelled scope apply.
+
+    Args:
+        seconds (float | None): The time the code may take. Defaults to no
+            deadline when None.
+        cancelled (threading.Event | None): Optional event that cancels the code
+            once set.
+    """
+    state = _CallState(
+        None if seconds is None else time.monotonic() + seconds,
+        cancelled or threading.Event(),
+        _call_state.get(),
+    )
+    token = _call_state.set(state)
+    try:
+        yield
+    finally:
+        _call_state.reset(token)
+
+
+def remaining_time() -> float | None:
+    """
+    Returns the time left until the deadline of the current invocation.
+
+    Returns:
+        float | None: The seconds left, or None if there is no deadline.
+    """
+    state = _call_state.get()
+    return None if state is None else state.remaining()
+
+
+def check_deadline():
+    """
+    Stops the current invocation if it passed its deadline or was cancelled.
+
+    Raises:
+        DeadlineExceeded: If the invocation passed its deadline or was cancelled.
+    """
+    state = _call_state.get()
+    if state is not None:
+        state.check()
+
+
+def guard(func: typing.Callable[..., T]) -> typing.Callable[..., T]:
+    """
+    Makes a blocking function, such as a tool, return once the invocation that
+    calls it passes its deadline or is cancelled.
+
+    The function runs in a separate thread. Python threads cannot be stopped, so
+    when the invocation stops waiting, the thread is abandoned, not stopped: it
+    keeps running, and holding its connection, until the function returns on its
+    own. Functions that can take long should bound themselves, for example with
+    a request timeout of `remaining_time()`.
+
+    Args:
+        func (Callable[..., T]): The function.
+
+    Returns:
+        Callable[..., T]: The guarded function. Raises DeadlineExceeded when the
+            invocation stops waiting.
+    """
+
+    @functools.wraps(func)
+    def guarded(*args, **kwargs) -> T:
+        state = _call_state.get()
+        if state is None:
+            return func(*args, **kwargs)
+        state.check()
+
+        result = {}
+        done = threading.Event()
+        context = contextvars.copy_context()
+
+        def run():
+            try:
+                result["value"] = context.run(func, *args, **kwargs)
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        threading.Thread(target=run, name="guarded-call", daemon=True).start()
+        while not done.wait(_POLL_SECONDS):
+            state.check()
+        if "error" in result:
+            # A function bounded by the deadline fails with its own timeout.
+            state.check()
+            raise result["error"]
+        return result["value"]
+
+    return guarded
+
+
+class LatencyHistogram:
+    """
+    Counts latencies in exponentially growing buckets.
+
+    Percentiles are reported as the upper bound of their bucket, so they are at
+    most `growth` times the true value.
+    """
+
+    def __init__(
+        self,
+        min_seconds: float = 0.01,
+        max_seconds: float = 600.0,
+        growth: float = 1.25,
+    ):
+        """
+        Initializes the LatencyHistogram.
+
+        Args:
+            min_seconds (float): The upper bound of the first bucket. Defaults to
+                0.01.
+            max_seconds (float): The upper bound of the last bucket; longer
+                latencies are counted in an overflow bucket. Defaults to 600.
+            growth (float): The ratio between the bounds of consecutive buckets.
+                Defaults to 1.25.
+        """
+        self._bounds = []
+        bound = min_seconds
+        while bound < max_seconds:
+            self._bounds.append(bound)
+            bound *= growth
+        self._bounds.append(max_seconds)
+        self._counts = [0] * (len(self._bounds) + 1)
+        self._count = 0
+        self._max = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def count(self) -> int:
+        """
+        Returns the number of recorded latencies.
+
+        Returns:
+            int: The number of latencies.
+        """
+        return self._count
+
+    def record(self, seconds: float):
+        """
+        Records a latency.
+
+        Args:
+            seconds (float): The latency in seconds.
+        """
+        with self._lock:
+            self._counts[bisect.bisect_left(self._bounds, seconds)] += 1
+            self._count += 1
+            self._max = max(self._max, seconds)
+
+    def percentile(self, quantile: float) -> float | None:
+        """
+        Returns a percentile of the recorded latencies.
+
+        Args:
+            quantile (float): The quantile, such as 0.95.
+
+        Returns:
+            float | None: The upper bound of the bucket holding the percentile, in
+                seconds, or None if nothing was recorded.
+        """
+        with self._lock:
+            if not self._count:
+                return None
+            rank = quantile * self._count
+            cumulative = 0
+            for index, count in enumerate(self._counts):
+                cumulative += count
+                if cumulative >= rank and count:
+                    if index == len(self._bounds):
+                        return self._max
+                    return min(self._bounds[index], self._max)
+            return self._max
+
+    def snapshot(self) -> dict[str, typing.Any]:
+        """
+        Returns the percentiles and the non-empty buckets of the histogram.
+
+        Returns:
+            dict[str, Any]: The count, p50, p95, p99 and max in seconds, and the
+                count of each non-empty bucket by its upper bound.
+        """
+        with self._lock:
+            buckets = {
+                (self._bounds[i] if i < len(self._bounds) else float("inf")): count
+                for i, count in enumerate(self._counts)
+                if count
+            }
+        return {
+            "count": self._count,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "p99": self.percentile(0.99),
+            "max": self._max,
+            "buckets": buckets,
+        }
+
+
+class AgentInvoker(typing.Generic[T]):
+    """
+    Runs agent invocations with a deadline and optional hedging.
+
+    Each invocation runs in its own thread, inside a `deadline` scope, so model
+    callbacks and guarded tools stop it once the deadline passes. With hedging,
+    a second attempt is started if the first has not returned after the given
+    quantile of past latencies, and the first valid result is used.
+    """
+
+    def __init__(
+        self,
+        timeout: float | None = None,
+        hedge_quantile: float | None = None,
+        min_hedge_samples: int = 20,
+    ):
+        """
+        Initializes the AgentInvoker.
+
+        Args:
+            timeout (float | None): The time an invocation may take, including its
+                hedge. Defaults to no deadline.
+            hedge_quantile (float | None): The quantile of past latencies after
+                which a hedge is started, such as 0.95. Defaults to no hedging.
+            min_hedge_samples (int): The number of latencies recorded before
+                hedging starts. Defaults to 20.
+        """
+        self._timeout = timeout
+        self._hedge_quantile = hedge_quantile
+        self._min_hedge_samples = min_hedge_samples
+        self._histogram = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._counters = {"invocations": 0, "hedges": 0, "hedge_wins": 0, "timeouts": 0}
+
+    def hedge_delay(self) -> float | None:
+        """
+        Returns the time after which a hedge is started.
+
+        Returns:
+            float | None: The delay in seconds, or None if hedging is disabled or
+                too few latencies were recorded.
+        """
+        if (
+            self._hedge_quantile is None
+            or self._histogram.count < self._min_hedge_samples
+        ):
+            return None
+        return self._histogram.percentile(self._hedge_quantile)
+
+    def _count(self, counter: str):
+        with self._lock:
+            self._counters[counter] += 1
+
+    def invoke(
+        self, run: typing.Callable[[], str], parse: typing.Callable[[str], T]
+    ) -> T:
+        """
+        Runs an invocation.
+
+        Args:
+            run (Callable[[], str]): Runs the agent and returns its output.
+            parse (Callable[[str], T]): Parses and validates the output. Raises
+                ValueError if the output is not acceptable.
+
+        Returns:
+            T: The first valid parsed output.
+
+        Raises:
+            DeadlineExceeded: If no attempt returned a valid output in time.
+            Exception: The error of the last attempt, if every attempt failed.
+        """
+        self._count("invocations")
+        start = time.monotonic()
+        deadline_at = None if self._timeout is None else start + self._timeout
+        delay = self.hedge_delay()
+        hedge_at = None if delay is None else start + delay
+        results = queue.Queue()
+        attempts = []
+
+        def launch():
+            index = len(attempts)
+            cancelled = threading.Event()
+            attempts.append(cancelled)
+            seconds = None if deadline_at is None else deadline_at - time.monotonic()
+            context = contextvars.copy_context()
+
+            def attempt():
+                attempt_start = time.monotonic()
+                try:
+                    with deadline(seconds, cancelled):
+                        output = parse(run())
+                except Exception as e:
+                    results.put((index, 0.0, None, e))
+                    return
+                results.put((index, time.monotonic() - attempt_start, output, None))
+
+            threading.Thread(
+                target=context.run,
+                args=(attempt,),
+                name=f"agent-attempt-{index}",
+                daemon=True,
+            ).start()
+
+        launch()
+        pending = 1
+        try:
+            while True:
+                waits = [deadline_at] + ([hedge_at] if len(attempts) == 1 else [])
+                waits = [at - time.monotonic() for at in waits if at is not None]
+                try:
+                    index, seconds, output, error = results.get(
+                        timeout=max(min(waits), 0) if waits else None
+                    )
+                except queue.Empty:
+                    if deadline_at is not None and time.monotonic() >= deadline_at:
+                        self._count("timeouts")
+                        raise DeadlineExceeded(
+                            f"No result within the {self._timeout}s deadline."
+                        )
+                    logging.info(f"Hedging an invocation after {delay:.2f}s.")
+                    self._count("hedges")
+                    launch()
+                    pending += 1
+                    continue
+
+                pending -= 1
+                if error is None:
+                    self._histogram.record(seconds)
+                    if index > 0:
+                        self._count("hedge_wins")
+                    return output
+                logging.warning(f"Invocation attempt {index} failed: {error}")
+                if pending == 0:
+                    if isinstance(error, DeadlineExceeded):
+                        self._count("timeouts")
+                    raise error
+        finally:
+            # Attempts still running stop at their next callback or tool call.
+            for cancelled in attempts:
+                cancelled.set()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Returns the latency histogram and the counters of the invoker.
+
+        Returns:
+            dict[str, Any]: The latency snapshot, see `LatencyHistogram.snapshot`,
+                and the number of invocations, hedges, hedges that won and
+                invocations that timed out.
+        """
+        with self._lock:
+            counters = dict(self._counters)
+        return {"latency": self._histogram.snapshot(), **counters}
@@ -0,0 +1,390 @@
+import collections
+import threading
+import time
+import typing
+
+import src.server.invocation as sc_invocation
+
+
+# Document data of an item, or None for an item known not to exist.
+ItemData = dict[str, typing.Any] | None
+
+
+class _UserItems:
+    """The cached items of one user."""
+
+    def __init__(self):
+        # Time the complete set of items was loaded, if it is cached.
+        self.listed_at: float | None = None
+        # Data of each document, by document id, with the time it was loaded.
+        self.items: dict[str, tuple[float, ItemData]] = {}
+        # Bumped by each invalidation, so loads started before it are dropped.
+        self.generation = 0
+        # Whether a snapshot listener was started, and the listener once it is.
+        self.watched = False
+        self.watch: typing.Any = None
+        # Whether the listener delivered its first snapshot and keeps the items
+        # up to date.
+        self.synced = False
+
+
+class ItemCache:
+    """
+    A thread-safe read-through cache of the item documents of each user.
+
+    `get_items` and `get_item` answer from the cache while the data is younger
+    than the TTL and load it from Firestore otherwise. Writes from this process
+    call `invalidate`. With `listen=True`, `watch` registers a Firestore
+    `on_snapshot` listener for a user, which keeps the cached items up to date
+    with changes from other processes, so they do not expire while it runs. If
+    the listener stops, for example after a stream error or when credentials
+    expire, the items expire after the TTL again and the next `watch` starts a
+    new listener.
+
+    The cache holds at most `max_items` documents; the least recently used
+    users are evicted first.
+
+    Attributes:
+        hits (int): The number of reads answered from the cache.
+        misses (int): The number of reads that loaded from Firestore.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 300.0,
+        max_items: int = 100_000,
+        listen: bool = False,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes the ItemCache.
+
+        Args:
+            ttl_seconds (float): How long loaded data is used without a listener.
+                Defaults to 5 minutes.
+            max_items (int): The maximum number of documents cached. Defaults to
+                100,000.
+            listen (bool): Whether `watch` registers snapshot listeners. Defaults
+                to False.
+            clock (Callable[[], float]): Returns the current time in seconds.
+        """
+        if max_items <= 0:
+            raise ValueError("max_items must be positive")
+
+        self._ttl_seconds = ttl_seconds
+        self._max_items = max_items
+        self._listen = listen
+        self._clock = clock
+        self._users: collections.OrderedDict[str, _UserItems] = (
+            collections.OrderedDict()
+        )
+        self._size = 0
+        self._lock = threading.Lock()
+        # Age of the data served by each hit.
+        self._staleness = sc_invocation.LatencyHistogram(
+            min_seconds=0.1, max_seconds=24 * 60 * 60
+        )
+        self.hits = 0
+        self.misses = 0
+        self._counters = {
+            "evictions": 0,
+            "invalidations": 0,
+            "snapshot_updates": 0,
+            "listener_stops": 0,
+        }
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns the fraction of reads answered from the cache.
+
+        Returns:
+            float: The hit rate, or 0.0 if there have been no reads.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def _synced(self, user: _UserItems) -> bool:
+        if user.synced and user.watch is not None and not user.watch.is_active:
+            # The listener stopped, so the items expire after the TTL again and
+            # the next `watch` starts a new listener.
+            user.synced = False
+            user.watched = False
+            user.watch = None
+            self._counters["listener_stops"] += 1
+        return user.synced
+
+    def _fresh(self, user: _UserItems, loaded_at: float | None) -> bool:
+        if loaded_at is None:
+            return False
+        return self._synced(user) or self._clock() - loaded_at < self._ttl_seconds
+
+    def _hit(self, user_id: str, user: _UserItems, loaded_at: float):
+        self._users.move_to_end(user_id)
+        self.hits += 1
+        self._staleness.record(self._clock() - loaded_at)
+
+    def get_items(
+        self, user_id: str, load: typing.Callable[[], dict[str, dict[str, typing.Any]]]
+    ) -> dict[str, dict[str, typing.Any]]:
+        """
+        Returns the data of every item of a user.
+
+        Args:
+            user_id (str): The user.
+            load (Callable[[], dict[str, dict[str, Any]]]): Loads the data of
+                every item of the user from Firestore, by document id.
+
+        Returns:
+            dict[str, dict[str, Any]]: The data of each item, by document id.
+        """
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None and self._fresh(user, user.listed_at):
+                self._hit(user_id, user, user.listed_at)
+                return {
+                    doc_id: data
+                    for doc_id, (_, data) in user.items.items()
+                    if data is not None
+                }
+            self.misses += 1
+            generation = self._user(user_id).generation
+
+        loaded_at = self._clock()
+        items = load()
+        with self._lock:
+            user = self._user(user_id)
+            if user.generation == generation:
+                self._replace(
+                    user, {doc_id: (loaded_at, d) for doc_id, d in items.items()}
+                )
+                user.listed_at = loaded_at
+                self._evict()
+        return items
+
+    def get_item(
+        self, user_id: str, doc_id: str, load: typing.Callable[[], ItemData]
+    ) -> ItemData:
+        """
+        Returns the data of one item of a user.
+
+        Args:
+            user_id (str): The user.
+            doc_id (str): The document id of the item.
+            load (Callable[[], ItemData]): Loads the data of the item from
+                Firestore, or returns None if it does not exist.
+
+        Returns:
+            ItemData: The data of the item, or None if it does not exist.
+        """
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is not None:
+                loaded_at, data = user.items.get(doc_id, (user.listed_at, None))
+                if self._fresh(user, loaded_at):
+                    self._hit(user_id, user, loaded_at)
+                    return data
+            self.misses += 1
+            generation = self._user(user_id).generation
+
+        loaded_at = self._clock()
+        data = load()
+        with self._lock:
+            user = self._user(user_id)
+            if user.generation == generation:
+                if doc_id not in user.items:
+                    self._size += 1
+                user.items[doc_id] = (loaded_at, data)
+                self._evict()
+        return data
+
+    def get_many(
+        self,
+        user_id: str,
+        doc_ids: list[str],
+        load: typing.Callable[[list[str]], dict[str, ItemData]],
+    ) -> dict[str, ItemData]:
+        """
+        Returns the data of several items of a user.
+
+        Args:
+            user_id (str): The user.
+            doc_ids (list[str]): The document ids of the items.
+            load (Callable[[list[str]], dict[str, ItemData]]): Loads the data of
+                the given items from Firestore in one request, by document id,
+                with None for items that do not exist.
+
+        Returns:
+            dict[str, ItemData]: The data of each item, by document id, or None
+                if it does not exist.
+        """
+        found = {}
+        with self._lock:
+            user = self._user(user_id)
+            for doc_id in doc_ids:
+                loaded_at, data = user.items.get(doc_id, (user.listed_at, None))
+                if self._fresh(user, loaded_at):
+                    self._hit(user_id, user, loaded_at)
+                    found[doc_id] = data
+                else:
+                    self.misses += 1
+            generation = user.generation
+
+        missing = [doc_id for doc_id in dict.fromkeys(doc_ids) if doc_id not in found]
+        if not missing:
+            return found
+        loaded_at = self._clock()
+        loaded = load(missing)
+        with self._lock:
+            user = self._user(user_id)
+            if user.generation == generation:
+                for doc_id in missing:
+                    if doc_id not in user.items:
+                        self._size += 1
+                    user.items[doc_id] = (loaded_at, loaded.get(doc_id))
+                self._evict()
+        return {**found, **{doc_id: loaded.get(doc_id) for doc_id in missing}}
+
+    def invalidate(self, user_id: str, doc_id: str):
+        """
+        Drops a written item, and the complete listing of its user, from the cache.
+
+        Args:
+            user_id (str): The user.
+            doc_id (str): The document id of the item.
+        """
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return
+            self._counters["invalidations"] += 1
+            user.generation += 1
+            if user.items.pop(doc_id, None) is not None:
+                self._size -= 1
+            # A listener adds the write back; until then the listing is partial.
+            user.listed_at = None
+
+    def watch(self, user_id: str, query: typing.Any):
+        """
+        Keeps the items of a user up to date with a snapshot listener.
+
+        Does nothing unless the cache was created with `listen=True`, or if the
+        user is already watched.
+
+        Args:
+            user_id (str): The user.
+            query (firestore.Query): The query for the items of the user.
+        """
+        if not self._listen:
+            return
+        with self._lock:
+            user = self._user(user_id)
+            if user.watched:
+                return
+            user.watched = True
+
+        first_snapshot = threading.Event()
+
+        def on_snapshot(docs: list, changes: list, read_time: typing.Any):
+            if not first_snapshot.is_set():
+                # The first snapshot holds every item of the user.
+                first_snapshot.set()
+                self.apply_snapshot(
+                    user_id, {doc.id: doc.to_dict() for doc in docs}, complete=True
+                )
+                return
+            self.apply_snapshot(
+                user_id,
+                {
+                    change.document.id: (
+                        None
+                        if change.type.name == "REMOVED"
+                        else change.document.to_dict()
+                    )
+                    for change in changes
+                },
+            )
+
+        watch = query.on_snapshot(on_snapshot)
+        with self._lock:
+            if self._users.get(user_id) is user:
+                user.watch = watch
+                return
+        # The user was evicted while the listener started.
+        watch.unsubscribe()
+
+    def apply_snapshot(
+        self, user_id: str, changes: dict[str, ItemData], complete: bool = False
+    ):
+        """
+        Applies the changes reported by a snapshot listener.
+
+        Args:
+            user_id (str): The user.
+            changes (dict[str, ItemData]): The new data of each changed item, by
+                document id, or None for removed items.
+            complete (bool): Whether the changes hold every item of the user, as
+                the first snapshot of a listener does. Defaults to False.
+        """
+        now = self._clock()
+        with self._lock:
+            user = self._users.get(user_id)
+            if user is None:
+                return
+            self._counters["snapshot_updates"] += 1
+            user.generation += 1
+            if complete:
+                self._replace(user, {})
+                user.listed_at = now
+                user.synced = True
+            for doc_id, data in changes.items():
+                if doc_id not in user.items:
+                    self._size += 1
+                user.items[doc_id] = (now, data)
+            if user.listed_at is not None:
+                user.listed_at = now
+            self._evict()
+
+    def _user(self, user_id: str) -> _UserItems:
+        user = self._users.get(user_id)
+        if user is None:
+            user = self._users[user_id] = _UserItems()
+        self._users.move_to_end(user_id)
+        return user
+
+    def _replace(self, user: _UserItems, items: dict[str, tuple[float, ItemData]]):
+        self._size += len(items) - len(user.items)
+        user.items = items
+
+    def _evict(self):
+        # The most recently used user is kept even if it is larger than the cache.
+        while self._size > self._max_items and len(self._users) > 1:
+            _, user = self._users.popitem(last=False)
+            self._size -= len(user.items)
+            self._counters["evictions"] += 1
+            if user.watch is not None:
+                user.watch.unsubscribe()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Returns the metrics of the cache.
+
+        Returns:
+            dict[str, Any]: The hits, misses and hit rate, the number of cached
+                users and items, the evictions, invalidations, snapshot updates
+                and stopped listeners, and the time since the data served by
+                hits was loaded or last changed, see `LatencyHistogram.snapshot`.
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hit_rate,
+                "users": len(self._users),
+                "items": self._size,
+                **self._counters,
+                "staleness": self._staleness.snapshot(),
+            }
@@ -0,0 +1,285 @@
+import abc
+import datetime
+import pydantic
+import typing
+
+import src.data_models.item as sc_item
+import src.data_models.quantity as sc_quantity
+import src.data_models.recipe as sc_recipe
+import src.server.recipe_repair as sc_recipe_repair
+import src.utils.types as sc_types
+
+
+# Relative slack for rounding errors when an item is used up.
+_USED_UP_TOLERANCE = 1e-6
+
+
+class ItemChanges(pydantic.BaseModel):
+    """The changes to the items of a user since a sync token.
+
+    Attributes:
+        items (list[sc_item.Item]): The items added or modified since the token.
+        deleted (list[str]): The names of the items deleted since the token.
+        token (str | None): The token to pass to the next `get_changes_since`
+            call, or None if the user has no items yet.
+    """
+
+    items: list[sc_item.Item]
+    deleted: list[str]
+    token: str | None
+
+
+def consume_ingredients(
+    recipe: sc_recipe.Recipe, items: dict[str, sc_item.Item | None]
+) -> dict[str, sc_item.Item | None]:
+    """Compute the items left after cooking a recipe.
+
+    Each ingredient quantity is converted to the unit its item is stored in,
+    and the quantities of ingredients using the same item are added up. Each
+    stored item is one lot, so an ingredient uses up its item first in, first
+    out by construction. Pantry staples that are not stored are skipped.
+
+    Args:
+        recipe: The recipe, whose ingredients are named like the items.
+        items: The item of each ingredient name, or None if it is missing.
+
+    Returns:
+        The updated item of each ingredient name, or None if it is used up.
+        Skipped staples are left out.
+
+    Raises:
+        ValueError: If an item is missing or short, or an ingredient unit
+            cannot be converted to the unit of its item.
+    """
+    required: dict[str, float] = {}
+    for ingredient in recipe.ingredients:
+        item = items.get(ingredient.name)
+        if item is None and sc_recipe.is_staple(ingredient.name):
+            continue
+        if item is None:
+            raise ValueError(f"{ingredient.name} is not in storage.")
+        unit = sc_recipe_repair.normalize_unit(ingredient.unit)
+        if unit is None:
+            raise ValueError(
+                f"{ingredient.name} has the unknown unit {ingredient.unit!r}."
+            )
+        try:
+            amount = sc_quantity.convert_unit(
+                sc_quantity.Quantity(quantity=ingredient.quantity, unit=unit),
+                item.quantity.unit,
+            )
+        except KeyError:
+            raise ValueError(
+                f"{ingredient.name} is measured in {unit.value}, which cannot be "
+                f"converted to the {item.quantity.unit.value} it is stored in."
+            )
+        required[ingredient.name] = required.get(ingredient.name, 0.0) + amount
+
+    updated = {}
+    for name, amount in required.items():
+        item = items[name]
+        available = item.quantity.quantity
+        left = available - amount
+        slack = _USED_UP_TOLERANCE * max(available, amount)
+        if left < -slack:
+            raise ValueError(
+                f"Not enough {name}: {amount:g} {item.quantity.unit.value} needed, "
+                f"{available:g} available."
+            )
+        if left <= slack:
+            updated[name] = None
+        else:
+            updated[name] = item.model_copy(
+                update={"quantity": item.quantity.model_copy(update={"quantity": left})}
+            )
+    return updated
+
+
+def expiration_cutoff(within_days: int, limit: int) -> datetime.date:
+    """Return the latest expiration date of the items expiring within some days.
+
+    Args:
+        within_days: The number of days from today.
+        limit: The maximum number of items, which must be positive.
+
+    Returns:
+        The latest expiration date to include
+    """
+    if within_days < 0:
+        raise ValueError("within_days must not be negative")
+    if limit <= 0:
+        raise ValueError("limit must be positive")
+    # Items compute their expiration dates from the local date too.
+    return datetime.datetime.now().date() + datetime.timedelta(days=within_days)
+
+
+class ItemStorage(abc.ABC):
+    """The interface of the stores that keep the items of one user.
+
+    `ItemFireStore` stores the items in Cloud Firestore and `SqliteItemStore`
+    in a local SQLite database, so either can be used wherever items are read
+    or written.
+
+    Attributes:
+        user_id: The user whose items are stored.
+    """
+
+    user_id: str
+
+    @abc.abstractmethod
+    def add_items(self, items: list[sc_item.Item]):
+        """Add or replace multiple items.
+
+        Args:
+            items: List of Item objects to store
+        """
+
+    @abc.abstractmethod
+    def get_items(self) -> list[sc_item.Item]:
+        """Retrieve all items.
+
+        Returns:
+            List of Item objects
+        """
+
+    @abc.abstractmethod
+    def get_item(self, item_name: str) -> sc_item.Item:
+        """Retrieve a specific item by name.
+
+        Args:
+            item_name: Name of the item to retrieve
+
+        Returns:
+            Item object if found
+
+        Raises:
+            KeyError: If item is not found
+        """
+
+    def get_items_by_names(self, item_names: list[str]) -> list[sc_item.Item | None]:
+        """Retrieve specific items by name.
+
+        Stores override this to read all the items in one request.
+
+        Args:
+            item_names: Names of the items to retrieve
+
+        Returns:
+            The item of each name, in the order of the names, or None for the
+            names of missing items
+        """
+        items = []
+        for item_name in item_names:
+            try:
+                items.append(self.get_item(item_name))
+            except KeyError:
+                items.append(None)
+        return items
+
+    def get_expiring_items(
+        self,
+        within_days: int,
+        storage: sc_types.StorageType | None = None,
+        limit: int = 100,
+    ) -> list[sc_item.Item]:
+        """Retrieve the items that expire within `within_days` days.
+
+        Items that have already expired are included. Stores override this to
+        filter the items with an index instead of reading them all.
+
+        Args:
+            within_days: The number of days from today. 0 returns the items
+                that expire today or earlier.
+            storage: Optional storage type of the items. Defaults to all.
+            limit: The maximum number of items. Defaults to 100.
+
+        Returns:
+            List of Item objects, ordered by expiration date
+        """
+        cutoff = expiration_cutoff(within_days, limit)
+        items = sorted(
+            (
+                item
+                for item in self.get_items()
+                if item.expiration_date <= cutoff
+                and (storage is None or item.storage == storage)
+            ),
+            key=lambda item: (item.expiration_date, item.name),
+        )
+        return items[:limit]
+
+    @abc.abstractmethod
+    def update_item(self, item: sc_item.Item):
+        """Add or replace an item.
+
+        Args:
+            item: Item object to update
+        """
+
+    @abc.abstractmethod
+    def delete_item(self, item_name: str):
+        """Delete an item. Deleting a missing item does nothing.
+
+        Args:
+            item_name: Name of the item to delete
+        """
+
+    @abc.abstractmethod
+    def cook_recipe(self, recipe: sc_recipe.Recipe) -> list[sc_item.Item | None]:
+        """Use up the ingredients of a recipe from storage, atomically.
+
+        Either every ingredient is taken from storage or, if one is missing or
+        short, none is. Items that are used up are deleted. Pantry staples that
+        are not stored are skipped.
+
+        Args:
+            recipe: The recipe, whose ingredients are named like the items.
+
+        Returns:
+            The updated item of each ingredient, in the order of the
+            ingredients, or None for items that were used up and skipped
+            staples
+
+        Raises:
+            ValueError: If an item is missing or short, or an ingredient unit
+                cannot be converted to the unit of its item.
+        """
+
+    @abc.abstractmethod
+    def get_changes_since(self, token: str | None = None) -> ItemChanges:
+        """Retrieve the items added, modified or deleted since a sync token.
+
+        Deleted items are kept as tombstones so their deletion can be reported.
+
+        Args:
+            token: The token returned by the previous call. Defaults to None,
+                which returns every item.
+
+        Returns:
+            The changes and the token for the next call
+        """
+
+    def iter_items(
+        self, page_size: int = 300, fields: list[str] | None = None
+    ) -> typing.Iterator[sc_item.Item]:
+        """Iterate over all items.
+
+        Stores that can read the items page by page override this to keep only
+        one page in memory.
+
+        Args:
+            page_size: The number of items read at a time. Defaults to 300.
+            fields: Optional fields to read, for stores that support
+                projections. Defaults to all fields.
+
+        Yields:
+            Item objects
+        """
+        yield from self.get_items()
+
+    def flush(self):
+        """Make every earlier write durable. Does nothing by default."""
+
+    def close(self):
+        """Flush and release the resources of the store."""
+        self.flush()
@@ -0,0 +1,404 @@
+import enum
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+import typing
+
+if typing.TYPE_CHECKING:
+    import httpx
+
+
+# Scheduler shared by all agents unless they are given their own.
+_default_scheduler: "LLMScheduler | None" = None
+_default_scheduler_lock = threading.Lock()
+
+
+class Priority(enum.IntEnum):
+    """
+    Enumeration of scheduling priorities. Lower values are served first.
+
+    Attributes:
+        INTERACTIVE: Requests a user is waiting on, such as recipe suggestions.
+        BATCH: Background work, such as receipt backfills.
+    """
+
+    INTERACTIVE = 0
+    BATCH = 1
+
+
+class TokenBucket:
+    """
+    A token bucket that refills continuously up to its capacity.
+
+    The bucket may be debited below zero when a request turns out to cost more
+    than was reserved for it; it then stays closed until it refills.
+    """
+
+    def __init__(
+        self,
+        rate_per_minute: float,
+        capacity: float | None = None,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes the TokenBucket. The bucket starts full.
+
+        Args:
+            rate_per_minute (float): How many tokens are added per minute.
+            capacity (float | None): The maximum number of tokens held.
+                Defaults to `rate_per_minute`.
+            clock (Callable[[], float]): Returns the current time in seconds.
+        """
+        if rate_per_minute <= 0:
+            raise ValueError("rate_per_minute must be positive")
+
+        self._rate_per_second = rate_per_minute / 60
+        self._capacity = capacity if capacity is not None else rate_per_minute
+        self._clock = clock
+        self._tokens = self._capacity
+        self._updated_at = clock()
+        self._paused_until = 0.0
+
+    @property
+    def tokens(self) -> float:
+        """
+        Returns the number of tokens currently available.
+
+        Returns:
+            float: The available tokens, which may be negative.
+        """
+        self._refill()
+        return self._tokens
+
+    def _refill(self):
+        now = self._clock()
+        start = max(self._updated_at, self._paused_until)
+        if now > start:
+            self._tokens = min(
+                self._capacity, self._tokens + (now - start) * self._rate_per_second
+            )
+        self._updated_at = now
+
+    def time_until(self, amount: float) -> float:
+        """
+        Returns how long until `amount` tokens are available.
+
+        Args:
+            amount (float): The number of tokens needed.
+
+        Returns:
+            float: The number of seconds to wait, or 0.0 if available now.
+        """
+        self._refill()
+        pause = max(0.0, self._paused_until - self._clock())
+        missing = max(0.0, amount - self._tokens)
+        return pause + missing / self._rate_per_second
+
+    def consume(self, amount: float):
+        """
+        Removes tokens from the bucket, possibly taking it below zero.
+
+        Args:
+            amount (float): The number of tokens to remove.
+        """
+        self._refill()
+        self._tokens = min(self._capacity, self._tokens - amount)
+
+    def pause(self, seconds: float):
+        """
+        Stops the bucket from refilling and empties it for `seconds`.
+
+        Args:
+            seconds (float): How long to pause for.
+        """
+        self._refill()
+        self._tokens = min(self._tokens, 0.0)
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+class LLMScheduler:
+    """
+    Process-wide scheduler for language model requests.
+
+    Requests wait in a priority queue until both the requests-per-minute and the
+    tokens-per-minute buckets allow them through. Token usage is reserved up front
+    and corrected once the response reports actual usage. A 429 from the provider
+    pauses both buckets so that no other agent keeps hitting the limit.
+
+    Failed requests are sent again by the HTTP clients of the scheduler, after
+    waiting for the scheduler like new requests. The OpenAI client's own
+    retries are disabled, as they would bypass it.
+
+    Attributes:
+        rate_limited_responses (int): The number of 429 responses seen.
+        max_retries (int): The number of times a failed request is sent again.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float = 500,
+        tokens_per_minute: float = 200_000,
+        request_burst: float | None = None,
+        estimated_tokens_per_request: int = 2_000,
+        default_backoff_seconds: float = 1.0,
+        max_retries: int = 2,
+        clock: typing.Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initializes the LLMScheduler.
+
+        Args:
+            requests_per_minute (float): The request limit. Defaults to 500.
+            tokens_per_minute (float): The token limit. Defaults to 200,000.
+            request_burst (float | None): How many requests may be sent at once.
+                Defaults to `requests_per_minute`.
+            estimated_tokens_per_request (int): Tokens reserved for each request
+                until its actual usage is known. Defaults to 2,000.
+            default_backoff_seconds (float): How long to pause after a 429 that has
+                no Retry-After header. Defaults to 1 second.
+            max_retries (int): The number of times a request that was rate
+                limited or failed on the server is sent again. Defaults to 2,
+                like the OpenAI client.
+            clock (Callable[[], float]): Returns the current time in seconds.
+        """
+        self._requests = TokenBucket(requests_per_minute, request_burst, clock=clock)
+        self._tokens = TokenBucket(tokens_per_minute, clock=clock)
+        self._estimated_tokens_per_request = estimated_tokens_per_request
+        self._default_backoff_seconds = default_backoff_seconds
+        self._clock = clock
+        self._condition = threading.Condition()
+        self._queue: list[tuple[int, int]] = []
+        self._sequence = itertools.count()
+        self._wait_stats = {
+            priority: {
+                "requests": 0,
+                "total_wait_seconds": 0.0,
+                "max_wait_seconds": 0.0,
+            }
+            for priority in Priority
+        }
+        self._http_clients: dict[
+            Priority, tuple["httpx.Client", "httpx.AsyncClient"]
+        ] = {}
+        self.rate_limited_responses = 0
+        self.max_retries = max_retries
+
+    @property
+    def queue_depth(self) -> int:
+        """
+        Returns the number of requests waiting to be scheduled.
+
+        Returns:
+            int: The queue depth.
+        """
+        with self._condition:
+            return len(self._queue)
+
+    def _wait_time(self) -> float:
+        return max(
+            self._requests.time_until(1),
+            # Allow a request as soon as the token bucket is positive again; its
+            # reservation may take the bucket below zero.
+            self._tokens.time_until(1e-9),
+        )
+
+    def acquire(self, priority: Priority = Priority.INTERACTIVE, blocking: bool = True):
+        """
+        Waits until a request of the given priority may be sent.
+
+        Args:
+            priority (Priority): The priority of the request.
+            blocking (bool): If False, return immediately instead of waiting.
+
+        Returns:
+            bool: True if the request may be sent, False otherwise.
+        """
+        enqueued_at = self._clock()
+        ticket = (int(priority), next(self._sequence))
+
+        with self._condition:
+            heapq.heappush(self._queue, ticket)
+            self._condition.notify_all()
+            try:
+                while True:
+                    if self._queue[0] == ticket:
+                        wait_time = self._wait_time()
+                        if wait_time <= 0:
+                            break
+                    else:
+                        wait_time = None
+
+                    if not blocking:
+                        return False
+                    self._condition.wait(timeout=wait_time)
+
+                self._requests.consume(1)
+                self._tokens.consume(self._estimated_tokens_per_request)
+            finally:
+                self._queue.remove(ticket)
+                heapq.heapify(self._queue)
+                self._condition.notify_all()
+
+            waited = self._clock() - enqueued_at
+            stats = self._wait_stats[priority]
+            stats["requests"] += 1
+            stats["total_wait_seconds"] += waited
+            stats["max_wait_seconds"] = max(stats["max_wait_seconds"], waited)
+            return True
+
+    def record_usage(self, total_tokens: int):
+        """
+        Corrects the token reservation of a completed request.
+
+        Args:
+            total_tokens (int): The tokens the request actually used.
+        """
+        with self._condition:
+            self._tokens.consume(total_tokens - self._estimated_tokens_per_request)
+            self._condition.notify_all()
+
+    def backoff(self, seconds: float | None = None):
+        """
+        Pauses all requests after the provider reported a rate limit.
+
+        Args:
+            seconds (float | None): How long to pause. Defaults to
+                `default_backoff_seconds`.
+        """
+        seconds = self._default_backoff_seconds if seconds is None else seconds
+        logging.warning(f"OpenAI rate limit reached, pausing for {seconds:.2f}s")
+        with self._condition:
+            self.rate_limited_responses += 1
+            self._requests.pause(seconds)
+            self._tokens.pause(seconds)
+            self._condition.notify_all()
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Returns queue depth and wait time statistics for each priority.
+
+        Returns:
+            dict[str, Any]: The scheduler statistics.
+        """
+        with self._condition:
+            wait_stats = {}
+            for priority, stats in self._wait_stats.items():
+                requests = stats["requests"]
+                wait_stats[priority.name.lower()] = {
+                    "requests": requests,
+                    "mean_wait_seconds": (
+                        stats["total_wait_seconds"] / requests if requests else 0.0
+                    ),
+                    "max_wait_seconds": stats["max_wait_seconds"],
+                }
+            return {
+                "queue_depth": len(self._queue),
+                "rate_limited_responses": self.rate_limited_responses,
+                "wait": wait_stats,
+            }
+
+    def report_response(self, response: "httpx.Response") -> bool:
+        """
+        Pauses all requests if a model response reports a rate limit.
+
+        Args:
+            response (httpx.Response): The response.
+
+        Returns:
+            bool: Whether the request is worth sending again: it was rate
+                limited, timed out, conflicted or failed on the server, as the
+                OpenAI client decides.
+        """
+        status = response.status_code
+        if status == 429:
+            retry_after = response.headers.get("retry-after")
+            try:
+                seconds = float(retry_after) if retry_after is not None else None
+            except ValueError:
+                seconds = None
+            self.backoff(seconds)
+        return status in (408, 409, 429) or status >= 500
+
+    def http_clients(
+        self, priority: Priority = Priority.INTERACTIVE
+    ) -> tuple["httpx.Client", "httpx.AsyncClient"]:
+        """
+        Returns the HTTP clients that retry failed requests through the scheduler.
+
+        Args:
+            priority (Priority): The priority of the retried requests.
+
+        Returns:
+            tuple[httpx.Client, httpx.AsyncClient]: The shared synchronous and
+                asynchronous clients of the priority.
+        """
+        import httpx
+
+        import src.server.llm_scheduler_adapters as sc_llm_scheduler_adapters
+
+        with self._condition:
+            if priority not in self._http_clients:
+                self._http_clients[priority] = (
+                    httpx.Client(
+                        transport=sc_llm_scheduler_adapters.SchedulerTransport(
+                            self, priority
+                        )
+                    ),
+                    httpx.AsyncClient(
+                        transport=sc_llm_scheduler_adapters.AsyncSchedulerTransport(
+                            self, priority
+                        )
+                    ),
+                )
+            return self._http_clients[priority]
+
+    def chat_model_kwargs(
+        self, priority: Priority = Priority.INTERACTIVE
+    ) -> dict[str, typing.Any]:
+        """
+        Returns the ChatOpenAI keyword arguments that route a model through the
+        scheduler.
+
+        Args:
+            priority (Priority): The priority of the model's requests.
+
+        Returns:
+            dict[str, Any]: Keyword arguments for ChatOpenAI.
+        """
+        # LangChain is only imported by agents that use it.
+        import src.server.llm_scheduler_adapters as sc_llm_scheduler_adapters
+
+        http_client, http_async_client = self.http_clients(priority)
+        return {
+            "rate_limiter": sc_llm_scheduler_adapters.SchedulerRateLimiter(
+                self, priority
+            ),
+            "callbacks": [sc_llm_scheduler_adapters.UsageCallbackHandler(self)],
+            "http_client": http_client,
+            "http_async_client": http_async_client,
+            # The HTTP clients retry through the scheduler instead.
+            "max_retries": 0,
+        }
+
+
+def get_default_scheduler() -> LLMScheduler:
+    """
+    Returns the scheduler shared by all agents in this process.
+
+    The limits are read from the OPENAI_REQUESTS_PER_MINUTE and
+    OPENAI_TOKENS_PER_MINUTE environment variables, if they are set.
+
+    Returns:
+        LLMScheduler: The shared scheduler.
+    """
+    global _default_scheduler
+    with _default_scheduler_lock:
+        if _default_scheduler is None:
+            _default_scheduler = LLMScheduler(
+                requests_per_minute=float(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 500)),
+                tokens_per_minute=float(os.getenv("OPENAI_TOKENS_PER_MINUTE", 200_000)),
+            )
+        return _default_scheduler
@@ -0,0 +1,107 @@
+import asyncio
+import typing
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+from langchain_core.rate_limiters import BaseRateLimiter
+
+import src.server.llm_scheduler as sc_llm_scheduler
+
+
+class SchedulerRateLimiter(BaseRateLimiter):
+    """Adapts an LLMScheduler to LangChain's rate limiter interface."""
+
+    def __init__(
+        self,
+        scheduler: sc_llm_scheduler.LLMScheduler,
+        priority: sc_llm_scheduler.Priority,
+    ):
+        self._scheduler = scheduler
+        self._priority = priority
+
+    def acquire(self, *, blocking: bool = True) -> bool:
+        return self._scheduler.acquire(self._priority, blocking=blocking)
+
+    async def aacquire(self, *, blocking: bool = True) -> bool:
+        return await asyncio.to_thread(
+            self._scheduler.acquire, self._priority, blocking
+        )
+
+
+class SchedulerTransport(httpx.BaseTransport):
+    """
+    Sends failed model requests again, once the LLMScheduler lets them through.
+    """
+
+    def __init__(
+        self,
+        scheduler: sc_llm_scheduler.LLMScheduler,
+        priority: sc_llm_scheduler.Priority,
+    ):
+        self._scheduler = scheduler
+        self._priority = priority
+        self._transport = httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self._scheduler.max_retries + 1):
+            if attempt > 0:
+                self._scheduler.acquire(self._priority)
+            response = self._transport.handle_request(request)
+            retry = self._scheduler.report_response(response)
+            if not retry or attempt == self._scheduler.max_retries:
+                return response
+            response.close()
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncSchedulerTransport(httpx.AsyncBaseTransport):
+    """
+    Sends failed asynchronous model requests again, once the LLMScheduler lets
+    them through.
+    """
+
+    def __init__(
+        self,
+        scheduler: sc_llm_scheduler.LLMScheduler,
+        priority: sc_llm_scheduler.Priority,
+    ):
+        self._scheduler = scheduler
+        self._priority = priority
+        self._transport = httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        for attempt in range(self._scheduler.max_retries + 1):
+            if attempt > 0:
+                await asyncio.to_thread(self._scheduler.acquire, self._priority)
+            response = await self._transport.handle_async_request(request)
+            retry = self._scheduler.report_response(response)
+            if not retry or attempt == self._scheduler.max_retries:
+                return response
+            await response.aclose()
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class UsageCallbackHandler(BaseCallbackHandler):
+    """Reports the token usage of each model response to an LLMScheduler."""
+
+    def __init__(self, scheduler: sc_llm_scheduler.LLMScheduler):
+        self._scheduler = scheduler
+
+    def on_llm_end(self, response: LLMResult, **kwargs: typing.Any):
+        token_usage = (response.llm_output or {}).get("token_usage") or {}
+        total_tokens = token_usage.get("total_tokens")
+        if total_tokens is None:
+            # Streaming responses report usage on the message instead.
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage = getattr(message, "usage_metadata", None)
+                    if usage:
+                        total_tokens = (total_tokens or 0) + usage["total_tokens"]
+        if total_tokens is not None:
+            self._scheduler.record_usage(total_tokens)
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+import typing
+
+# LangChain takes seconds to import, so it is only loaded once an agent is created.
+if typing.TYPE_CHECKING:
+    from langchain.agents import AgentExecutor
+    from langchain_core.callbacks import BaseCallbackHandler
+
+
+T = typing.TypeVar("T")
+
+# Models tried by a cascade, cheapest first.
+DEFAULT_CASCADE_TIERS = ["gpt-4o-mini", "gpt-4o"]
+
+
+class ModelCascade(typing.Generic[T]):
+    """
+    Runs a request on the cheapest model first and escalates on failure.
+
+    Each tier is a callable that runs the request on one model and returns its raw
+    output. The output is checked locally by a parse function; only requests whose
+    output fails the check are re-run on the next, stronger tier. The check should
+    only reject output that a stronger model would do better on, such as output
+    that is not valid JSON or does not match the schema.
+    """
+
+    def __init__(self, tiers: list[tuple[str, typing.Callable[..., str]]]):
+        """
+        Initializes the ModelCascade.
+
+        Args:
+            tiers (list[tuple[str, Callable[..., str]]]): Pairs of model name and
+                a function that runs the request on that model, cheapest first.
+                The function is called with the inputs of the request and the
+                keyword arguments passed to `run`.
+        """
+        if not tiers:
+            raise ValueError("A cascade needs at least one tier.")
+
+        self._tiers = tiers
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._escalations = 0
+        self._tier_stats = {
+            name: {"calls": 0, "failures": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            for name, _ in tiers
+        }
+
+    def run(
+        self, inputs: dict, parse: typing.Callable[[str], T], **kwargs: typing.Any
+    ) -> T:
+        """
+        Runs a request through the cascade.
+
+        Args:
+            inputs (dict): The inputs passed to each tier.
+            parse (Callable[[str], T]): Parses and validates a tier's output. Raises
+                ValueError if the output is not acceptable.
+            **kwargs (Any): Keyword arguments passed to each tier.
+
+        Returns:
+            T: The parsed output of the first tier that passed validation.
+
+        Raises:
+            ValueError: If the output of every tier failed validation.
+        """
+        with self._lock:
+            self._requests += 1
+
+        error = None
+        for index, (name, run_tier) in enumerate(self._tiers):
+            if index > 0:
+                logging.info(f"Escalating to {name}: {error}")
+                if index == 1:
+                    with self._lock:
+                        self._escalations += 1
+
+            start = time.perf_counter()
+            try:
+                result = parse(run_tier(inputs, **kwargs))
+            except ValueError as e:
+                error = e
+                self._record(name, time.perf_counter() - start, failed=True)
+                continue
+
+            self._record(name, time.perf_counter() - start, failed=False)
+            return result
+
+        raise error
+
+    def _record(self, name: str, seconds: float, failed: bool):
+        with self._lock:
+            stats = self._tier_stats[name]
+            stats["calls"] += 1
+            stats["failures"] += int(failed)
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def stats(self) -> dict[str, typing.Any]:
+        """
+        Returns the escalation rate and the latency of each tier.
+
+        Returns:
+            dict[str, Any]: The cascade statistics.
+        """
+        with self._lock:
+            tiers = {}
+            for name, stats in self._tier_stats.items():
+                calls = stats["calls"]
+                tiers[name] = {
+                    "calls": calls,
+                    "failures": stats["failures"],
+                    "mean_latency_seconds": (
+                        stats["total_seconds"] / calls if calls else 0.0
+                    ),
+                    "max_latency_seconds": stats["max_seconds"],
+                }
+            return {
+                "requests": self._requests,
+                "escalations": self._escalations,
+                "escalation_rate": (
+                    self._escalations / self._requests if self._requests else 0.0
+                ),
+                "tiers": tiers,
+            }
+
+
+def agent_cascade(
+    models: list[str], create_executor: typing.Callable[[str], "AgentExecutor"]
+) -> ModelCascade:
+    """
+    Builds a cascade of agent executors, one per model.
+
+    Args:
+        models (list[str]): The models of the tiers, cheapest first.
+        create_executor (Callable[[str], AgentExecutor]): Creates the executor of
+            the agent backed by a model.
+
+    Returns:
+        ModelCascade: The cascade. Each tier runs its executor and returns the
+            agent's output. Tiers take an optional `callbacks` keyword argument,
+            the callback handlers of the run, which default to a handler that
+            stops it once the invocation passes its deadline.
+    """
+    import src.server.callbacks as sc_callbacks
+
+    tiers = []
+    for model in models:
+        executor = create_executor(model)
+
+        def run_tier(
+            inputs: dict,
+            callbacks: list["BaseCallbackHandler"] | None = None,
+            executor: "AgentExecutor" = executor,
+        ) -> str:
+            if callbacks is None:
+                callbacks = [sc_callbacks.CancellationCallbackHandler()]
+            return executor.invoke(inputs, config={"callbacks": callbacks})["output"]
+
+        tiers.append((model, run_tier))
+    return ModelCascade(tiers)
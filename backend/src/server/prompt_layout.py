@@ -0,0 +1,102 @@
+import enum
+import hashlib
+
+
+# Bump whenever the static part of a prompt changes, so that prompts, and the
+# provider caches keyed on them, of different versions are never mixed up.
+PROMPT_VERSION = 1
+
+
+class PromptLayout(enum.Enum):
+    """
+    Enumeration of the ways an agent prompt is laid out.
+
+    Attributes:
+        SPLIT: One system message per instruction, with the format instructions
+            filled in as a prompt variable.
+        CACHED: All static content in a single versioned system message that is
+            byte-identical across calls, so that providers can reuse it from their
+            prompt cache, followed by the changing content.
+    """
+
+    SPLIT = "split"
+    CACHED = "cached"
+
+
+def static_prompt(
+    name: str, instructions: list[str], format_instructions: str | None = None
+) -> str:
+    """
+    Joins the static content of a prompt into the text of its system message.
+
+    Args:
+        name (str): The name of the prompt, such as "create_recipe".
+        instructions (list[str]): The instructions of the prompt.
+        format_instructions (str | None): Optional output format instructions,
+            placed last.
+
+    Returns:
+        str: The system message, starting with the name and version of the prompt.
+    """
+    parts = [f"Prompt: {name} v{PROMPT_VERSION}", *instructions]
+    if format_instructions is not None:
+        parts.append(format_instructions)
+    return "\n\n".join(parts)
+
+
+def prompt_key(name: str, static_text: str) -> str:
+    """
+    Returns a key that identifies the static content of a prompt.
+
+    Providers that route requests by a cache key send requests with the same
+    key to the same cache.
+
+    Args:
+        name (str): The name of the prompt.
+        static_text (str): The static content, see `static_prompt`.
+
+    Returns:
+        str: The name and version of the prompt and a digest of its content.
+    """
+    digest = hashlib.sha256(static_text.encode()).hexdigest()[:12]
+    return f"souchef-{name}-v{PROMPT_VERSION}-{digest}"
+
+
+def _escape_braces(text: str) -> str:
+    # Prompt templates treat braces as variables.
+    return text.replace("{", "{{").replace("}", "}}")
+
+
+def prompt_messages(
+    name: str,
+    instructions: list[str],
+    human: str | list,
+    layout: PromptLayout,
+    format_instructions: str | None = None,
+) -> list[tuple]:
+    """
+    Builds the messages of an agent prompt template in the given layout.
+
+    Args:
+        name (str): The name of the prompt.
+        instructions (list[str]): The static instructions of the prompt.
+        human (str | list): The template of the human message, with the content
+            that changes between calls.
+        layout (PromptLayout): The layout of the messages.
+        format_instructions (str | None): Optional output format instructions.
+            With the SPLIT layout they are passed as the `format_instructions`
+            variable instead.
+
+    Returns:
+        list[tuple]: (role, template) messages for a ChatPromptTemplate, without
+            the agent scratchpad.
+    """
+    if layout == PromptLayout.CACHED:
+        text = static_prompt(name, instructions, format_instructions)
+        return [("system", _escape_braces(text)), ("human", human)]
+
+    messages = [("system", instruction) for instruction in instructions]
+    if format_instructions is not None:
+        messages.append(("system", "{format_instructions}"))
+    messages.append(("human", human))
+    return messages
@@ -0,0 +1,378 @@
+import datetime
+import difflib
+import io
+import json
+import os
+import re
+import threading
+
+import pydantic
+
+import src.data_models.item as sc_item
+import src.data_models.quantity as sc_quantity
+import src.data_models.receipt as sc_receipt
+import src.utils.types as sc_types
+
+
+# Lines that carry no purchased item.
+_SKIPPED_LINE_PATTERN = re.compile(
+    r"\b(sub\s*total|total|tax|balance|change|cash|visa|mastercard|amex|debit|"
+    r"credit|tender|savings|discount|coupon|points|member|approved|auth)\b",
+    re.IGNORECASE,
+)
+# "BANANAS ORGANIC   1.99 F" -> name, price and an optional tax flag.
+_PRICE_LINE_PATTERN = re.compile(
+    r"^(?P<name>.*?[A-Za-z].*?)\s+-?\$?(?P<price>\d+\.\d{2})(?:\s+[A-Z]{1,2})?$"
+)
+# "1.25 lb @ 2.99 /lb" -> a weighed quantity for the previous line.
+_WEIGHT_LINE_PATTERN = re.compile(
+    r"^(?P<quantity>\d+(?:\.\d+)?)\s*(?P<unit>lb|lbs|kg|g|oz)\s*@",
+    re.IGNORECASE,
+)
+# "2 @ 1.99" -> a count for the previous line.
+_COUNT_LINE_PATTERN = re.compile(r"^(?P<count>\d+)\s*@\s*\$?\d+\.\d{2}")
+
+# Confidence of lines matched against a merchant template.
+EXACT_MATCH_CONFIDENCE = 0.95
+UNMATCHED_CONFIDENCE = 0.3
+
+
+def normalize_item_name(name: str) -> str:
+    """
+    Normalizes an item name so that receipt and catalog spellings compare equal.
+
+    Args:
+        name (str): The item name.
+
+    Returns:
+        str: The normalized name.
+    """
+    name = name.lower().replace("'", "")
+    return " ".join(re.findall(r"[a-z0-9]+", name))
+
+
+class ParsedReceiptLine(pydantic.BaseModel):
+    """
+    An item line parsed locally from a receipt.
+
+    Attributes:
+        text (str): The raw text of the line.
+        name (str): The item name as printed on the receipt.
+        price (float): The price of the line.
+        quantity (sc_quantity.Quantity | None): The quantity, if printed.
+        confidence (float): How confident the parser is in the matched item.
+        item (sc_item.Item | None): The matched item, if the line was resolved.
+    """
+
+    text: str
+    name: str
+    price: float
+    quantity: sc_quantity.Quantity | None = None
+    confidence: float = UNMATCHED_CONFIDENCE
+    item: sc_item.Item | None = None
+
+
+class MerchantTemplate(pydantic.BaseModel):
+    """
+    Layout knowledge for one merchant, learned from past receipts.
+
+    Attributes:
+        merchant (str): The name of the merchant.
+        header_names (list[str]): Normalized header lines that identify the merchant.
+        items (dict[str, dict]): Item details from past receipts, by normalized name.
+        aliases (dict[str, str]): Normalized receipt spellings of item names, such as
+            "bnls ckn brst", mapped to the normalized item name.
+    """
+
+    merchant: str
+    header_names: list[str] = pydantic.Field(default_factory=list)
+    items: dict[str, dict] = pydantic.Field(default_factory=dict)
+    aliases: dict[str, str] = pydantic.Field(default_factory=dict)
+
+    def learn_item(self, item: sc_item.Item, receipt_name: str | None = None):
+        """
+        Records an item seen on one of the merchant's receipts.
+
+        Args:
+            item (sc_item.Item): The item.
+            receipt_name (str | None): How the item was printed on the receipt.
+        """
+        key = normalize_item_name(item.name)
+        details = item.model_dump(mode="json")
+        # Store shelf life in days; the ISO duration is not always parseable back.
+        details["shelf_life"] = str(item.shelf_life / datetime.timedelta(days=1))
+        self.items[key] = details
+        if receipt_name is not None:
+            alias = normalize_item_name(receipt_name)
+            if alias and alias != key:
+                self.aliases[alias] = key
+
+    def match(self, receipt_name: str) -> tuple[dict | None, float]:
+        """
+        Finds the known item that a receipt line refers to.
+
+        Args:
+            receipt_name (str): The item name as printed on the receipt.
+
+        Returns:
+            tuple[dict | None, float]: The item details, or None, and the
+                confidence of the match.
+        """
+        key = normalize_item_name(receipt_name)
+        key = self.aliases.get(key, key)
+        if key in self.items:
+            return self.items[key], EXACT_MATCH_CONFIDENCE
+
+        candidates = list(self.items) + list(self.aliases)
+        close = difflib.get_close_matches(key, candidates, n=1, cutoff=0.6)
+        if not close:
+            return None, UNMATCHED_CONFIDENCE
+        ratio = difflib.SequenceMatcher(None, key, close[0]).ratio()
+        return self.items[self.aliases.get(close[0], close[0])], ratio * 0.9
+
+
+class ReceiptTemplateStore:
+    """
+    Per-merchant receipt templates, optionally persisted to a JSON file.
+    """
+
+    def __init__(self, path: str | None = None):
+        """
+        Initializes the ReceiptTemplateStore.
+
+        Args:
+            path (str | None): Optional JSON file used to persist the templates.
+        """
+        self._path = path
+        self._lock = threading.Lock()
+        self._templates: dict[str, MerchantTemplate] = {}
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                for data in json.load(f):
+                    template = MerchantTemplate.model_validate(data)
+                    self._templates[normalize_item_name(template.merchant)] = template
+
+    def get(self, merchant: str) -> MerchantTemplate | None:
+        """
+        Returns the template of a merchant.
+
+        Args:
+            merchant (str): The name of the merchant.
+
+        Returns:
+            MerchantTemplate | None: The template, or None if the merchant is unknown.
+        """
+        return self._templates.get(normalize_item_name(merchant))
+
+    def find_merchant(self, header_lines: list[str]) -> MerchantTemplate | None:
+        """
+        Identifies the merchant from the first lines of a receipt.
+
+        Args:
+            header_lines (list[str]): The first lines of the receipt.
+
+        Returns:
+            MerchantTemplate | None: The template of the merchant, if known.
+        """
+        for line in header_lines:
+            normalized = normalize_item_name(line)
+            if not normalized:
+                continue
+            for key, template in self._templates.items():
+                if key in normalized or normalized in template.header_names:
+                    return template
+        return None
+
+    def learn(
+        self,
+        receipt: sc_receipt.Receipt,
+        receipt_names: list[str | None] | None = None,
+        header_line: str | None = None,
+    ) -> MerchantTemplate:
+        """
+        Updates the merchant's template with the items of a receipt.
+
+        Args:
+            receipt (sc_receipt.Receipt): A receipt from the merchant.
+            receipt_names (list[str | None] | None): How each item was printed on
+                the receipt, in the same order as `receipt.items`.
+            header_line (str | None): The header line that named the merchant.
+
+        Returns:
+            MerchantTemplate: The updated template.
+        """
+        key = normalize_item_name(receipt.merchant)
+        with self._lock:
+            template = self._templates.setdefault(
+                key, MerchantTemplate(merchant=receipt.merchant)
+            )
+            names = receipt_names or [None] * len(receipt.items)
+            for receipt_item, receipt_name in zip(receipt.items, names):
+                template.learn_item(receipt_item.item, receipt_name)
+            if header_line is not None:
+                header_name = normalize_item_name(header_line)
+                if header_name and header_name not in template.header_names:
+                    template.header_names.append(header_name)
+            return template
+
+    def save(self):
+        """
+        Writes the templates to the template file.
+
+        Raises:
+            ValueError: If the store was created without a path.
+        """
+        if self._path is None:
+            raise ValueError("ReceiptTemplateStore has no path to save to.")
+
+        with self._lock:
+            data = [template.model_dump() for template in self._templates.values()]
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self._path)
+
+
+def parse_receipt_text(
+    text: str, template: MerchantTemplate | None = None
+) -> list[ParsedReceiptLine]:
+    """
+    Parses OCR text of a printed receipt into item lines.
+
+    Lines are matched against the merchant's template. A matched line is resolved
+    into an item with the template's details and the printed quantity, if any.
+
+    Args:
+        text (str): The OCR text of the receipt.
+        template (MerchantTemplate | None): The template of the merchant.
+
+    Returns:
+        list[ParsedReceiptLine]: The item lines of the receipt.
+    """
+    lines: list[ParsedReceiptLine] = []
+    for raw_line in text.splitlines():
+        raw_line = raw_line.strip()
+        if not raw_line:
+            continue
+
+        weight_match = _WEIGHT_LINE_PATTERN.match(raw_line)
+        count_match = _COUNT_LINE_PATTERN.match(raw_line)
+        if (weight_match or count_match) and lines:
+            if weight_match:
+                unit = sc_types.UNIT_MAPPINGS[weight_match["unit"].lower()]
+                lines[-1].quantity = sc_quantity.Quantity(
+                    quantity=weight_match["quantity"],
+                    unit=unit,
+                    type=sc_types.UNIT_TYPE_MAPPINGS[unit],
+                )
+            else:
+                lines[-1].quantity = sc_quantity.Quantity(
+                    quantity=count_match["count"], unit=sc_types.Unit.NONE
+                )
+            continue
+
+        if _SKIPPED_LINE_PATTERN.search(raw_line):
+            continue
+        price_match = _PRICE_LINE_PATTERN.match(raw_line)
+        if price_match is None:
+            continue
+        lines.append(
+            ParsedReceiptLine(
+                text=raw_line,
+                name=price_match["name"].strip(),
+                price=float(price_match["price"]),
+            )
+        )
+
+    if template is not None:
+        for line in lines:
+            _resolve_line(line, template)
+    return lines
+
+
+def _resolve_line(line: ParsedReceiptLine, template: MerchantTemplate):
+    """Resolves a parsed line into an item using the merchant's template."""
+    details, confidence = template.match(line.name)
+    line.confidence = confidence
+    if details is None:
+        return
+
+    details = dict(details)
+    if line.quantity is not None:
+        if line.quantity.unit == sc_types.Unit.NONE:
+            # A count multiplies the usual package size.
+            package = sc_quantity.Quantity.model_validate(details["quantity"])
+            package.quantity *= line.quantity.quantity
+            details["quantity"] = package.model_dump(mode="json")
+        else:
+            details["quantity"] = line.quantity.model_dump(mode="json")
+
+    try:
+        line.item = sc_item.Item.model_validate(details)
+    except pydantic.ValidationError:
+        line.confidence = UNMATCHED_CONFIDENCE
+
+
+def merge_line_items(
+    lines: list[ParsedReceiptLine],
+    enriched_items: list[sc_receipt.ReceiptItem],
+    min_confidence: float,
+) -> list[sc_receipt.ReceiptItem]:
+    """
+    Merges the items of resolved lines with the items the model extracted from
+    the other lines, in the order of the lines on the receipt.
+
+    The model is asked for one item per line, in order. If it returned another
+    number of items, they cannot be matched to lines and are kept together, at
+    the position of the first line sent to the model.
+
+    Args:
+        lines (list[ParsedReceiptLine]): The item lines of the receipt.
+        enriched_items (list[sc_receipt.ReceiptItem]): The items extracted by the
+            model from the unresolved lines.
+        min_confidence (float): Lines matched with a lower confidence were sent to
+            the model.
+
+    Returns:
+        list[sc_receipt.ReceiptItem]: The items of the receipt.
+    """
+    unresolved = [
+        line for line in lines if line.item is None or line.confidence < min_confidence
+    ]
+    one_per_line = len(enriched_items) == len(unresolved)
+    remaining = iter(enriched_items)
+    items = []
+    for line in lines:
+        if line.item is not None and line.confidence >= min_confidence:
+            items.append(sc_receipt.ReceiptItem(price=line.price, item=line.item))
+        elif one_per_line:
+            items.append(next(remaining))
+        elif line is unresolved[0]:
+            items.extend(enriched_items)
+    return items
+
+
+def ocr_image(image_data: bytes) -> str:
+    """
+    Extracts the text of a receipt image with Tesseract.
+
+    Args:
+        image_data (bytes): The encoded receipt image.
+
+    Returns:
+        str: The text of the receipt, one receipt line per line.
+
+    Raises:
+        ImportError: If pytesseract or Pillow is not installed.
+    """
+    try:
+        import pytesseract
+        from PIL import Image
+    except ImportError as e:
+        raise ImportError(
+            "Local receipt OCR requires the pytesseract and Pillow packages."
+        ) from e
+
+    image = Image.open(io.BytesIO(image_data))
+    # Receipts are printed as a single column of uniform text.
+    return pytesseract.image_to_string(image, config="--psm 6")
@@ -0,0 +1,211 @@
+import logging
+import math
+import threading
+from collections import OrderedDict
+
+import src.data_models.item as sc_item
+import src.data_models.quantity as sc_quantity
+import src.data_models.recipe as sc_recipe
+import src.data_models.user as sc_user
+import src.utils.types as sc_types
+
+
+# A pantry fingerprint: one "name:unit:bucket" token per item.
+Fingerprint = frozenset[str]
+
+
+class RecipeCache:
+    """
+    A thread-safe cache of generated recipes, keyed by pantry and preferences.
+
+    Pantries are reduced to a fingerprint of item names and bucketed quantities,
+    so that using a little of an item does not change the key. A lookup without
+    an exact match falls back to the most similar cached pantry with the same
+    preferences. Every cached recipe is checked with `check_feasibility` against
+    the current pantry before it is returned, and the least recently used entry
+    is evicted once the cache is full.
+
+    Attributes:
+        hits (int): Lookups answered by a recipe cached for the same fingerprint.
+        near_hits (int): Lookups answered by a recipe cached for a similar pantry.
+        misses (int): Lookups that required generating a recipe.
+    """
+
+    def __init__(self, max_size: int = 1024, min_similarity: float = 0.8):
+        """
+        Initializes the RecipeCache.
+
+        Args:
+            max_size (int): The maximum number of recipes kept. Defaults to 1024.
+            min_similarity (float): The minimum Jaccard similarity between two
+                pantry fingerprints for a cached recipe to be reused. Defaults to 0.8.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+
+        self._max_size = max_size
+        self._min_similarity = min_similarity
+        self._entries: OrderedDict[tuple[str, Fingerprint], sc_recipe.Recipe] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def fingerprint(items: list[sc_item.Item]) -> Fingerprint:
+        """
+        Reduces a pantry to its item names and bucketed quantities.
+
+        Weights are converted to grams. Quantities are bucketed by powers of two,
+        so 400g and 450g of an item fall in the same bucket.
+
+        Args:
+            items (list[sc_item.Item]): The available items.
+
+        Returns:
+            Fingerprint: The fingerprint of the pantry.
+        """
+        tokens = set()
+        for item in items:
+            quantity = item.quantity.quantity
+            unit = item.quantity.unit
+            if item.quantity.type == sc_types.UnitType.WEIGHT:
+                try:
+                    quantity = sc_quantity.convert_unit(
+                        item.quantity, sc_types.Unit.GRAMS
+                    )
+                    unit = sc_types.Unit.GRAMS
+                except KeyError:
+                    pass
+            bucket = math.floor(math.log2(quantity)) if quantity > 0 else "empty"
+            name = " ".join(item.name.lower().split())
+            tokens.add(f"{name}:{unit.value}:{bucket}")
+        return frozenset(tokens)
+
+    @staticmethod
+    def preferences_key(user_preferences: sc_user.UserPreferences) -> str:
+        """
+        Returns canonical JSON for preferences, ignoring case and list order.
+
+        Args:
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+
+        Returns:
+            str: The canonical preferences JSON.
+        """
+        data = user_preferences.model_dump()
+        for key, value in data.items():
+            if isinstance(value, list):
+                data[key] = sorted(str(entry).strip().lower() for entry in value)
+        return sc_user.UserPreferences.model_validate(data).model_dump_json()
+
+    @staticmethod
+    def similarity(a: Fingerprint, b: Fingerprint) -> float:
+        """
+        Returns the Jaccard similarity of two pantry fingerprints.
+
+        Args:
+            a (Fingerprint): A pantry fingerprint.
+            b (Fingerprint): Another pantry fingerprint.
+
+        Returns:
+            float: The size of the intersection over the size of the union.
+        """
+        if not a and not b:
+            return 1.0
+        return len(a & b) / len(a | b)
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns the fraction of lookups answered from the cache.
+
+        Returns:
+            float: The hit rate, or 0.0 if there have been no lookups.
+        """
+        total = self.hits + self.near_hits + self.misses
+        return (self.hits + self.near_hits) / total if total else 0.0
+
+    def get(
+        self, items: list[sc_item.Item], user_preferences: sc_user.UserPreferences
+    ) -> sc_recipe.Recipe | None:
+        """
+        Looks up a feasible recipe for a pantry and records a hit or a miss.
+
+        Args:
+            items (list[sc_item.Item]): The available items.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+
+        Returns:
+            sc_recipe.Recipe | None: A copy of the cached recipe, or None if no
+                feasible recipe was cached for the pantry or a similar one.
+        """
+        preferences = self.preferences_key(user_preferences)
+        fingerprint = self.fingerprint(items)
+        with self._lock:
+            # Candidates with the same preferences, most similar pantry first.
+            candidates = []
+            for key, recipe in self._entries.items():
+                if key[0] != preferences:
+                    continue
+                similarity = self.similarity(fingerprint, key[1])
+                if similarity >= self._min_similarity:
+                    candidates.append((similarity, key, recipe))
+            candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+
+            for similarity, key, recipe in candidates:
+                if not self._is_feasible(recipe, items):
+                    continue
+                self._entries.move_to_end(key)
+                if key[1] == fingerprint:
+                    self.hits += 1
+                else:
+                    self.near_hits += 1
+                return recipe.model_copy(deep=True)
+
+            self.misses += 1
+            return None
+
+    def set(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        recipe: sc_recipe.Recipe,
+    ):
+        """
+        Stores a recipe, evicting the least recently used entry if full.
+
+        Args:
+            items (list[sc_item.Item]): The items the recipe was generated from.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            recipe (sc_recipe.Recipe): The generated recipe.
+        """
+        key = (self.preferences_key(user_preferences), self.fingerprint(items))
+        with self._lock:
+            self._entries[key] = recipe.model_copy(deep=True)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes all entries and resets the statistics.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.near_hits = 0
+            self.misses = 0
+
+    @staticmethod
+    def _is_feasible(recipe: sc_recipe.Recipe, items: list[sc_item.Item]) -> bool:
+        try:
+            return recipe.check_feasibility(items)
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Failed to check feasibility of {recipe.name}: {e}")
+            return False
@@ -0,0 +1,379 @@
+import json
+import logging
+import os
+import re
+import threading
+import typing
+import zlib
+
+import numpy as np
+
+import src.data_models.item as sc_item
+import src.data_models.recipe as sc_recipe
+import src.data_models.user as sc_user
+
+
+# Embeds a batch of texts into an array of shape (len(texts), dimensions).
+Embedder = typing.Callable[[list[str]], np.ndarray]
+
+_VECTORS_FILE = "vectors.f16"
+_RECIPES_FILE = "recipes.jsonl"
+_METADATA_FILE = "metadata.json"
+# Rows scored at once, so that a search never converts the whole corpus to float32.
+_SEARCH_CHUNK_ROWS = 65536
+# Separates the scope of a recipe from its JSON in the recipes file. Compact JSON
+# escapes tabs, so neither part contains one.
+_SCOPE_SEPARATOR = "\t"
+# User and dietary restrictions a recipe was generated for.
+Scope = tuple[str | None, frozenset[str]]
+
+
+class HashingEmbedder:
+    """
+    Embeds texts locally by hashing their words into a fixed number of dimensions.
+
+    Texts that share words, such as the ingredients of a recipe and a pantry,
+    get similar vectors. No model is called, so embedding takes microseconds.
+    """
+
+    def __init__(self, dimensions: int = 512):
+        """
+        Initializes the HashingEmbedder.
+
+        Args:
+            dimensions (int): The number of dimensions of the vectors. Defaults to 512.
+        """
+        self.dimensions = dimensions
+
+    def __call__(self, texts: list[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dimensions), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in re.findall(r"[a-z]{3,}", text.lower()):
+                # Drop plural endings so "tomato" and "tomatoes" match.
+                word = re.sub(r"(es|s)$", "", word) if len(word) > 3 else word
+                hashed = zlib.crc32(word.encode())
+                sign = 1.0 if hashed & 1 else -1.0
+                vectors[row, (hashed >> 1) % self.dimensions] += sign
+        return vectors
+
+
+def openai_embedder(model: str = "text-embedding-3-small") -> Embedder:
+    """
+    Returns an embedder backed by an OpenAI embedding model.
+
+    Args:
+        model (str): The embedding model. Defaults to "text-embedding-3-small".
+
+    Returns:
+        Embedder: Embeds texts with the model.
+    """
+    from langchain_openai import OpenAIEmbeddings
+
+    embeddings = OpenAIEmbeddings(model=model)
+    return lambda texts: np.asarray(embeddings.embed_documents(texts))
+
+
+def recipe_text(recipe: sc_recipe.Recipe) -> str:
+    """
+    Returns the text a recipe is indexed by: its name, description and ingredients.
+
+    Args:
+        recipe (sc_recipe.Recipe): The recipe.
+
+    Returns:
+        str: The text to embed.
+    """
+    ingredients = ", ".join(ingredient.name for ingredient in recipe.ingredients)
+    return f"{recipe.name}. {recipe.description} Ingredients: {ingredients}."
+
+
+def pantry_text(
+    items: list[sc_item.Item], user_preferences: sc_user.UserPreferences
+) -> str:
+    """
+    Returns the text a pantry is searched with: its items and favorite cuisines.
+
+    Args:
+        items (list[sc_item.Item]): The available items.
+        user_preferences (sc_user.UserPreferences): The preferences of the user.
+
+    Returns:
+        str: The text to embed.
+    """
+    ingredients = ", ".join(item.name for item in items)
+    cuisines = ", ".join(user_preferences.favorite_cuisines)
+    return f"Ingredients: {ingredients}. Cuisines: {cuisines}."
+
+
+def recipe_scope(
+    user_id: str | None, user_preferences: sc_user.UserPreferences | None
+) -> Scope:
+    """
+    Returns the scope a recipe is stored and found in.
+
+    Args:
+        user_id (str | None): The user, or None for recipes shared by callers
+            that do not pass a user.
+        user_preferences (sc_user.UserPreferences | None): The preferences of the
+            user, whose dietary restrictions are part of the scope. None means no
+            restrictions.
+
+    Returns:
+        Scope: The user and the normalized dietary restrictions.
+    """
+    restrictions = user_preferences.dietary_restrictions if user_preferences else []
+    return user_id, frozenset(
+        " ".join(restriction.lower().split()) for restriction in restrictions
+    )
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class RecipeCorpus:
+    """
+    A local corpus of recipes with a vector index over their ingredients and
+    descriptions.
+
+    Vectors are stored normalized as float16, in a memory-mapped file if the
+    corpus has a directory, so a large corpus loads instantly and only the pages
+    a search touches are read. A search scores every vector, in chunks; at the
+    sizes of a recipe corpus an exact scan takes milliseconds and needs no
+    approximate index to maintain.
+
+    Each recipe is stored with the user and the dietary restrictions it was
+    generated for, and is only found for the same user, with restrictions it
+    already satisfies.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        embedder: Embedder | None = None,
+        min_score: float = 0.5,
+    ):
+        """
+        Initializes the RecipeCorpus.
+
+        Args:
+            path (str | None): Optional directory the corpus is stored in. Defaults
+                to a corpus kept in memory.
+            embedder (Embedder | None): Embeds recipe and pantry texts. Must
+                produce vectors of the same dimensions as the stored ones. Defaults
+                to a HashingEmbedder.
+            min_score (float): The minimum cosine similarity between a pantry and a
+                recipe returned by `find`. A pantry has more items than a recipe
+                uses, so similarities stay moderate; `check_feasibility` is the
+                strict check. Defaults to 0.5.
+        """
+        self._path = path
+        self._min_score = min_score
+        self._embedder = embedder or HashingEmbedder()
+        self._lock = threading.Lock()
+        self._recipes: list[str] = []
+        # Rows of the recipes of each scope.
+        self._scope_rows: dict[Scope, list[int]] = {}
+        self._vectors: np.ndarray | None = None
+        self._dimensions: int | None = None
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            if os.path.exists(os.path.join(path, _METADATA_FILE)):
+                self._load()
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    def _load(self):
+        with open(os.path.join(self._path, _METADATA_FILE)) as f:
+            metadata = json.load(f)
+        with open(os.path.join(self._path, _RECIPES_FILE)) as f:
+            lines = [line for line in f.read().splitlines() if line]
+        # Recipes written after the last vectors, e.g. by a crash, are dropped.
+        count = min(metadata["count"], len(lines))
+        scope_rows: dict[str, list[int]] = {}
+        for row, line in enumerate(lines[:count]):
+            scope, _, recipe = line.partition(_SCOPE_SEPARATOR)
+            self._recipes.append(recipe)
+            scope_rows.setdefault(scope, []).append(row)
+        for scope, rows in scope_rows.items():
+            user_id, restrictions = json.loads(scope)
+            self._scope_rows[(user_id, frozenset(restrictions))] = rows
+        self._dimensions = metadata["dimensions"]
+        if count:
+            self._vectors = np.memmap(
+                os.path.join(self._path, _VECTORS_FILE),
+                dtype=np.float16,
+                mode="r",
+                shape=(count, self._dimensions),
+            )
+
+    def add(
+        self,
+        recipes: list[sc_recipe.Recipe],
+        user_id: str | None = None,
+        user_preferences: sc_user.UserPreferences | None = None,
+    ):
+        """
+        Embeds recipes and adds them to the corpus.
+
+        Args:
+            recipes (list[sc_recipe.Recipe]): The recipes to add.
+            user_id (str | None): The user the recipes were generated for. Defaults
+                to no user.
+            user_preferences (sc_user.UserPreferences | None): The preferences the
+                recipes were generated with. Defaults to no dietary restrictions.
+
+        Raises:
+            ValueError: If the embedder's dimensions differ from the corpus'.
+        """
+        if not recipes:
+            return
+        vectors = _normalize(self._embedder([recipe_text(r) for r in recipes]))
+        vectors = vectors.astype(np.float16)
+        lines = [recipe.model_dump_json() for recipe in recipes]
+        scope = recipe_scope(user_id, user_preferences)
+        scope_json = json.dumps([scope[0], sorted(scope[1])])
+
+        with self._lock:
+            if self._dimensions is None:
+                self._dimensions = vectors.shape[1]
+            elif vectors.shape[1] != self._dimensions:
+                raise ValueError(
+                    f"Embeddings have {vectors.shape[1]} dimensions, the corpus "
+                    f"has {self._dimensions}."
+                )
+            count = len(self._recipes) + len(recipes)
+
+            if self._path is None:
+                self._vectors = (
+                    vectors
+                    if self._vectors is None
+                    else np.concatenate([self._vectors, vectors])
+                )
+            else:
+                with open(os.path.join(self._path, _RECIPES_FILE), "a") as f:
+                    f.write(
+                        "".join(
+                            f"{scope_json}{_SCOPE_SEPARATOR}{line}\n" for line in lines
+                        )
+                    )
+                with open(os.path.join(self._path, _VECTORS_FILE), "ab") as f:
+                    f.write(vectors.tobytes())
+                metadata_path = os.path.join(self._path, _METADATA_FILE)
+                with open(f"{metadata_path}.tmp", "w") as f:
+                    json.dump({"count": count, "dimensions": self._dimensions}, f)
+                os.replace(f"{metadata_path}.tmp", metadata_path)
+                self._vectors = np.memmap(
+                    os.path.join(self._path, _VECTORS_FILE),
+                    dtype=np.float16,
+                    mode="r",
+                    shape=(count, self._dimensions),
+                )
+            self._scope_rows.setdefault(scope, []).extend(
+                range(len(self._recipes), count)
+            )
+            self._recipes.extend(lines)
+
+    def search(
+        self, text: str, top_k: int = 10, rows: np.ndarray | None = None
+    ) -> list[tuple[float, sc_recipe.Recipe]]:
+        """
+        Finds the recipes most similar to a text.
+
+        Args:
+            text (str): The text to search with.
+            top_k (int): The maximum number of recipes returned. Defaults to 10.
+            rows (np.ndarray | None): The rows of the recipes searched, in
+                ascending order. Defaults to every recipe.
+
+        Returns:
+            list[tuple[float, sc_recipe.Recipe]]: Cosine similarity and recipe,
+                most similar first.
+        """
+        with self._lock:
+            vectors, recipes = self._vectors, list(self._recipes)
+        if vectors is None or top_k <= 0:
+            return []
+        if rows is None:
+            rows = np.arange(vectors.shape[0])
+
+        query = _normalize(self._embedder([text]))[0]
+        if query.shape[0] != vectors.shape[1]:
+            raise ValueError(
+                f"Embeddings have {query.shape[0]} dimensions, the corpus has "
+                f"{vectors.shape[1]}."
+            )
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, len(rows), _SEARCH_CHUNK_ROWS):
+            chunk = rows[start : start + _SEARCH_CHUNK_ROWS]
+            scores = vectors[chunk].astype(np.float32) @ query
+            if len(scores) > top_k:
+                top = np.argpartition(scores, -top_k)[-top_k:]
+            else:
+                top = np.arange(len(scores))
+            best_rows = np.concatenate([best_rows, chunk[top]])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            if len(best_scores) > top_k:
+                keep = np.argpartition(best_scores, -top_k)[-top_k:]
+                best_rows, best_scores = best_rows[keep], best_scores[keep]
+
+        order = np.argsort(-best_scores)
+        return [
+            (
+                float(best_scores[i]),
+                sc_recipe.Recipe.model_validate_json(recipes[best_rows[i]]),
+            )
+            for i in order
+        ]
+
+    def find(
+        self,
+        items: list[sc_item.Item],
+        user_preferences: sc_user.UserPreferences,
+        top_k: int = 10,
+        user_id: str | None = None,
+    ) -> sc_recipe.Recipe | None:
+        """
+        Finds a stored recipe that suits a pantry and can be made with it.
+
+        Only the recipes of the user that were generated with at least the user's
+        dietary restrictions are searched.
+
+        Args:
+            items (list[sc_item.Item]): The available items.
+            user_preferences (sc_user.UserPreferences): The preferences of the user.
+            top_k (int): The number of most similar recipes checked with
+                `check_feasibility`. Defaults to 10.
+            user_id (str | None): The user. Defaults to no user.
+
+        Returns:
+            sc_recipe.Recipe | None: The most similar feasible recipe scoring at
+                least `min_score`, or None.
+        """
+        user_id, restrictions = recipe_scope(user_id, user_preferences)
+        rows = []
+        with self._lock:
+            for (
+                scope_user_id,
+                scope_restrictions,
+            ), scope_rows in self._scope_rows.items():
+                if scope_user_id == user_id and restrictions <= scope_restrictions:
+                    rows.extend(scope_rows)
+        if not rows:
+            return None
+
+        text = pantry_text(items, user_preferences)
+        for score, recipe in self.search(text, top_k, np.sort(np.asarray(rows))):
+            if score < self._min_score:
+                break
+            try:
+                if recipe.check_feasibility(items):
+                    return recipe
+            except (KeyError, TypeError, ValueError) as e:
+                logging.warning(f"Failed to check feasibility of {recipe.name}: {e}")
+        return None
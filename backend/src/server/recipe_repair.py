@@ -0,0 +1,229 @@
+import difflib
+import logging
+import math
+import re
+
+import pydantic
+
+import src.data_models.item as sc_item
+import src.data_models.quantity as sc_quantity
+import src.data_models.recipe as sc_recipe
+import src.utils.types as sc_types
+
+
+# Names closer than this to exactly one item are resolved to it.
+_NAME_MATCH_CUTOFF = 0.85
+
+
+class RecipeVerification(pydantic.BaseModel):
+    """
+    The result of verifying a recipe against the available items.
+
+    Attributes:
+        recipe (sc_recipe.Recipe): The recipe, with the local repairs applied.
+        repairs (list[str]): The repairs that were applied.
+        issues (list[str]): The problems that could not be repaired locally.
+    """
+
+    recipe: sc_recipe.Recipe
+    repairs: list[str] = pydantic.Field(default_factory=list)
+    issues: list[str] = pydantic.Field(default_factory=list)
+
+    @property
+    def feasible(self) -> bool:
+        """
+        Returns whether the repaired recipe can be made with the items.
+
+        Returns:
+            bool: True if no issues remain.
+        """
+        return not self.issues
+
+
+def _normalize_name(name: str) -> str:
+    words = re.findall(r"[a-z]+", name.lower())
+    # Drop plural endings so "Tomatoes" matches "Tomato".
+    return " ".join(re.sub(r"(es|s)$", "", w) if len(w) > 3 else w for w in words)
+
+
+def resolve_item(name: str, items: list[sc_item.Item]) -> sc_item.Item | None:
+    """
+    Finds the item an ingredient name refers to.
+
+    Names are matched exactly, then ignoring case, punctuation and plurals, then
+    as the only item whose name contains all of the ingredient's words, and
+    finally as the only close spelling.
+
+    Args:
+        name (str): The name of the ingredient.
+        items (list[sc_item.Item]): The available items.
+
+    Returns:
+        sc_item.Item | None: The item, or None if no item or several items match.
+    """
+    for item in items:
+        if item.name == name:
+            return item
+
+    normalized = {_normalize_name(item.name): item for item in items}
+    key = _normalize_name(name)
+    if key in normalized:
+        return normalized[key]
+
+    words = set(key.split())
+    containing = [
+        item for item_key, item in normalized.items() if words <= set(item_key.split())
+    ]
+    if words and len(containing) == 1:
+        return containing[0]
+
+    close = difflib.get_close_matches(key, normalized, n=2, cutoff=_NAME_MATCH_CUTOFF)
+    if len(close) == 1:
+        return normalized[close[0]]
+    return None
+
+
+def normalize_unit(unit: str) -> sc_types.Unit | None:
+    """
+    Maps a unit as written by a model, such as "Pounds" or "tbsp.", to a Unit.
+
+    Args:
+        unit (str): The unit.
+
+    Returns:
+        sc_types.Unit | None: The unit, or None if it is unknown.
+    """
+    cleaned = unit.lower().strip().rstrip(".")
+    if cleaned in sc_types.UNIT_MAPPINGS:
+        return sc_types.UNIT_MAPPINGS[cleaned]
+    for known in sc_types.Unit:
+        if cleaned == known.value.lower():
+            return known
+    return None
+
+
+def verify_recipe(
+    recipe: sc_recipe.Recipe,
+    items: list[sc_item.Item],
+    min_scale: float = 0.8,
+) -> RecipeVerification:
+    """
+    Checks a recipe against the available items and repairs what it can locally.
+
+    Ingredient names are resolved to item names and units are normalized to
+    Unit values. Pantry staples that do not resolve to an item are assumed to be
+    available and are not checked. If the recipe uses more of some items than there is, and
+    scaling every quantity down by at least `min_scale` makes it fit, the recipe
+    is scaled. Finally `check_feasibility` is run and the nutritional facts are
+    recomputed from the items, if every ingredient is an item with a serving
+    size. Otherwise the model's estimate is kept rather than a partial sum.
+
+    Args:
+        recipe (sc_recipe.Recipe): The recipe. It is not modified.
+        items (list[sc_item.Item]): The available items.
+        min_scale (float): The smallest factor quantities are scaled down by to
+            fit the items. Defaults to 0.8, i.e. up to 25% over-use is repaired.
+
+    Returns:
+        RecipeVerification: The repaired recipe, the repairs and the issues left.
+    """
+    recipe = recipe.model_copy(deep=True)
+    verification = RecipeVerification(recipe=recipe)
+    # The fraction of each ingredient's item that the recipe uses.
+    usage = {}
+
+    for ingredient in recipe.ingredients:
+        item = resolve_item(ingredient.name, items)
+        if item is None and sc_recipe.is_staple(ingredient.name):
+            continue
+        if item is None:
+            verification.issues.append(
+                f"{ingredient.name} is not among the available items."
+            )
+            continue
+        if ingredient.name != item.name:
+            verification.repairs.append(f"Renamed {ingredient.name} to {item.name}.")
+            ingredient.name = item.name
+
+        unit = normalize_unit(ingredient.unit)
+        if unit is None:
+            verification.issues.append(
+                f"{ingredient.name} has the unknown unit {ingredient.unit!r}."
+            )
+            continue
+        if ingredient.unit != unit.value:
+            verification.repairs.append(
+                f"Changed the unit of {ingredient.name} from {ingredient.unit!r} "
+                f"to {unit.value!r}."
+            )
+            ingredient.unit = unit.value
+
+        try:
+            required = sc_quantity.convert_unit(
+                sc_quantity.Quantity(quantity=ingredient.quantity, unit=unit),
+                item.quantity.unit,
+            )
+        except KeyError:
+            verification.issues.append(
+                f"{ingredient.name} is measured in {unit.value}, which cannot be "
+                f"converted to the {item.quantity.unit.value} it is stored in."
+            )
+            continue
+        if item.quantity.quantity > 0:
+            usage[item.name] = (
+                usage.get(item.name, 0.0) + required / item.quantity.quantity
+            )
+        elif required > 0:
+            verification.issues.append(f"There is no {ingredient.name} left.")
+
+    if verification.issues:
+        return verification
+
+    most_used = max(usage.values(), default=0.0)
+    if most_used > 1:
+        # Rounded down, so the scaled quantities fit despite rounding errors.
+        scale = math.floor(100 / most_used) / 100
+        if scale < min_scale:
+            verification.issues.extend(
+                f"{name} needs {fraction:.0%} of the available quantity."
+                for name, fraction in usage.items()
+                if fraction > 1
+            )
+            return verification
+        for ingredient in recipe.ingredients:
+            ingredient.quantity *= scale
+        verification.repairs.append(
+            f"Scaled all quantities by {scale:.2f} to fit the available items."
+        )
+
+    if not recipe.check_feasibility(items):
+        verification.issues.append("The recipe is not feasible with the items.")
+        return verification
+
+    servings = {
+        item.name: item.nutritional_facts.serving_size
+        for item in items
+        if item.nutritional_facts.serving_size.unit != sc_types.Unit.NONE
+        and item.nutritional_facts.serving_size.quantity > 0
+    }
+    uncovered = [
+        ingredient.name
+        for ingredient in recipe.ingredients
+        if ingredient.name not in servings
+    ]
+    if uncovered:
+        # Staples that are not stored, and items without nutrition, would add
+        # nothing to the sum.
+        logging.info(
+            f"Kept the estimated nutritional facts of {recipe.name}, "
+            f"without nutrition for {uncovered}."
+        )
+        return verification
+
+    try:
+        recipe.update_nutritional_facts(items)
+        verification.repairs.append("Recomputed the nutritional facts.")
+    except (KeyError, TypeError, ValueError, ZeroDivisionError) as e:
+        # The serving size of an item may not convert to the ingredient's unit.
+        logging.info(f"Kept the estimated nutritional facts of {recipe.name}: {e}")
+    return verification
@@ -0,0 +1,198 @@
+import enum
+
+import orjson
+import pydantic
+
+import src.data_models.recipe as sc_recipe
+import src.utils.json_output as sc_json_output
+
+
+# Characters that can start a new key or array element in recipe JSON.
+_BOUNDARY_CHARACTERS = ',{"'
+# Fields of the recipe that are emitted as parts.
+_STREAMED_FIELDS = {"name", "description", "ingredients", "instructions"}
+
+
+class RecipeStreamStage(enum.Enum):
+    """
+    Enumeration of the stages of a streamed recipe.
+
+    Attributes:
+        HEADER: The name and description of the recipe.
+        INGREDIENT: One ingredient of the recipe.
+        INSTRUCTION: One numbered instruction of the recipe.
+        RECIPE: The complete, validated recipe.
+        REPLACED: The complete recipe, which replaces the parts emitted before
+            because it was changed after generation, for example by a repair.
+    """
+
+    HEADER = "header"
+    INGREDIENT = "ingredient"
+    INSTRUCTION = "instruction"
+    RECIPE = "recipe"
+    REPLACED = "replaced"
+
+
+class RecipeStreamEvent(pydantic.BaseModel):
+    """
+    A part of a recipe that is complete while the rest is still being generated.
+
+    Attributes:
+        stage (RecipeStreamStage): Which part of the recipe the event carries.
+        name (str | None): The name of the recipe, for HEADER events.
+        description (str | None): The description of the recipe, for HEADER events.
+        ingredient (sc_recipe.RecipeIngredient | None): The ingredient, for
+            INGREDIENT events.
+        step (int | None): The number of the instruction, for INSTRUCTION events.
+        instruction (str | None): The instruction, for INSTRUCTION events.
+        recipe (sc_recipe.Recipe | None): The complete recipe, for RECIPE and
+            REPLACED events.
+    """
+
+    stage: RecipeStreamStage
+    name: str | None = None
+    description: str | None = None
+    ingredient: sc_recipe.RecipeIngredient | None = None
+    step: int | None = None
+    instruction: str | None = None
+    recipe: sc_recipe.Recipe | None = None
+
+
+class RecipeStreamParser:
+    """
+    Parses recipe JSON as it is generated into events for each completed part.
+
+    The output so far is closed with `repair_truncated_json` and parsed. A value is
+    only complete once the model has moved on to the next key or array element,
+    because the last one may still be cut off, so the last ingredient and
+    instruction are emitted by `finish`.
+    """
+
+    def __init__(self):
+        """
+        Initializes the RecipeStreamParser.
+        """
+        self.reset()
+
+    def reset(self):
+        """
+        Discards the output so far, for example when the model starts a new reply.
+        """
+        self._text = ""
+        self._header_sent = False
+        self._ingredients_sent = 0
+        self._steps_sent: set[int] = set()
+
+    def feed(self, chunk: str) -> list[RecipeStreamEvent]:
+        """
+        Adds generated text and returns the parts of the recipe it completed.
+
+        Args:
+            chunk (str): The next piece of the model output.
+
+        Returns:
+            list[RecipeStreamEvent]: Events for the newly completed parts.
+
+        Raises:
+            ValueError: If a completed part does not match the recipe schema.
+        """
+        self._text += chunk
+        # A part is only complete once the next key or element starts.
+        if not any(char in chunk for char in _BOUNDARY_CHARACTERS):
+            return []
+
+        text = sc_json_output.strip_code_fence(self._text)
+        try:
+            data = orjson.loads(sc_json_output.repair_truncated_json(text))
+        except orjson.JSONDecodeError:
+            return []
+        if not isinstance(data, dict):
+            return []
+
+        # Every key but the last one being generated has its final value.
+        closed = set(list(data)[:-1])
+        return self._events(data, closed)
+
+    def finish(
+        self, recipe: sc_recipe.Recipe, final: sc_recipe.Recipe | None = None
+    ) -> list[RecipeStreamEvent]:
+        """
+        Returns the events for the parts not yet emitted, and the final recipe.
+
+        Args:
+            recipe (sc_recipe.Recipe): The recipe parsed and validated from the
+                complete output.
+            final (sc_recipe.Recipe | None): The recipe to return instead, for
+                example after it was repaired. Defaults to `recipe`.
+
+        Returns:
+            list[RecipeStreamEvent]: The remaining events of `recipe`, ending with a
+                RECIPE event, or with a REPLACED event if the parts of `final`
+                differ from the ones emitted.
+        """
+        data = recipe.model_dump(mode="json")
+        events = self._events(data, closed=set(data))
+        stage = RecipeStreamStage.RECIPE
+        if final is None:
+            final = recipe
+        elif final.model_dump(include=_STREAMED_FIELDS) != recipe.model_dump(
+            include=_STREAMED_FIELDS
+        ):
+            stage = RecipeStreamStage.REPLACED
+        events.append(RecipeStreamEvent(stage=stage, recipe=final))
+        return events
+
+    def _events(self, data: dict, closed: set[str]) -> list[RecipeStreamEvent]:
+        """Returns events for the complete parts of partially parsed recipe JSON."""
+        events = []
+        if not self._header_sent and {"name", "description"} <= closed:
+            name, description = data["name"], data["description"]
+            if not isinstance(name, str) or not isinstance(description, str):
+                raise ValueError("Recipe name and description must be strings.")
+            events.append(
+                RecipeStreamEvent(
+                    stage=RecipeStreamStage.HEADER, name=name, description=description
+                )
+            )
+            self._header_sent = True
+
+        ingredients = data.get("ingredients")
+        if isinstance(ingredients, list):
+            if "ingredients" not in closed:
+                ingredients = ingredients[:-1]
+            for value in ingredients[self._ingredients_sent :]:
+                try:
+                    ingredient = sc_recipe.RecipeIngredient.model_validate(value)
+                except pydantic.ValidationError as e:
+                    raise ValueError(f"Invalid recipe ingredient {value}: {e}")
+                events.append(
+                    RecipeStreamEvent(
+                        stage=RecipeStreamStage.INGREDIENT, ingredient=ingredient
+                    )
+                )
+            self._ingredients_sent = max(self._ingredients_sent, len(ingredients))
+
+        instructions = data.get("instructions")
+        if isinstance(instructions, dict):
+            steps = list(instructions.items())
+            if "instructions" not in closed:
+                steps = steps[:-1]
+            for key, instruction in steps:
+                try:
+                    step = int(key)
+                except ValueError:
+                    raise ValueError(f"Invalid recipe step number: {key}")
+                if step in self._steps_sent:
+                    continue
+                if not isinstance(instruction, str):
+                    raise ValueError(f"Recipe step {step} must be a string.")
+                events.append(
+                    RecipeStreamEvent(
+                        stage=RecipeStreamStage.INSTRUCTION,
+                        step=step,
+                        instruction=instruction,
+                    )
+                )
+                self._steps_sent.add(step)
+
+        return events
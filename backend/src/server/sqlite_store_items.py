@@ -0,0 +1,368 @@
+import datetime
+import json
+import sqlite3
+import threading
+import typing
+
+import src.data_models.item as sc_item
+import src.data_models.recipe as sc_recipe
+import src.server.item_storage as sc_item_storage
+import src.utils.types as sc_types
+
+
+# `sequence` orders the changes to the items of a user, and `version` counts
+# the changes to an item. Deleted items are kept as tombstones.
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    user_id TEXT NOT NULL,
+    name TEXT NOT NULL,
+    expiration_date TEXT NOT NULL,
+    storage TEXT NOT NULL,
+    data TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0,
+    version INTEGER NOT NULL DEFAULT 1,
+    sequence INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (user_id, name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS items_by_expiration
+    ON items (user_id, deleted, expiration_date);
+CREATE INDEX IF NOT EXISTS items_by_sequence ON items (user_id, sequence);
+"""
+
+_NEXT_SEQUENCE = "(SELECT COALESCE(MAX(sequence), 0) + 1 FROM items WHERE user_id = ?)"
+
+# Statements are parameterized, so each connection prepares them once and
+# reuses them from its statement cache.
+_UPSERT = f"""
+INSERT INTO items (
+    user_id, name, expiration_date, storage, data, sequence, updated_at
+)
+VALUES (?, ?, ?, ?, ?, {_NEXT_SEQUENCE}, ?)
+ON CONFLICT (user_id, name) DO UPDATE SET
+    expiration_date = excluded.expiration_date,
+    storage = excluded.storage,
+    data = excluded.data,
+    deleted = 0,
+    version = version + 1,
+    sequence = excluded.sequence,
+    updated_at = excluded.updated_at
+"""
+
+_DELETE = f"""
+UPDATE items SET
+    deleted = 1, version = version + 1, sequence = {_NEXT_SEQUENCE}, updated_at = ?
+WHERE user_id = ? AND name = ? AND deleted = 0
+"""
+
+# Names per query, well below SQLite's limit of bound parameters.
+_MAX_QUERY_NAMES = 500
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+class SqliteItemStore(sc_item_storage.ItemStorage):
+    """A class to store items in a local SQLite database.
+
+    The database uses write-ahead logging, so reads run concurrently with a
+    write. Items are keyed by user and name, and indexed by user and
+    expiration date. Each thread uses its own connection.
+
+    It needs no cloud project, so tests, benchmarks and small self-hosted
+    deployments can use it in place of `ItemFireStore`.
+    """
+
+    def __init__(self, user_id: str, path: str = "souchef_items.db"):
+        """Initialize the SqliteItemStore and create its tables if needed.
+
+        Args:
+            user_id: The user whose items are stored.
+            path: The database file, which may be shared by the stores of
+                many users. Defaults to "souchef_items.db".
+        """
+        self.user_id = user_id
+        self._path = path
+        self._local = threading.local()
+        self._connections: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        with self._connection() as connection:
+            connection.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self._path, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            # With WAL, NORMAL only syncs at checkpoints: a power loss may lose
+            # the last commits but never corrupts the database.
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute("PRAGMA busy_timeout=5000")
+            self._local.connection = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _row(self, item: sc_item.Item, updated_at: str) -> tuple[str, ...]:
+        return (
+            self.user_id,
+            item.name,
+            item.expiration_date.isoformat(),
+            item.storage.name,
+            json.dumps(item.to_dict()),
+            self.user_id,
+            updated_at,
+        )
+
+    def add_items(self, items: list[sc_item.Item]):
+        """Add multiple items in one transaction.
+
+        Args:
+            items: List of Item objects to store
+        """
+        with self._connection() as connection:
+            updated_at = _now()
+            connection.executemany(
+                _UPSERT, [self._row(item, updated_at) for item in items]
+            )
+
+    def get_items(self) -> list[sc_item.Item]:
+        """Retrieve all items.
+
+        Returns:
+            List of Item objects, ordered by name
+        """
+        rows = self._connection().execute(
+            "SELECT data FROM items WHERE user_id = ? AND deleted = 0 ORDER BY name",
+            (self.user_id,),
+        )
+        return [sc_item.Item.from_dict(json.loads(data)) for (data,) in rows]
+
+    def iter_items(
+        self, page_size: int = 300, fields: list[str] | None = None
+    ) -> typing.Iterator[sc_item.Item]:
+        """Iterate over all items, reading them page by page.
+
+        Args:
+            page_size: The number of items read at a time. Defaults to 300.
+            fields: Ignored, as items are stored as one column.
+
+        Yields:
+            Item objects, ordered by name
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+
+        last_name = ""
+        while True:
+            rows = (
+                self._connection()
+                .execute(
+                    "SELECT name, data FROM items WHERE user_id = ? AND name > ?"
+                    " AND deleted = 0 ORDER BY name LIMIT ?",
+                    (self.user_id, last_name, page_size),
+                )
+                .fetchall()
+            )
+            for last_name, data in rows:
+                yield sc_item.Item.from_dict(json.loads(data))
+            if len(rows) < page_size:
+                return
+
+    def get_item(self, item_name: str) -> sc_item.Item:
+        """Retrieve a specific item by name.
+
+        Args:
+            item_name: Name of the item to retrieve
+
+        Returns:
+            Item object if found
+
+        Raises:
+            KeyError: If item is not found
+        """
+        row = (
+            self._connection()
+            .execute(
+                "SELECT data FROM items WHERE user_id = ? AND name = ?"
+                " AND deleted = 0",
+                (self.user_id, item_name),
+            )
+            .fetchone()
+        )
+
+        if row is None:
+            raise KeyError(f"Item '{item_name}' not found")
+
+        return sc_item.Item.from_dict(json.loads(row[0]))
+
+    def _items_by_names(
+        self, connection: sqlite3.Connection, item_names: list[str]
+    ) -> list[sc_item.Item | None]:
+        names = list(dict.fromkeys(item_names))
+        found = {}
+        for start in range(0, len(names), _MAX_QUERY_NAMES):
+            chunk = names[start : start + _MAX_QUERY_NAMES]
+            rows = connection.execute(
+                "SELECT name, data FROM items WHERE user_id = ? AND deleted = 0"
+                f" AND name IN ({', '.join('?' * len(chunk))})",
+                (self.user_id, *chunk),
+            )
+            for name, data in rows:
+                found[name] = sc_item.Item.from_dict(json.loads(data))
+        return [found.get(item_name) for item_name in item_names]
+
+    def get_items_by_names(self, item_names: list[str]) -> list[sc_item.Item | None]:
+        """Retrieve specific items by name in one query per 500 names.
+
+        Args:
+            item_names: Names of the items to retrieve
+
+        Returns:
+            The item of each name, in the order of the names, or None for the
+            names of missing items
+        """
+        return self._items_by_names(self._connection(), item_names)
+
+    def get_expiring_items(
+        self,
+        within_days: int,
+        storage: sc_types.StorageType | None = None,
+        limit: int = 100,
+    ) -> list[sc_item.Item]:
+        """Retrieve the items that expire within `within_days` days.
+
+        The items are read in order from the expiration date index.
+
+        Args:
+            within_days: The number of days from today. 0 returns the items
+                that expire today or earlier.
+            storage: Optional storage type of the items. Defaults to all.
+            limit: The maximum number of items. Defaults to 100.
+
+        Returns:
+            List of Item objects, ordered by expiration date
+        """
+        cutoff = sc_item_storage.expiration_cutoff(within_days, limit)
+        storage_filter = "" if storage is None else " AND storage = ?"
+        storage_names = () if storage is None else (storage.name,)
+        rows = self._connection().execute(
+            "SELECT data FROM items WHERE user_id = ? AND deleted = 0"
+            f" AND expiration_date <= ?{storage_filter}"
+            " ORDER BY expiration_date, name LIMIT ?",
+            (self.user_id, cutoff.isoformat(), *storage_names, limit),
+        )
+        return [sc_item.Item.from_dict(json.loads(data)) for (data,) in rows]
+
+    def update_item(self, item: sc_item.Item):
+        """Add or replace an item.
+
+        Args:
+            item: Item object to update
+        """
+        with self._connection() as connection:
+            connection.execute(_UPSERT, self._row(item, _now()))
+
+    def delete_item(self, item_name: str):
+        """Delete an item, keeping a tombstone.
+
+        Args:
+            item_name: Name of the item to delete
+        """
+        with self._connection() as connection:
+            connection.execute(_DELETE, (self.user_id, _now(), self.user_id, item_name))
+
+    def cook_recipe(self, recipe: sc_recipe.Recipe) -> list[sc_item.Item | None]:
+        """Use up the ingredients of a recipe in one transaction.
+
+        The transaction takes the write lock before reading the items, so no
+        other writer can change them until it commits. Items that are used up
+        are deleted.
+
+        Args:
+            recipe: The recipe, whose ingredients are named like the items.
+
+        Returns:
+            The updated item of each ingredient, in the order of the
+            ingredients, or None for items that were used up and skipped
+            staples
+
+        Raises:
+            ValueError: If an item is missing or short, or an ingredient unit
+                cannot be converted to the unit of its item.
+        """
+        names = list(
+            dict.fromkeys(ingredient.name for ingredient in recipe.ingredients)
+        )
+        connection = self._connection()
+        with connection:
+            connection.execute("BEGIN IMMEDIATE")
+            items = dict(zip(names, self._items_by_names(connection, names)))
+            updated = sc_item_storage.consume_ingredients(recipe, items)
+            updated_at = _now()
+            for name, item in updated.items():
+                if item is None:
+                    connection.execute(
+                        _DELETE, (self.user_id, updated_at, self.user_id, name)
+                    )
+                else:
+                    connection.execute(_UPSERT, self._row(item, updated_at))
+        return [updated.get(ingredient.name) for ingredient in recipe.ingredients]
+
+    def get_changes_since(
+        self, token: str | None = None
+    ) -> sc_item_storage.ItemChanges:
+        """Retrieve the items added, modified or deleted since a sync token.
+
+        Args:
+            token: The token returned by the previous call. Defaults to None,
+                which returns every item.
+
+        Returns:
+            The changes and the token for the next call
+        """
+        rows = self._connection().execute(
+            "SELECT name, data, deleted, sequence FROM items"
+            " WHERE user_id = ? AND sequence > ? ORDER BY sequence",
+            (self.user_id, 0 if token is None else int(token)),
+        )
+        items, deleted, latest = [], [], None
+        for name, data, is_deleted, latest in rows:
+            if not is_deleted:
+                items.append(sc_item.Item.from_dict(json.loads(data)))
+            elif token is not None:
+                deleted.append(name)
+        return sc_item_storage.ItemChanges(
+            items=items,
+            deleted=deleted,
+            token=token if latest is None else str(latest),
+        )
+
+    def purge_tombstones(self, older_than: datetime.timedelta) -> int:
+        """Delete the tombstones of items deleted more than `older_than` ago.
+
+        Clients whose token is older than that must sync again from None.
+
+        Args:
+            older_than: The minimum age of the tombstones to delete.
+
+        Returns:
+            The number of deleted tombstones
+        """
+        cutoff = (datetime.datetime.now(datetime.timezone.utc) - older_than).isoformat()
+        with self._connection() as connection:
+            return connection.execute(
+                "DELETE FROM items WHERE user_id = ? AND deleted = 1"
+                # The latest change is kept, so its sequence is never reused.
+                f" AND updated_at < ? AND sequence < {_NEXT_SEQUENCE} - 1",
+                (self.user_id, cutoff, self.user_id),
+            ).rowcount
+
+    def close(self):
+        """Close the connections of every thread."""
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for connection in connections:
+            connection.close()
+        self._local = threading.local()
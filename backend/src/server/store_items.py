@@ -1,44 +1,256 @@
-import firebase_admin
-from firebase_admin import credentials, firestore
+import asyncio
+import concurrent.futures
+import datetime
+import typing
+
 import src.data_models.item as sc_item
+import src.data_models.recipe as sc_recipe
+import src.server.item_cache as sc_item_cache
+import src.server.item_storage as sc_item_storage
+import src.server.write_buffer as sc_write_buffer
+import src.utils.types as sc_types
+
+# The Firebase SDK is only loaded once a store connects to Firestore.
+if typing.TYPE_CHECKING:
+    from firebase_admin import firestore
+
+T = typing.TypeVar("T")
+
+# The Firestore database holding the items.
+_DATABASE_ID = "souschet-items"
+
+# The document fields needed to create an Item.
+_REQUIRED_FIELDS = ("name", "quantity", "shelf_life_days", "storage")
+
+
+def _initialize_app():
+    """Initialize the Firebase Admin SDK if not already initialized."""
+    import firebase_admin
+    from firebase_admin import credentials
+
+    if not firebase_admin._apps:
+        cred = credentials.ApplicationDefault()
+        firebase_admin.initialize_app(cred)
+
+
+def _escape_id_part(part: str) -> str:
+    """Escape the characters a document id part cannot contain as is."""
+    return part.replace("%", "%25").replace("_", "%5F").replace("/", "%2F")
+
+
+def _document_id(user_id: str, item_name: str) -> str:
+    """Return the document id of an item.
 
+    Both parts are escaped, so the first `_` separates them and no two users
+    or items share an id. Slashes would nest the document.
+    """
+    return f"{_escape_id_part(user_id)}_{_escape_id_part(item_name)}"
+
+
+def _change_fields(user_id: str, deleted: bool) -> dict[str, typing.Any]:
+    """Return the fields that track the changes to a document.
+
+    `updated_at` is the commit time of the last change, and `version` counts
+    the committed changes.
+    """
+    from google.cloud import firestore
+
+    return {
+        "user_id": user_id,
+        "deleted": deleted,
+        "updated_at": firestore.SERVER_TIMESTAMP,
+        "version": firestore.Increment(1),
+    }
+
+
+def _item_data(user_id: str, item: sc_item.Item) -> dict[str, typing.Any]:
+    return {**item.to_dict(), **_change_fields(user_id, deleted=False)}
+
+
+def _tombstone(user_id: str, item_name: str) -> dict[str, typing.Any]:
+    """Return the fields that mark an item as deleted, replacing a delete.
+
+    The expiration date is removed, so expiring-item queries skip tombstones.
+    """
+    from google.cloud import firestore
 
-class ItemFireStore:
+    return {
+        "name": item_name,
+        "expiration_date": firestore.DELETE_FIELD,
+        **_change_fields(user_id, deleted=True),
+    }
+
+
+def _decode(data: dict[str, typing.Any] | None, user_id: str) -> sc_item.Item | None:
+    """Return the item of a user's document, or None if it is missing or deleted.
+
+    Documents of other users are treated as missing.
+    """
+    if data is None or data.get("deleted", False):
+        return None
+    if data.get("user_id") != user_id:
+        return None
+    return sc_item.Item.from_dict(data)
+
+
+def _changes(
+    docs: typing.Iterable[dict[str, typing.Any]], token: str | None, user_id: str
+) -> sc_item_storage.ItemChanges:
+    """Collect the changes in the documents of a user changed after a token."""
+    items, deleted, latest = [], [], None
+    for data in docs:
+        updated_at = data.get("updated_at")
+        if updated_at is not None and (latest is None or updated_at > latest):
+            latest = updated_at
+        item = _decode(data, user_id)
+        if item is not None:
+            items.append(item)
+        elif token is not None:
+            deleted.append(data["name"])
+    return sc_item_storage.ItemChanges(
+        items=items,
+        deleted=deleted,
+        token=token if latest is None else latest.isoformat(),
+    )
+
+
+def _changes_query(query: typing.Any, token: str | None) -> typing.Any:
+    """Return the query for the documents changed after a token.
+
+    The token is the latest commit time seen, and a change committed after a
+    read always has a later commit time, so no change is missed.
+    """
+    if token is None:
+        return query
+    return query.where(
+        "updated_at", ">", datetime.datetime.fromisoformat(token)
+    ).order_by("updated_at")
+
+
+class ItemFireStore(sc_item_storage.ItemStorage):
     """A class to store items.
 
     This class interfaces with Cloud Firestore to store and retrieve items.
+    Each item is stored in the document `{user_id}_{item name}`, with `%`, `_`
+    and `/` escaped in both parts, and a `user_id` field to query the items of
+    a user. Reads ignore documents whose `user_id` is not the store's. Every
+    write sets the `updated_at` commit time and increments the `version` of the
+    document, and deleted items are kept as tombstones, so clients can sync
+    with `get_changes_since`. Documents written before the change fields
+    existed have no `deleted` field and are read as not deleted, so queries do
+    not filter on `deleted == False`.
+
+    With `buffered=True`, writes go through a write-behind buffer: repeated
+    writes to an item are merged and committed in parallel batches, either once
+    500 items are pending or after `flush_interval` seconds. Reads flush the
+    buffer first, so they see every earlier write. Call `flush` or `close`
+    before shutting down so no write is lost.
+
+    With a `cache`, reads are answered from an `ItemCache`, which can be
+    shared by the stores of every user. Writes from this store invalidate the
+    items they change, and a cache created with `listen=True` follows the
+    changes of other processes with a snapshot listener.
     """
 
-    def __init__(self, user_id: str, db: firestore.Client | None = None):
+    def __init__(
+        self,
+        user_id: str,
+        db: "firestore.Client | None" = None,
+        buffered: bool = False,
+        flush_interval: float = 1.0,
+        cache: sc_item_cache.ItemCache | None = None,
+    ):
         """Initialize the ItemStore with a Firestore client.
 
         Args:
+            user_id: The user whose items are stored.
             db: Optional Firestore client. If not provided, creates a new client.
+            buffered: Whether to buffer writes. Defaults to False, which commits
+                every write before returning.
+            flush_interval: The maximum time a buffered write waits before it is
+                committed, in seconds. Defaults to 1 second.
+            cache: Optional cache for reads. Defaults to reading from Firestore.
         """
         self.user_id = user_id
         if db is None:
-            if not firebase_admin._apps:
-                # Initialize Firebase Admin SDK if not already initialized
-                cred = credentials.ApplicationDefault()
-                firebase_admin.initialize_app(cred)
-            self.db = firestore.client(database="souschet-items")
+            from firebase_admin import firestore
+
+            _initialize_app()
+            self.db = firestore.client(database_id=_DATABASE_ID)
         else:
             self.db = db
 
         self.collection = self.db.collection("items")
+        self._buffer = (
+            sc_write_buffer.WriteBuffer(self.db, flush_interval=flush_interval)
+            if buffered
+            else None
+        )
+        self._cache = cache
+        if cache is not None:
+            cache.watch(self.user_id, self._query())
+
+    def _document_id(self, item_name: str) -> str:
+        return _document_id(self.user_id, item_name)
+
+    def _document(self, item_name: str) -> "firestore.DocumentReference":
+        return self.collection.document(self._document_id(item_name))
+
+    def _query(self) -> "firestore.Query":
+        return self.collection.where("user_id", "==", self.user_id)
+
+    def _item_data(self, item: sc_item.Item) -> dict[str, typing.Any]:
+        return _item_data(self.user_id, item)
+
+    def _invalidate(self, item_names: typing.Iterable[str]):
+        if self._cache is not None:
+            for item_name in item_names:
+                self._cache.invalidate(self.user_id, self._document_id(item_name))
+
+    def flush(self):
+        """Commit the buffered writes and wait until they are durable.
+
+        Does nothing when writes are not buffered.
+        """
+        if self._buffer is not None:
+            self._buffer.flush()
+
+    def close(self):
+        """Commit the buffered writes and stop the write buffer."""
+        if self._buffer is not None:
+            self._buffer.close()
 
     def add_items(self, items: list[sc_item.Item]):
         """Add multiple items to Firestore.
 
+        The items are written in batches of at most 500, Firestore's limit,
+        which are committed in parallel.
+
         Args:
             items: List of Item objects to store
         """
-        batch = self.db.batch()
+        if self._buffer is not None:
+            for item in items:
+                self._buffer.set(
+                    self._document(item.name), self._item_data(item), merge=True
+                )
+            self._invalidate(item.name for item in items)
+            return
 
-        for item in items:
-            doc_ref = self.collection.document(f"{self.user_id}/{item.name}")
-            batch.set(doc_ref, item.to_dict(), merge=True)
-        batch.commit()
+        # Keep the last write of each item, as a batch writes a document once.
+        writes = {
+            item.name: sc_write_buffer.Write(
+                self._document(item.name), self._item_data(item), merge=True
+            )
+            for item in items
+        }
+        try:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=4) as executor:
+                sc_write_buffer.commit_writes(
+                    self.db, writes.values(), executor=executor
+                )
+        finally:
+            self._invalidate(writes)
 
     def get_items(self) -> list[sc_item.Item]:
         """Retrieve all items from Firestore.
@@ -46,8 +258,57 @@ class ItemFireStore:
         Returns:
             List of Item objects
         """
-        docs = self.collection.where("user_id", "==", self.user_id).stream()
-        return [sc_item.Item.from_dict(doc.to_dict()) for doc in docs]
+        self.flush()
+        if self._cache is None:
+            docs = [doc.to_dict() for doc in self._query().stream()]
+        else:
+            docs = self._cache.get_items(
+                self.user_id,
+                lambda: {doc.id: doc.to_dict() for doc in self._query().stream()},
+            ).values()
+        items = (_decode(data, self.user_id) for data in docs)
+        return [item for item in items if item is not None]
+
+    def iter_items(
+        self, page_size: int = 300, fields: list[str] | None = None
+    ) -> typing.Iterator[sc_item.Item]:
+        """Iterate over all items, reading them from Firestore page by page.
+
+        Pages are read with `start_after` cursors, and each item is yielded as
+        soon as it is decoded, so only one page is held in memory at a time.
+        Unlike `get_items`, the items are always read from Firestore.
+
+        Args:
+            page_size: The number of documents read per request. Defaults to 300.
+            fields: Optional document fields to read. The fields needed to
+                create an Item are always read, so for example
+                `fields=[]` skips the nutritional facts. Defaults to all fields.
+
+        Yields:
+            Item objects, ordered by document id
+        """
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+
+        self.flush()
+        query = self._query().order_by("__name__")
+        if fields is not None:
+            query = query.select(
+                sorted({*_REQUIRED_FIELDS, "deleted", "user_id", *fields})
+            )
+
+        last_doc = None
+        while True:
+            page = query if last_doc is None else query.start_after(last_doc)
+            count = 0
+            for doc in page.limit(page_size).stream():
+                count += 1
+                last_doc = doc
+                item = _decode(doc.to_dict(), self.user_id)
+                if item is not None:
+                    yield item
+            if count < page_size:
+                return
 
     def get_item(self, item_name: str) -> sc_item.Item:
         """Retrieve a specific item by name.
@@ -61,13 +322,99 @@ class ItemFireStore:
         Raises:
             KeyError: If item is not found
         """
-        doc_ref = self.collection.document(f"{self.user_id}/{item_name}")
-        doc = doc_ref.get()
+        self.flush()
+
+        def load() -> dict[str, typing.Any] | None:
+            doc = self._document(item_name).get()
+            return doc.to_dict() if doc.exists else None
 
-        if not doc.exists:
+        if self._cache is None:
+            data = load()
+        else:
+            data = self._cache.get_item(
+                self.user_id, self._document_id(item_name), load
+            )
+
+        item = _decode(data, self.user_id)
+        if item is None:
             raise KeyError(f"Item '{item_name}' not found")
 
-        return sc_item.Item.from_dict(doc.to_dict())
+        return item
+
+    def get_items_by_names(self, item_names: list[str]) -> list[sc_item.Item | None]:
+        """Retrieve specific items by name in one `get_all` request.
+
+        Args:
+            item_names: Names of the items to retrieve
+
+        Returns:
+            The item of each name, in the order of the names, or None for the
+            names of missing items
+        """
+        self.flush()
+        doc_ids = [self._document_id(item_name) for item_name in item_names]
+
+        def load(doc_ids: list[str]) -> dict[str, dict[str, typing.Any] | None]:
+            refs = [self.collection.document(doc_id) for doc_id in doc_ids]
+            return {
+                doc.id: doc.to_dict() if doc.exists else None
+                for doc in self.db.get_all(refs)
+            }
+
+        if self._cache is None:
+            found = load(list(dict.fromkeys(doc_ids))) if doc_ids else {}
+        else:
+            found = self._cache.get_many(self.user_id, doc_ids, load)
+        return [_decode(found.get(doc_id), self.user_id) for doc_id in doc_ids]
+
+    def get_expiring_items(
+        self,
+        within_days: int,
+        storage: sc_types.StorageType | None = None,
+        limit: int = 100,
+    ) -> list[sc_item.Item]:
+        """Retrieve the items that expire within `within_days` days.
+
+        Firestore filters the items on their `expiration_date` and `storage`
+        fields, so only the matching documents are read. The query needs the
+        composite indexes in `firestore.indexes.json`. Tombstones have no
+        expiration date; older ones that kept it are skipped, reading further
+        pages until `limit` items are found. Items are always read from
+        Firestore.
+
+        Args:
+            within_days: The number of days from today. 0 returns the items
+                that expire today or earlier.
+            storage: Optional storage type of the items. Defaults to all.
+            limit: The maximum number of items. Defaults to 100.
+
+        Returns:
+            List of Item objects, ordered by expiration date
+        """
+        cutoff = sc_item_storage.expiration_cutoff(within_days, limit)
+        self.flush()
+        query = self._query()
+        if storage is not None:
+            query = query.where("storage", "==", storage.name)
+        # ISO dates sort like the dates they represent.
+        query = query.where("expiration_date", "<=", cutoff.isoformat()).order_by(
+            "expiration_date"
+        )
+
+        items, last_doc = [], None
+        while True:
+            page = query if last_doc is None else query.start_after(last_doc)
+            count = 0
+            for doc in page.limit(limit).stream():
+                count += 1
+                last_doc = doc
+                item = _decode(doc.to_dict(), self.user_id)
+                if item is not None:
+                    items.append(item)
+                    if len(items) == limit:
+                        return items
+            if count < limit:
+                return items
 
     def update_item(self, item: sc_item.Item):
         """Update an item in Firestore.
@@ -75,14 +422,326 @@ class ItemFireStore:
         Args:
             item: Item object to update
         """
-        doc_ref = self.collection.document(f"{self.user_id}/{item.name}")
-        doc_ref.set(item.model_dump_json(), merge=True)
+        try:
+            if self._buffer is not None:
+                self._buffer.set(
+                    self._document(item.name), self._item_data(item), merge=True
+                )
+            else:
+                self._document(item.name).set(self._item_data(item), merge=True)
+        finally:
+            self._invalidate([item.name])
 
     def delete_item(self, item_name: str):
         """Delete an item from Firestore.
 
+        The document is kept as a tombstone, so `get_changes_since` can report
+        the deletion. See `purge_tombstones`.
+
+        Args:
+            item_name: Name of the item to delete
+        """
+        data = _tombstone(self.user_id, item_name)
+        try:
+            if self._buffer is not None:
+                self._buffer.set(self._document(item_name), data, merge=True)
+            else:
+                self._document(item_name).set(data, merge=True)
+        finally:
+            self._invalidate([item_name])
+
+    def cook_recipe(
+        self, recipe: sc_recipe.Recipe, max_attempts: int = 5
+    ) -> list[sc_item.Item | None]:
+        """Use up the ingredients of a recipe in one Firestore transaction.
+
+        The transaction reads the items of every ingredient, converts each
+        ingredient to the unit of its item and writes all the updated items at
+        once. Firestore retries it if another writer changes one of the items
+        in the meantime. Items that are used up are deleted.
+
+        Args:
+            recipe: The recipe, whose ingredients are named like the items.
+            max_attempts: The maximum number of attempts of the transaction.
+                Defaults to 5.
+
+        Returns:
+            The updated item of each ingredient, in the order of the
+            ingredients, or None for items that were used up and skipped
+            staples
+
+        Raises:
+            ValueError: If an item is missing or short, or an ingredient unit
+                cannot be converted to the unit of its item.
+        """
+        from google.cloud import firestore
+
+        self.flush()
+        names = list(
+            dict.fromkeys(ingredient.name for ingredient in recipe.ingredients)
+        )
+
+        @firestore.transactional
+        def cook(transaction: "firestore.Transaction") -> dict:
+            refs = [self._document(name) for name in names]
+            docs = {
+                doc.id: doc.to_dict() if doc.exists else None
+                for doc in self.db.get_all(refs, transaction=transaction)
+            }
+            items = {
+                name: _decode(docs.get(self._document_id(name)), self.user_id)
+                for name in names
+            }
+            updated = sc_item_storage.consume_ingredients(recipe, items)
+            for name, item in updated.items():
+                data = (
+                    _tombstone(self.user_id, name)
+                    if item is None
+                    else self._item_data(item)
+                )
+                transaction.set(self._document(name), data, merge=True)
+            return updated
+
+        try:
+            updated = cook(self.db.transaction(max_attempts=max_attempts))
+        finally:
+            self._invalidate(names)
+        return [updated.get(ingredient.name) for ingredient in recipe.ingredients]
+
+    def get_changes_since(
+        self, token: str | None = None
+    ) -> sc_item_storage.ItemChanges:
+        """Retrieve the items added, modified or deleted since a sync token.
+
+        Args:
+            token: The token returned by the previous call. Defaults to None,
+                which returns every item.
+
+        Returns:
+            The changes and the token for the next call
+        """
+        self.flush()
+        docs = _changes_query(self._query(), token).stream()
+        return _changes((doc.to_dict() for doc in docs), token, self.user_id)
+
+    def purge_tombstones(self, older_than: datetime.timedelta) -> int:
+        """Delete the tombstones of items deleted more than `older_than` ago.
+
+        Clients whose token is older than that must sync again from None, as
+        they would miss these deletions.
+
+        Args:
+            older_than: The minimum age of the tombstones to delete.
+
+        Returns:
+            The number of deleted tombstones
+        """
+        self.flush()
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - older_than
+        docs = (
+            self._query()
+            .where("deleted", "==", True)
+            .where("updated_at", "<", cutoff)
+            .stream()
+        )
+        writes = [sc_write_buffer.Write(doc.reference, None, False) for doc in docs]
+        sc_write_buffer.commit_writes(self.db, writes)
+        return len(writes)
+
+
+class AsyncItemFireStore:
+    """A class to store items with the asynchronous Firestore client.
+
+    It has the same API and document layout as `ItemFireStore`, but every
+    method is a coroutine, so an async server can serve many users at once
+    without a thread pool. See `fan_out` and `get_inventories` to run requests
+    concurrently.
+    """
+
+    def __init__(self, user_id: str, db: "firestore.AsyncClient | None" = None):
+        """Initialize the AsyncItemFireStore with an async Firestore client.
+
+        Args:
+            user_id: The user whose items are stored.
+            db: Optional async Firestore client. If not provided, creates a new
+                client.
+        """
+        self.user_id = user_id
+        if db is None:
+            from firebase_admin import firestore_async
+
+            _initialize_app()
+            self.db = firestore_async.client(database_id=_DATABASE_ID)
+        else:
+            self.db = db
+
+        self.collection = self.db.collection("items")
+
+    def _document(self, item_name: str) -> "firestore.AsyncDocumentReference":
+        return self.collection.document(_document_id(self.user_id, item_name))
+
+    def _item_data(self, item: sc_item.Item) -> dict[str, typing.Any]:
+        return _item_data(self.user_id, item)
+
+    async def add_items(self, items: list[sc_item.Item]):
+        """Add multiple items to Firestore.
+
+        The items are written in batches of at most 500, Firestore's limit,
+        which are committed concurrently.
+
+        Args:
+            items: List of Item objects to store
+        """
+        # Keep the last write of each item, as a batch writes a document once.
+        items = list({item.name: item for item in items}.values())
+        batches = []
+        for start in range(0, len(items), sc_write_buffer.MAX_BATCH_WRITES):
+            batch = self.db.batch()
+            for item in items[start : start + sc_write_buffer.MAX_BATCH_WRITES]:
+                batch.set(self._document(item.name), self._item_data(item), merge=True)
+            batches.append(batch)
+        await asyncio.gather(*(batch.commit() for batch in batches))
+
+    async def get_items(self) -> list[sc_item.Item]:
+        """Retrieve all items from Firestore.
+
+        Returns:
+            List of Item objects
+        """
+        query = self.collection.where("user_id", "==", self.user_id)
+        items = [_decode(doc.to_dict(), self.user_id) async for doc in query.stream()]
+        return [item for item in items if item is not None]
+
+    async def get_item(self, item_name: str) -> sc_item.Item:
+        """Retrieve a specific item by name.
+
+        Args:
+            item_name: Name of the item to retrieve
+
+        Returns:
+            Item object if found
+
+        Raises:
+            KeyError: If item is not found
+        """
+        doc = await self._document(item_name).get()
+
+        item = _decode(doc.to_dict() if doc.exists else None, self.user_id)
+        if item is None:
+            raise KeyError(f"Item '{item_name}' not found")
+
+        return item
+
+    async def get_items_by_names(
+        self, item_names: list[str]
+    ) -> list[sc_item.Item | None]:
+        """Retrieve specific items by name in one `get_all` request.
+
+        Args:
+            item_names: Names of the items to retrieve
+
+        Returns:
+            The item of each name, in the order of the names, or None for the
+            names of missing items
+        """
+        doc_ids = [_document_id(self.user_id, item_name) for item_name in item_names]
+        found = {}
+        if doc_ids:
+            refs = [
+                self.collection.document(doc_id) for doc_id in dict.fromkeys(doc_ids)
+            ]
+            async for doc in self.db.get_all(refs):
+                if doc.exists:
+                    found[doc.id] = _decode(doc.to_dict(), self.user_id)
+        return [found.get(doc_id) for doc_id in doc_ids]
+
+    async def update_item(self, item: sc_item.Item):
+        """Update an item in Firestore.
+
+        Args:
+            item: Item object to update
+        """
+        await self._document(item.name).set(self._item_data(item), merge=True)
+
+    async def delete_item(self, item_name: str):
+        """Delete an item from Firestore, keeping a tombstone.
+
         Args:
             item_name: Name of the item to delete
         """
-        doc_ref = self.collection.document(f"{self.user_id}/{item_name}")
-        doc_ref.delete()
+        await self._document(item_name).set(
+            _tombstone(self.user_id, item_name), merge=True
+        )
+
+    async def get_changes_since(
+        self, token: str | None = None
+    ) -> sc_item_storage.ItemChanges:
+        """Retrieve the items added, modified or deleted since a sync token.
+
+        Args:
+            token: The token returned by the previous call. Defaults to None,
+                which returns every item.
+
+        Returns:
+            The changes and the token for the next call
+        """
+        query = _changes_query(
+            self.collection.where("user_id", "==", self.user_id), token
+        )
+        return _changes(
+            [doc.to_dict() async for doc in query.stream()], token, self.user_id
+        )
+
+
+async def fan_out(
+    calls: typing.Iterable[typing.Callable[[], typing.Awaitable[T]]],
+    max_concurrency: int = 32,
+) -> list[T]:
+    """Run async calls concurrently, with at most `max_concurrency` at a time.
+
+    Args:
+        calls: Functions that start each call, such as
+            `lambda: store.get_item("rice")`.
+        max_concurrency: The maximum number of calls running at once. Defaults
+            to 32.
+
+    Returns:
+        The results of the calls, in the order of the calls.
+
+    Raises:
+        Exception: The error of the first call that failed.
+    """
+    if max_concurrency <= 0:
+        raise ValueError("max_concurrency must be positive")
+
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def run(call: typing.Callable[[], typing.Awaitable[T]]) -> T:
+        async with semaphore:
+            return await call()
+
+    return await asyncio.gather(*(run(call) for call in calls))
+
+
+async def get_inventories(
+    user_ids: list[str],
+    db: "firestore.AsyncClient | None" = None,
+    max_concurrency: int = 32,
+) -> dict[str, list[sc_item.Item]]:
+    """Retrieve the items of many users concurrently.
+
+    Args:
+        user_ids: The users.
+        db: Optional async Firestore client shared by the reads. If not
+            provided, creates a new client.
+        max_concurrency: The maximum number of users read at once. Defaults to
+            32.
+
+    Returns:
+        The items of each user, by user id.
+    """
+    if db is None and user_ids:
+        db = AsyncItemFireStore(user_ids[0]).db
+    stores = [AsyncItemFireStore(user_id, db) for user_id in user_ids]
+    inventories = await fan_out([store.get_items for store in stores], max_concurrency)
+    return dict(zip(user_ids, inventories))
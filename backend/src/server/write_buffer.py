@@ -0,0 +1,257 @@
+import concurrent.futures
+import logging
+import threading
+import typing
+
+
+# Firestore rejects batches and transactions with more writes than this.
+MAX_BATCH_WRITES = 500
+
+
+class Write(typing.NamedTuple):
+    """A pending write to one document. `data` is None for a delete."""
+
+    doc_ref: typing.Any
+    data: dict[str, typing.Any] | None
+    merge: bool
+
+
+def _merge(pending: Write | None, write: Write) -> Write:
+    """Combines a pending write with a newer write to the same document."""
+    if pending is None or write.data is None or not write.merge:
+        return write
+    if pending.data is None:
+        # The document is deleted first, so the merge sets the whole document.
+        return Write(write.doc_ref, dict(write.data), merge=False)
+    return Write(write.doc_ref, {**pending.data, **write.data}, pending.merge)
+
+
+def commit_writes(
+    db: typing.Any,
+    writes: typing.Iterable[Write],
+    max_batch_size: int = MAX_BATCH_WRITES,
+    executor: concurrent.futures.Executor | None = None,
+    failed: list[Write] | None = None,
+):
+    """
+    Commits writes in batches of at most `max_batch_size` writes.
+
+    The batches are committed in parallel when an executor is given, and one
+    after the other otherwise. Each batch commits or fails as a whole, so
+    `failed` tells which writes to retry.
+
+    Args:
+        db (firestore.Client): The Firestore client.
+        writes (Iterable[Write]): The writes, at most one per document.
+        max_batch_size (int): The maximum number of writes per batch. Defaults to
+            500, Firestore's limit.
+        executor (concurrent.futures.Executor | None): Optional executor used to
+            commit the batches in parallel.
+        failed (list[Write] | None): Optional list, extended with the writes of
+            the batches that failed to commit.
+
+    Raises:
+        Exception: The error of the first batch that failed, after every batch
+            was attempted.
+    """
+    writes = list(writes)
+    chunks = [
+        writes[start : start + max_batch_size]
+        for start in range(0, len(writes), max_batch_size)
+    ]
+    batches = []
+    for chunk in chunks:
+        batch = db.batch()
+        for write in chunk:
+            if write.data is None:
+                batch.delete(write.doc_ref)
+            else:
+                batch.set(write.doc_ref, write.data, merge=write.merge)
+        batches.append(batch)
+
+    if executor is None or len(batches) == 1:
+        results = []
+        for batch in batches:
+            try:
+                batch.commit()
+                results.append(None)
+            except Exception as e:
+                results.append(e)
+    else:
+        futures = [executor.submit(batch.commit) for batch in batches]
+        results = [future.exception() for future in futures]
+
+    errors = [error for error in results if error is not None]
+    if failed is not None:
+        for chunk, error in zip(chunks, results):
+            if error is not None:
+                failed.extend(chunk)
+    if errors:
+        raise errors[0]
+
+
+class WriteBuffer:
+    """
+    A write-behind buffer for Firestore documents.
+
+    Writes are kept in memory and committed later, in batches of at most 500
+    writes that are committed in parallel. Repeated writes to the same document
+    are merged into one write, so only the last state of each document is sent.
+    The buffer is flushed once it holds `max_batch_size` documents, once the
+    oldest pending write is `flush_interval` seconds old, and when `flush` or
+    `close` is called.
+
+    Writes whose batch fails to commit are kept and retried with the next
+    flush, merged with any newer write to the same document. The writes of the
+    batches that committed are not retried.
+    """
+
+    def __init__(
+        self,
+        db: typing.Any,
+        max_batch_size: int = MAX_BATCH_WRITES,
+        flush_interval: float = 1.0,
+        max_workers: int = 4,
+    ):
+        """
+        Initializes the WriteBuffer.
+
+        Args:
+            db (firestore.Client): The Firestore client.
+            max_batch_size (int): The number of pending documents that triggers a
+                flush, and the maximum number of writes per batch. Defaults to 500.
+            flush_interval (float): The maximum time a write stays in the buffer,
+                in seconds. Defaults to 1 second.
+            max_workers (int): The number of batches committed in parallel.
+                Defaults to 4.
+        """
+        if not 0 < max_batch_size <= MAX_BATCH_WRITES:
+            raise ValueError(f"max_batch_size must be between 1 and {MAX_BATCH_WRITES}")
+
+        self._db = db
+        self._max_batch_size = max_batch_size
+        self._flush_interval = flush_interval
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="write-buffer"
+        )
+        self._pending: dict[str, Write] = {}
+        self._lock = threading.Lock()
+        # Held while a flush commits, so `flush` returns after earlier flushes.
+        self._flush_lock = threading.Lock()
+        # Set when the buffer gets its first pending write.
+        self._wake = threading.Event()
+        # Set when the buffer is full, which ends the time window early.
+        self._full = threading.Event()
+        self._closed = False
+        self.flushes = 0
+        self.merged_writes = 0
+        self._thread = threading.Thread(
+            target=self._run, name="write-buffer-flusher", daemon=True
+        )
+        self._thread.start()
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def set(
+        self, doc_ref: typing.Any, data: dict[str, typing.Any], merge: bool = False
+    ):
+        """
+        Buffers setting a document.
+
+        Args:
+            doc_ref (firestore.DocumentReference): The document.
+            data (dict[str, Any]): The fields of the document.
+            merge (bool): Whether to merge the fields into the existing document
+                instead of replacing it. Defaults to False.
+        """
+        self._add(Write(doc_ref, dict(data), merge))
+
+    def delete(self, doc_ref: typing.Any):
+        """
+        Buffers deleting a document.
+
+        Args:
+            doc_ref (firestore.DocumentReference): The document.
+        """
+        self._add(Write(doc_ref, None, False))
+
+    def _add(self, write: Write):
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The write buffer is closed.")
+            pending = self._pending.get(write.doc_ref.path)
+            if pending is not None:
+                self.merged_writes += 1
+            self._pending[write.doc_ref.path] = _merge(pending, write)
+            if len(self._pending) == 1:
+                self._wake.set()
+            if len(self._pending) >= self._max_batch_size:
+                self._full.set()
+
+    def flush(self):
+        """
+        Commits every pending write and waits until they are durable.
+
+        Raises:
+            Exception: The error of a batch that failed to commit. Its writes are
+                kept for the next flush.
+        """
+        with self._flush_lock:
+            with self._lock:
+                writes, self._pending = self._pending, {}
+            if not writes:
+                return
+            failed: list[Write] = []
+            try:
+                commit_writes(
+                    self._db,
+                    writes.values(),
+                    self._max_batch_size,
+                    self._executor,
+                    failed,
+                )
+            except Exception:
+                # Writes are not idempotent, as they increment counters like
+                # `version`, so only the writes of the failed batches are
+                # retried. Newer writes to a document apply on top.
+                with self._lock:
+                    for write in failed:
+                        path = write.doc_ref.path
+                        self._pending[path] = (
+                            _merge(write, self._pending[path])
+                            if path in self._pending
+                            else write
+                        )
+                raise
+            finally:
+                self.flushes += 1
+
+    def close(self):
+        """Flushes the pending writes and stops the buffer."""
+        with self._lock:
+            self._closed = True
+        self._wake.set()
+        self._full.set()
+        self._thread.join()
+        try:
+            self.flush()
+        finally:
+            self._executor.shutdown()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            # Wait out the time window, unless the buffer fills up or is closed.
+            self._full.wait(self._flush_interval)
+            self._full.clear()
+            if self._closed:
+                return
+            try:
+                self.flush()
+            except Exception as e:
+                logging.warning(f"Failed to flush buffered writes, will retry: {e}")
+            with self._lock:
+                if self._pending:
+                    self._wake.set()
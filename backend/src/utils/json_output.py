@@ -0,0 +1,201 @@
+import typing
+
+import orjson
+import pydantic
+
+
+def response_format(model: type[pydantic.BaseModel]) -> dict[str, typing.Any]:
+    """
+    Builds an OpenAI `response_format` that constrains output to a model's schema.
+
+    Args:
+        model (type[pydantic.BaseModel]): The model the output must match.
+
+    Returns:
+        dict[str, Any]: The `response_format` request parameter.
+    """
+    return {
+        "type": "json_schema",
+        "json_schema": {
+            "name": model.__name__,
+            "schema": model.model_json_schema(),
+            # Strict mode requires every field to be required and forbids
+            # open-ended objects such as `dict[int, str]`.
+            "strict": False,
+        },
+    }
+
+
+def strip_code_fence(text: str) -> str:
+    """
+    Removes a surrounding markdown code block, if there is one.
+
+    Args:
+        text (str): Model output that may contain a ```json code block.
+
+    Returns:
+        str: The contents of the code block, or the stripped text.
+    """
+    text = text.strip()
+    start = text.find("```")
+    if start == -1:
+        return text
+
+    # Skip the language tag on the opening fence.
+    newline = text.find("\n", start)
+    if newline == -1:
+        return ""
+    end = text.rfind("```")
+    if end <= start:
+        # The closing fence was truncated.
+        return text[newline + 1 :].strip()
+    return text[newline + 1 : end].strip()
+
+
+def repair_truncated_json(text: str) -> str:
+    """
+    Closes JSON that was cut off mid-document.
+
+    Open strings, arrays and objects are closed. If that is not enough, for
+    example because the text ends in the middle of a key or a number, the last
+    incomplete element is dropped instead.
+
+    Args:
+        text (str): JSON text that may be truncated.
+
+    Returns:
+        str: JSON text with every open string, array and object closed.
+    """
+    stack = []
+    in_string = False
+    escape = False
+    # Position to cut at, and the containers still open there, if the last
+    # element turns out to be unusable.
+    cut = None
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            stack.append(char)
+            cut = (i + 1, list(stack))
+        elif char in "}]":
+            if stack:
+                stack.pop()
+        elif char == ",":
+            cut = (i, list(stack))
+
+    if not stack and not in_string:
+        return text
+
+    closers = {"{": "}", "[": "]"}
+    repaired = text
+    if escape:
+        repaired = repaired[:-1]
+    if in_string:
+        repaired += '"'
+    repaired = repaired.rstrip() + "".join(closers[c] for c in reversed(stack))
+    try:
+        orjson.loads(repaired)
+        return repaired
+    except orjson.JSONDecodeError:
+        pass
+
+    if cut is None:
+        return repaired
+    position, open_containers = cut
+    return text[:position] + "".join(closers[c] for c in reversed(open_containers))
+
+
+def drop_truncated_member(text: str) -> str | None:
+    """
+    Closes a JSON object that was cut off, without its last member.
+
+    The last member may have been cut off anywhere, for example in the middle of
+    a list, so it is dropped whole. Every member that is kept is complete.
+
+    Args:
+        text (str): JSON text that may be truncated.
+
+    Returns:
+        str | None: The JSON object without its last member, or None if the text
+            is not an object that was cut off.
+    """
+    if not text.startswith("{"):
+        return None
+
+    depth = 0
+    in_string = False
+    escape = False
+    # End of the last complete member of the object.
+    end = 1
+    for i, char in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif char == "\\":
+                escape = True
+            elif char == '"':
+                in_string = False
+            continue
+
+        if char == '"':
+            in_string = True
+        elif char in "{[":
+            depth += 1
+        elif char in "}]":
+            depth -= 1
+            if depth == 0:
+                return None
+        elif char == "," and depth == 1:
+            end = i
+
+    return text[:end] + "}"
+
+
+def parse_json_output(text: str) -> typing.Any:
+    """
+    Parses JSON produced by a language model.
+
+    Well-formed JSON is parsed directly with orjson. Otherwise any markdown code
+    block is removed before parsing again. Truncated output is only recovered
+    when it is an object, by dropping its last member; callers must validate
+    the result against their schema, which fails if a required member is the
+    one that was cut off.
+
+    Args:
+        text (str): The model output.
+
+    Returns:
+        Any: The parsed JSON value.
+
+    Raises:
+        ValueError: If the output cannot be parsed as JSON.
+    """
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError as e:
+        error = e
+
+    text = strip_code_fence(text)
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError as e:
+        error = e
+
+    repaired = drop_truncated_member(text)
+    if repaired is None:
+        raise ValueError(f"Output is not valid JSON: {error}")
+    try:
+        return orjson.loads(repaired)
+    except orjson.JSONDecodeError as e:
+        raise ValueError(f"Output is not valid JSON: {e}")
@@ -0,0 +1,215 @@
+import atexit
+import json
+import os
+import re
+import threading
+import time
+import typing
+from collections import OrderedDict
+
+
+# Words that do not change the meaning of a search query.
+_STOP_WORDS = frozenset(
+    {"a", "an", "and", "the", "of", "for", "in", "on", "per", "to", "with", "how"}
+)
+
+# Shared cache used by all agents unless they are given their own.
+_default_cache: "SearchCache | None" = None
+_default_cache_lock = threading.Lock()
+
+
+class SearchCache:
+    """
+    A thread-safe TTL cache for search tool results.
+
+    Queries are normalized before lookup so that near-identical queries such as
+    "Chicken breast nutrition per 4 oz" and "chicken breast nutrition 4oz" share
+    one entry. Entries expire after a TTL and the least recently used entry is
+    evicted once the cache is full.
+
+    Attributes:
+        hits (int): The number of lookups answered from the cache.
+        misses (int): The number of lookups that required running the search.
+    """
+
+    def __init__(
+        self,
+        ttl_seconds: float = 7 * 24 * 60 * 60,
+        max_size: int = 4096,
+        path: str | None = None,
+        clock: typing.Callable[[], float] = time.time,
+    ):
+        """
+        Initializes the SearchCache.
+
+        Args:
+            ttl_seconds (float): How long an entry stays valid. Defaults to one week.
+            max_size (int): The maximum number of entries kept. Defaults to 4096.
+            path (str | None): Optional JSON file used to persist the cache.
+            clock (Callable[[], float]): Returns the current time in seconds.
+        """
+        if max_size <= 0:
+            raise ValueError("max_size must be positive")
+
+        self._ttl_seconds = ttl_seconds
+        self._max_size = max_size
+        self._path = path
+        self._clock = clock
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        if path is not None and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        """
+        Normalizes a query so that near-identical queries map to the same key.
+
+        Args:
+            query (str): The raw search query.
+
+        Returns:
+            str: The normalized query.
+        """
+        query = query.lower()
+        # Join numbers to their units ("4 oz" -> "4oz").
+        query = re.sub(r"(\d)\s+([a-z])", r"\1\2", query)
+        tokens = re.findall(r"[a-z0-9.]+", query)
+        tokens = [token.strip(".") for token in tokens if token not in _STOP_WORDS]
+        return " ".join(sorted(token for token in tokens if token))
+
+    @property
+    def hit_rate(self) -> float:
+        """
+        Returns the fraction of lookups answered from the cache.
+
+        Returns:
+            float: The hit rate, or 0.0 if there have been no lookups.
+        """
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, query: str) -> str | None:
+        """
+        Looks up a cached result and records a hit or a miss.
+
+        Args:
+            query (str): The search query.
+
+        Returns:
+            str | None: The cached result, or None if missing or expired.
+        """
+        key = self.normalize_query(query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def set(self, query: str, result: str):
+        """
+        Stores a result, evicting the least recently used entry if full.
+
+        Args:
+            query (str): The search query.
+            result (str): The search result to cache.
+        """
+        key = self.normalize_query(query)
+        with self._lock:
+            self._entries[key] = (self._clock() + self._ttl_seconds, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def wrap(self, func: typing.Callable[[str], str]) -> typing.Callable[[str], str]:
+        """
+        Wraps a search function so that its results are served from the cache.
+
+        Args:
+            func (Callable[[str], str]): The search function to wrap.
+
+        Returns:
+            Callable[[str], str]: A function with the same signature as `func`.
+        """
+
+        def cached_search(query: str) -> str:
+            result = self.get(query)
+            if result is None:
+                result = func(query)
+                self.set(query, result)
+            return result
+
+        return cached_search
+
+    def save(self):
+        """
+        Writes the unexpired entries to the cache file.
+
+        Raises:
+            ValueError: If the cache was created without a path.
+        """
+        if self._path is None:
+            raise ValueError("SearchCache has no path to save to.")
+
+        now = self._clock()
+        with self._lock:
+            entries = {
+                key: entry for key, entry in self._entries.items() if entry[0] > now
+            }
+
+        tmp_path = f"{self._path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self._path)
+
+    def load(self):
+        """
+        Loads the unexpired entries from the cache file.
+
+        Raises:
+            ValueError: If the cache was created without a path.
+        """
+        if self._path is None:
+            raise ValueError("SearchCache has no path to load from.")
+
+        with open(self._path) as f:
+            entries = json.load(f)
+
+        now = self._clock()
+        with self._lock:
+            for key, (expires_at, result) in entries.items():
+                if expires_at > now:
+                    self._entries[key] = (expires_at, result)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+
+def get_default_cache() -> SearchCache:
+    """
+    Returns the search cache shared by all agents in this process.
+
+    If the SEARCH_CACHE_PATH environment variable is set, the cache is loaded
+    from that file and saved back to it when the process exits.
+
+    Returns:
+        SearchCache: The shared search cache.
+    """
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            path = os.getenv("SEARCH_CACHE_PATH")
+            _default_cache = SearchCache(path=path)
+            if path is not None:
+                atexit.register(_default_cache.save)
+        return _default_cache
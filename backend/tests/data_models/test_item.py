@@ -118,6 +118,23 @@ def test_item_equality():
     assert hash(item1) != hash(item3)
 
 
+def test_dict_round_trip_keeps_expiration_date():
+    item = sc_item.Item(
+        name="milk",
+        quantity=sc_quantity.Quantity(quantity=1, unit=sc_types.Unit.GALLONS),
+        shelf_life=datetime.timedelta(days=7),
+        storage=sc_types.StorageType.FRIDGE,
+    )
+    data = item.to_dict()
+    assert data["storage"] == "FRIDGE"
+
+    # An item stored a week ago expires today, not a week from now.
+    data["expiration_date"] = datetime.datetime.now().date().isoformat()
+    restored = sc_item.Item.from_dict(data)
+    assert restored.expiration_date == datetime.datetime.now().date()
+    assert restored.shelf_life == datetime.timedelta(days=7)
+
+
 def test_parse_shelf_life():
     """Test the shelf life parsing function with various formats."""
     test_cases = [
@@ -0,0 +1,120 @@
+import pytest
+import sys
+import threading
+import time
+
+from src.server import agent_registry as sc_agent_registry
+
+
+class SlowAgent:
+    builds = 0
+
+    def __init__(self, model: str = "gpt-4o", tiers: list[str] | None = None):
+        time.sleep(0.05)
+        type(self).builds += 1
+        self.model = model
+        self.tiers = tiers
+
+
+class FailingAgent:
+    attempts = 0
+
+    def __init__(self):
+        type(self).attempts += 1
+        if type(self).attempts == 1:
+            raise RuntimeError("missing API key")
+
+
+@pytest.fixture(autouse=True)
+def reset_counters():
+    SlowAgent.builds = 0
+    FailingAgent.attempts = 0
+
+
+@pytest.fixture
+def registry():
+    return sc_agent_registry.AgentRegistry()
+
+
+def test_get_builds_each_config_once(registry):
+    agent = registry.get(SlowAgent, model="gpt-4o-mini")
+
+    assert registry.get(SlowAgent, model="gpt-4o-mini") is agent
+    assert registry.get(SlowAgent, model="gpt-4o") is not agent
+    assert SlowAgent.builds == 2
+
+
+def test_get_with_unhashable_config(registry):
+    agent = registry.get(SlowAgent, tiers=["gpt-4o-mini", "gpt-4o"])
+
+    assert registry.get(SlowAgent, tiers=["gpt-4o-mini", "gpt-4o"]) is agent
+    assert SlowAgent.builds == 1
+
+
+def test_concurrent_get_builds_once(registry):
+    agents = []
+
+    def get():
+        agents.append(registry.get(SlowAgent))
+
+    threads = [threading.Thread(target=get) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert SlowAgent.builds == 1
+    assert all(agent is agents[0] for agent in agents)
+
+
+def test_failed_build_is_retried(registry):
+    with pytest.raises(RuntimeError):
+        registry.get(FailingAgent)
+
+    assert isinstance(registry.get(FailingAgent), FailingAgent)
+    assert FailingAgent.attempts == 2
+
+
+def test_warm_up(registry):
+    thread = registry.warm_up([(SlowAgent, {}), (FailingAgent, {})])
+    thread.join()
+
+    assert SlowAgent.builds == 1
+    registry.get(SlowAgent)
+    assert SlowAgent.builds == 1
+
+
+def test_clear(registry):
+    agent = registry.get(SlowAgent)
+    registry.clear()
+
+    assert registry.get(SlowAgent) is not agent
+
+
+class Preferences:
+    def __repr__(self) -> str:
+        return "Preferences()"
+
+
+def test_get_compares_objects_by_identity(registry):
+    first, second = Preferences(), Preferences()
+    agent = registry.get(SlowAgent, model=first)
+
+    assert registry.get(SlowAgent, model=first) is agent
+    assert registry.get(SlowAgent, model=second) is not agent
+    assert registry.get(SlowAgent, model="Preferences()") is not agent
+    assert SlowAgent.builds == 3
+
+
+def test_clear_during_failed_build(registry):
+    class ClearingAgent:
+        def __init__(self):
+            registry.clear()
+            raise RuntimeError("missing API key")
+
+    with pytest.raises(RuntimeError, match="missing API key"):
+        registry.get(ClearingAgent)
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,383 @@
+import datetime
+import http.server
+import json
+import pytest
+import re
+import sys
+import threading
+import time
+
+from src.data_models import quantity as sc_quantity
+from src.data_models.item import Item
+from src.data_models.user import UserPreferences
+from src.server import create_recipe as sc_create_recipe
+from src.server import llm_scheduler as sc_llm_scheduler
+from src.server import recipe_corpus as sc_recipe_corpus
+from src.server import recipe_stream as sc_recipe_stream
+from src.utils import search_cache as sc_search_cache
+from src.utils import types as sc_types
+
+
+def recipe_json(name: str, ingredients: list[tuple[str, float, str]]) -> str:
+    return json.dumps(
+        {
+            "name": name,
+            "description": f"A {name.lower()}.",
+            "ingredients": [
+                {"name": ingredient, "quantity": quantity, "unit": unit}
+                for ingredient, quantity, unit in ingredients
+            ],
+            "instructions": {"1": "Cook everything.", "2": "Serve."},
+        }
+    )
+
+
+# Reply of the fake model for each cuisine hint, and how long it takes.
+RECIPES_BY_CUISINE = {
+    "Mexican": (0.0, recipe_json("Burrito Bowl", [("Brown Rice", 0.5, "lb")])),
+    # Same ingredients as the burrito bowl.
+    "Spanish": (0.2, recipe_json("Arroz", [("Brown Rice", 0.5, "lb")])),
+    # Uses more rice than there is.
+    "Chinese": (0.0, recipe_json("Fried Rice", [("Brown Rice", 5, "lb")])),
+    "Indian": (
+        0.4,
+        recipe_json("Dal", [("Black Beans", 10, "oz"), ("Brown Rice", 0.5, "lb")]),
+    ),
+    "French": (2.0, recipe_json("Cassoulet", [("Black Beans", 15, "oz")])),
+    "Cuban": (
+        0.0,
+        recipe_json(
+            "Rice and Beans", [("Brown Rice", 0.5, "lb"), ("Black Beans", 10, "oz")]
+        ),
+    ),
+    # Seasoned with staples that are not in the pantry.
+    "Italian": (
+        0.0,
+        recipe_json(
+            "Risotto",
+            [("Brown Rice", 1, "lb"), ("Salt", 1, "tsp"), ("Black Pepper", 0.5, "tsp")],
+        ),
+    ),
+    # Uses an ingredient that is not in the pantry, which the patch replaces.
+    "Korean": (0.0, recipe_json("Bibimbap", [("Kimchi", 1, "cup")])),
+}
+# The cuisine of the recipe for each kind of dish asked of the candidates that
+# no cuisine sets apart.
+CUISINES_BY_HINT = {
+    "a one-bowl meal": "Mexican",
+    "a soup or stew": "Indian",
+    "a baked or roasted dish": "Chinese",
+}
+PATCH = json.dumps(
+    {"ingredients": [{"name": "Brown Rice", "quantity": 1, "unit": "lb"}]}
+)
+
+
+class FakeOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Streams a recipe for the cuisine or kind of dish hinted at in the prompt, or
+    replies with a patch to requests for one.
+    """
+
+    # The model of each request.
+    models = []
+    # How long a patch takes.
+    patch_delay = 0.0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        self.models.append(body["model"])
+        prompt = " ".join(str(message["content"]) for message in body["messages"])
+        if "Problems:" in prompt:
+            time.sleep(self.patch_delay)
+            self._send_completion(PATCH)
+            return
+        hint = re.search(r"make it ([^.]+)\.", prompt)
+        if hint is not None:
+            cuisine = CUISINES_BY_HINT[hint.group(1)]
+        else:
+            cuisine = re.search(r'"favorite_cuisines":\["([^"]+)"', prompt).group(1)
+        delay, content = RECIPES_BY_CUISINE[cuisine]
+        time.sleep(delay)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for start in range(0, len(content), 16):
+            self._send_chunk({"content": content[start : start + 16]}, None)
+        self._send_chunk({}, "stop")
+        self.wfile.write(b"data: [DONE]\n\n")
+
+    def _send_completion(self, content: str):
+        completion = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+        }
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(json.dumps(completion).encode())
+
+    def _send_chunk(self, delta: dict, finish_reason: str | None):
+        chunk = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion.chunk",
+            "created": 0,
+            "model": "gpt-4o",
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+        }
+        self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv(
+        "OPENAI_API_BASE", f"http://127.0.0.1:{server.server_address[1]}/v1"
+    )
+    monkeypatch.setenv("GOOGLE_API_KEY", "test")
+    monkeypatch.setenv("GOOGLE_CSE_ID", "test")
+    FakeOpenAIHandler.models = []
+    FakeOpenAIHandler.patch_delay = 0.0
+    yield sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+    )
+    server.shutdown()
+
+
+@pytest.fixture
+def items():
+    return [
+        Item(
+            name=name,
+            quantity=sc_quantity.Quantity(
+                quantity=quantity, unit=unit, type=sc_types.UnitType.WEIGHT
+            ),
+            shelf_life=datetime.timedelta(days=30),
+            storage=sc_types.StorageType.PANTRY,
+        )
+        for name, quantity, unit in [
+            ("Brown Rice", 2, sc_types.Unit.POUNDS),
+            ("Black Beans", 15, sc_types.Unit.OUNCES),
+        ]
+    ]
+
+
+def preferences(
+    cuisines: list[str], restrictions: list[str] | None = None
+) -> UserPreferences:
+    return UserPreferences(
+        dietary_restrictions=restrictions or [],
+        favorite_cuisines=cuisines,
+        favorite_recipes=[],
+        kitchen_appliances=["Stove"],
+        number_of_people=2,
+    )
+
+
+def test_create_recipes_drops_invalid_and_duplicate_candidates(agent, items):
+    recipes = agent.create_recipes(
+        items, preferences(["Mexican", "Spanish", "Chinese", "Indian"]), n=4
+    )
+
+    # Fried rice is not feasible and arroz duplicates the burrito bowl.
+    assert [recipe.name for recipe in recipes] == ["Burrito Bowl", "Dal"]
+
+
+def test_create_recipes_returns_first_k(agent, items):
+    start = time.monotonic()
+    recipes = agent.create_recipes(items, preferences(["Mexican", "French"]), n=2, k=1)
+
+    assert [recipe.name for recipe in recipes] == ["Burrito Bowl"]
+    # The slow candidate is not waited for.
+    assert time.monotonic() - start < 1.5
+
+
+def test_create_recipes_cancels_cascade_candidates(agent, items):
+    agent = sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+        cascade_tiers=["gpt-4o-mini", "gpt-4o"],
+    )
+
+    recipes = agent.create_recipes(items, preferences(["Mexican", "French"]), n=2, k=1)
+    assert [recipe.name for recipe in recipes] == ["Burrito Bowl"]
+
+    # The French candidate is stopped at its first token instead of completing.
+    time.sleep(2.5)
+    stats = agent.cascade_stats()
+    assert stats["tiers"]["gpt-4o-mini"]["calls"] == 1
+    assert stats["tiers"]["gpt-4o"]["calls"] == 0
+
+
+def test_create_recipes_without_cuisines(agent, items):
+    recipes = agent.create_recipes(items, preferences([]), n=3)
+
+    # Each candidate asks for another kind of dish, so they are not duplicates.
+    assert sorted(recipe.name for recipe in recipes) == ["Burrito Bowl", "Dal"]
+
+
+@pytest.mark.parametrize("n, k", [(0, None), (2, 3), (2, 0)])
+def test_create_recipes_checks_k(agent, items, n, k):
+    with pytest.raises(ValueError, match="1 <= k <= n"):
+        agent.create_recipes(items, preferences(["Mexican"]), n=n, k=k)
+    assert FakeOpenAIHandler.models == []
+
+
+def test_create_recipes_without_valid_candidates(agent, items):
+    with pytest.raises(ValueError):
+        agent.create_recipes(items, preferences(["Chinese", "Chinese"]), n=2)
+
+
+def test_create_recipe_patches_infeasible_recipe(agent, items):
+    recipe = agent.create_recipe(items, preferences(["Korean"]))
+
+    assert recipe.name == "Bibimbap"
+    assert [(i.name, i.quantity, i.unit) for i in recipe.ingredients] == [
+        ("Brown Rice", 1, "lb")
+    ]
+
+
+def test_cascade_repairs_infeasible_recipe_without_escalating(agent, items):
+    agent = sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+        cascade_tiers=["gpt-4o-mini", "gpt-4o"],
+    )
+
+    recipe = agent.create_recipe(items, preferences(["Korean"]))
+
+    assert [(i.name, i.quantity, i.unit) for i in recipe.ingredients] == [
+        ("Brown Rice", 1, "lb")
+    ]
+    # The valid recipe of the cheap tier is patched by the last tier.
+    assert FakeOpenAIHandler.models == ["gpt-4o-mini", "gpt-4o"]
+    assert agent.cascade_stats()["escalations"] == 0
+
+
+def test_create_recipe_allows_pantry_staples(agent, items):
+    recipe = agent.create_recipe(items, preferences(["Italian"]))
+
+    assert [i.name for i in recipe.ingredients] == [
+        "Brown Rice",
+        "Salt",
+        "Black Pepper",
+    ]
+    # The recipe was accepted without asking for a patch.
+    assert len(FakeOpenAIHandler.models) == 1
+
+
+def test_create_recipe_stops_at_deadline(agent, items):
+    agent = sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+        timeout=0.5,
+    )
+
+    start = time.monotonic()
+    # The French recipe takes 2s.
+    with pytest.raises(TimeoutError):
+        agent.create_recipe(items, preferences(["French"]))
+    assert time.monotonic() - start < 1.5
+    assert agent.latency_stats()["timeouts"] == 1
+
+    agent.create_recipe(items, preferences(["Mexican"]))
+    assert agent.latency_stats()["latency"]["count"] == 1
+
+
+def test_create_recipe_stream(agent, items):
+    events = list(agent.create_recipe_stream(items, preferences(["Mexican"])))
+
+    assert events[0].stage == sc_recipe_stream.RecipeStreamStage.HEADER
+    assert events[-1].stage == sc_recipe_stream.RecipeStreamStage.RECIPE
+    assert events[-1].recipe.name == "Burrito Bowl"
+
+
+def test_create_recipe_stream_replaces_repaired_recipe(agent, items):
+    events = list(agent.create_recipe_stream(items, preferences(["Korean"])))
+
+    ingredients = [e.ingredient.name for e in events if e.ingredient is not None]
+    assert ingredients == ["Kimchi"]
+    assert events[-1].stage == sc_recipe_stream.RecipeStreamStage.REPLACED
+    assert [i.name for i in events[-1].recipe.ingredients] == ["Brown Rice"]
+
+
+def test_create_recipe_stream_stops_at_deadline(agent, items):
+    agent = sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+        timeout=0.5,
+    )
+
+    start = time.monotonic()
+    # The French recipe takes 2s.
+    with pytest.raises(TimeoutError):
+        list(agent.create_recipe_stream(items, preferences(["French"])))
+    assert time.monotonic() - start < 1.5
+
+
+def test_repair_stops_at_deadline(agent, items):
+    agent = sc_create_recipe.CreateRecipeAgent(
+        search_cache=sc_search_cache.SearchCache(),
+        scheduler=sc_llm_scheduler.LLMScheduler(),
+        timeout=0.5,
+    )
+    FakeOpenAIHandler.patch_delay = 2.0
+
+    # The Korean recipe needs a patch, which takes 2s.
+    start = time.monotonic()
+    with pytest.raises(TimeoutError):
+        agent.create_recipe(items, preferences(["Korean"]))
+    with pytest.raises(TimeoutError):
+        list(agent.create_recipe_stream(items, preferences(["Korean"])))
+    assert time.monotonic() - start < 2.0
+
+
+def test_create_recipe_uses_corpus(agent, items):
+    agent._recipe_corpus = sc_recipe_corpus.RecipeCorpus()
+
+    recipe = agent.create_recipe(items, preferences(["Cuban"]), user_id="user-1")
+    assert recipe.name == "Rice and Beans"
+    assert len(agent._recipe_corpus) == 1
+    assert len(FakeOpenAIHandler.models) == 1
+
+    # The stored recipe is found without calling the model.
+    recipe = agent.create_recipe(items, preferences(["Cuban"]), user_id="user-1")
+    assert recipe.name == "Rice and Beans"
+    assert len(FakeOpenAIHandler.models) == 1
+
+
+def test_corpus_is_scoped_by_user_and_restrictions(agent, items):
+    agent._recipe_corpus = sc_recipe_corpus.RecipeCorpus()
+    agent.create_recipe(items, preferences(["Cuban"]), user_id="user-1")
+
+    # Another user, or a restriction the recipe was not generated for, misses.
+    agent.create_recipe(items, preferences(["Cuban"]), user_id="user-2")
+    agent.create_recipe(items, preferences(["Cuban"], ["Vegan"]), user_id="user-1")
+    assert len(FakeOpenAIHandler.models) == 3
+
+    # A recipe generated with the restriction also suits the user without it.
+    agent._recipe_corpus = sc_recipe_corpus.RecipeCorpus()
+    agent.create_recipe(items, preferences(["Cuban"], ["Vegan"]), user_id="user-1")
+    agent.create_recipe(items, preferences(["Cuban"]), user_id="user-1")
+    assert len(FakeOpenAIHandler.models) == 4
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,87 @@
+import os
+import pytest
+import subprocess
+import sys
+
+
+# Entry points that tests, workers and CLI tools import.
+SERVER_MODULES = [
+    "src.server.agent_registry",
+    "src.server.create_recipe",
+    "src.server.extract_items",
+    "src.server.llm_scheduler",
+    "src.server.sqlite_store_items",
+    "src.server.store_items",
+]
+# SDKs that must only be loaded once they are used.
+HEAVY_PACKAGES = [
+    "firebase_admin",
+    "google.cloud",
+    "httpx",
+    "langchain",
+    "langchain_community",
+    "langchain_core",
+    "langchain_google_community",
+    "langchain_openai",
+    "openai",
+]
+# Importing every entry point takes about 0.2s; the SDKs alone take over 2s.
+IMPORT_TIME_BUDGET_SECONDS = 1.0
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(__file__)))
+
+
+def import_times(modules: list[str]) -> dict[str, tuple[int, float]]:
+    """
+    Imports modules in a fresh interpreter and returns the nesting depth and the
+    cumulative import time, in seconds, of every module that was loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {', '.join(modules)}"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        # "import time:  self [us] | cumulative | imported package"
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        times[name.strip()] = (depth, int(cumulative) / 1e6)
+    return times
+
+
+@pytest.fixture(scope="module")
+def server_import_times():
+    return import_times(SERVER_MODULES)
+
+
+def test_server_modules_do_not_import_sdks(server_import_times):
+    loaded = [
+        name
+        for name in server_import_times
+        if any(
+            name == package or name.startswith(f"{package}.")
+            for package in HEAVY_PACKAGES
+        )
+    ]
+
+    assert loaded == []
+
+
+def test_server_modules_import_time_budget(server_import_times):
+    # Modules imported by an earlier entry point are nested in its time.
+    total = sum(
+        seconds
+        for name, (depth, seconds) in server_import_times.items()
+        if depth == 0 and name in SERVER_MODULES
+    )
+
+    assert total < IMPORT_TIME_BUDGET_SECONDS
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,94 @@
+import datetime
+import pytest
+import sys
+
+from src.data_models import quantity as sc_quantity
+from src.data_models.item import Item
+from src.data_models.nutritional_facts import NutritionalFacts
+from src.data_models.user import UserPreferences
+from src.server import ingredient_ranking as sc_ingredient_ranking
+from src.utils import types as sc_types
+
+
+def make_item(name: str, shelf_life_days: int) -> Item:
+    return Item(
+        name=name,
+        quantity=sc_quantity.Quantity(
+            quantity=1, unit=sc_types.Unit.POUNDS, type=sc_types.UnitType.WEIGHT
+        ),
+        shelf_life=datetime.timedelta(days=shelf_life_days),
+        storage=sc_types.StorageType.PANTRY,
+    )
+
+
+def count_words(text: str) -> int:
+    return len(text.replace("|", " ").split())
+
+
+@pytest.fixture
+def preferences():
+    return UserPreferences(
+        dietary_restrictions=["Vegetarian"],
+        favorite_cuisines=["Mexican"],
+        favorite_recipes=["Bean Burrito"],
+        kitchen_appliances=["Stove"],
+        number_of_people=2,
+    )
+
+
+def test_rank_items(preferences):
+    items = [
+        make_item("Brown Rice", 365),
+        make_item("Chicken Breast", 2),
+        make_item("Spinach", 3),
+        make_item("Black Beans", 365),
+        make_item("Canned Peaches", 365),
+    ]
+
+    ranked = sc_ingredient_ranking.rank_items(items, preferences)
+
+    # Spinach expires soonest that fits the diet; chicken is excluded by it.
+    assert ranked[0].name == "Spinach"
+    assert ranked[-1].name == "Chicken Breast"
+    # Beans match a favorite recipe; peaches neither match nor pair.
+    assert [item.name for item in ranked[1:4]] == [
+        "Black Beans",
+        "Brown Rice",
+        "Canned Peaches",
+    ]
+
+
+def test_format_item_row():
+    item = make_item("Chicken Breast", 5)
+    item.nutritional_facts = NutritionalFacts(
+        serving_size=sc_quantity.Quantity(quantity=113.4, unit=sc_types.Unit.GRAMS),
+        calories=sc_quantity.Quantity(quantity=165, unit=sc_types.Unit.KCAL),
+        protein=sc_quantity.Quantity(quantity=31, unit=sc_types.Unit.GRAMS),
+        fat=sc_quantity.Quantity(quantity=3.6, unit=sc_types.Unit.GRAMS),
+    )
+
+    row = sc_ingredient_ranking.format_item_row(item)
+
+    assert row == "Chicken Breast|1 lb|5|113.4 g|165|31|0|3.6"
+
+
+def test_compact_ingredients_respects_limits(preferences):
+    items = [make_item(f"Item {i}", i + 1) for i in range(20)]
+
+    table = sc_ingredient_ranking.compact_ingredients(
+        items, preferences, count_words, max_items=5
+    )
+    lines = table.splitlines()
+    assert len(lines) == 6
+    # The items closest to expiring are kept.
+    assert [line.split("|")[0] for line in lines[1:]] == [f"Item {i}" for i in range(5)]
+
+    table = sc_ingredient_ranking.compact_ingredients(
+        items, preferences, count_words, token_budget=50
+    )
+    assert count_words(table) + len(table.splitlines()) <= 50
+    assert 1 < len(table.splitlines()) < 21
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,106 @@
+import pytest
+import sys
+import threading
+import time
+
+from src.server import invocation as sc_invocation
+
+
+def test_latency_histogram_percentiles():
+    histogram = sc_invocation.LatencyHistogram()
+    for _ in range(90):
+        histogram.record(0.1)
+    for _ in range(10):
+        histogram.record(2.0)
+
+    # Percentiles are bucket upper bounds, at most 25% above the true value.
+    assert 0.1 <= histogram.percentile(0.5) <= 0.125
+    assert 2.0 <= histogram.percentile(0.95) <= 2.5
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert snapshot["max"] == 2.0
+    assert sum(snapshot["buckets"].values()) == 100
+
+
+def test_guard_stops_waiting_at_deadline():
+    release = threading.Event()
+    slow_tool = sc_invocation.guard(lambda query: release.wait(5) and query)
+
+    start = time.monotonic()
+    with sc_invocation.deadline(0.2):
+        with pytest.raises(sc_invocation.DeadlineExceeded):
+            slow_tool("rice")
+    assert time.monotonic() - start < 1
+    release.set()
+
+    # Without a deadline the call runs as is.
+    assert slow_tool("rice") == "rice"
+
+
+def test_guard_reports_own_timeout_as_deadline():
+    def bounded_call():
+        time.sleep(sc_invocation.remaining_time())
+        raise TimeoutError("Request timed out.")
+
+    with sc_invocation.deadline(0.1):
+        with pytest.raises(sc_invocation.DeadlineExceeded):
+            sc_invocation.guard(bounded_call)()
+
+
+def test_invoker_times_out():
+    invoker = sc_invocation.AgentInvoker(timeout=0.2)
+
+    def run() -> str:
+        # Like a model callback, stops once the invocation is cancelled.
+        for _ in range(100):
+            sc_invocation.check_deadline()
+            time.sleep(0.05)
+        return "late"
+
+    start = time.monotonic()
+    with pytest.raises(sc_invocation.DeadlineExceeded):
+        invoker.invoke(run, str)
+    assert time.monotonic() - start < 1
+    assert invoker.stats()["timeouts"] == 1
+
+
+def test_invoker_hedges_slow_requests():
+    invoker = sc_invocation.AgentInvoker(hedge_quantile=0.95, min_hedge_samples=3)
+    for _ in range(3):
+        assert invoker.invoke(lambda: "fast", str) == "fast"
+    assert invoker.hedge_delay() < 0.1
+
+    calls = []
+
+    def run() -> str:
+        calls.append(None)
+        # The first request is stuck; its hedge returns at once.
+        if len(calls) == 1:
+            time.sleep(2)
+            return "stuck"
+        return "hedge"
+
+    start = time.monotonic()
+    assert invoker.invoke(run, str) == "hedge"
+    assert time.monotonic() - start < 1
+    stats = invoker.stats()
+    assert stats["hedges"] == 1
+    assert stats["hedge_wins"] == 1
+    assert stats["latency"]["count"] == 4
+
+
+def test_invoker_uses_first_valid_result():
+    invoker = sc_invocation.AgentInvoker()
+
+    def parse(output: str) -> str:
+        if output == "invalid":
+            raise ValueError("Invalid output.")
+        return output
+
+    with pytest.raises(ValueError):
+        invoker.invoke(lambda: "invalid", parse)
+    assert invoker.invoke(lambda: "valid", parse) == "valid"
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
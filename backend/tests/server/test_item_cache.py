@@ -0,0 +1,157 @@
+import pytest
+import sys
+from unittest.mock import Mock
+
+from src.server import item_cache as sc_item_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeQuery:
+    """Stands in for a Firestore query with a snapshot listener."""
+
+    def __init__(self):
+        self.callback = None
+        self.watch = Mock()
+
+    def on_snapshot(self, callback):
+        self.callback = callback
+        return self.watch
+
+
+def fake_doc(doc_id: str, data: dict) -> Mock:
+    doc = Mock(id=doc_id)
+    doc.to_dict.return_value = data
+    return doc
+
+
+def fake_change(kind: str, doc_id: str, data: dict) -> Mock:
+    change = Mock(document=fake_doc(doc_id, data))
+    change.type.name = kind
+    return change
+
+
+def test_reads_through_until_ttl():
+    clock = FakeClock()
+    cache = sc_item_cache.ItemCache(ttl_seconds=60, clock=clock)
+    loads = []
+
+    def load() -> dict:
+        loads.append(None)
+        return {"u_rice": {"name": "rice"}}
+
+    assert cache.get_items("u", load) == {"u_rice": {"name": "rice"}}
+    clock.now = 30
+    assert cache.get_items("u", load) == {"u_rice": {"name": "rice"}}
+    # Items of a cached listing, and items missing from it, need no load.
+    assert cache.get_item("u", "u_rice", pytest.fail) == {"name": "rice"}
+    assert cache.get_item("u", "u_beans", pytest.fail) is None
+    assert len(loads) == 1
+
+    clock.now = 61
+    cache.get_items("u", load)
+    assert len(loads) == 2
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (3, 2)
+    assert stats["hit_rate"] == 0.6
+    assert stats["staleness"]["max"] == 30
+
+
+def test_invalidate_drops_written_items():
+    cache = sc_item_cache.ItemCache()
+    cache.get_items("u", lambda: {"u_rice": {"name": "rice", "quantity": 1}})
+
+    cache.invalidate("u", "u_rice")
+    assert cache.get_item("u", "u_rice", lambda: {"quantity": 2}) == {"quantity": 2}
+    assert cache.get_items("u", lambda: {}) == {}
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_invalidate_drops_loads_in_flight():
+    cache = sc_item_cache.ItemCache()
+
+    def load() -> dict:
+        # Another thread writes the item while it is loaded.
+        cache.invalidate("u", "u_rice")
+        return {"name": "rice", "quantity": 1}
+
+    cache.get_item("u", "u_rice", load)
+    assert cache.get_item("u", "u_rice", lambda: None) is None
+
+
+def test_snapshot_listener_keeps_items_up_to_date():
+    clock = FakeClock()
+    cache = sc_item_cache.ItemCache(ttl_seconds=60, listen=True, clock=clock)
+    query = FakeQuery()
+    cache.watch("u", query)
+    cache.watch("u", query)
+
+    rice = {"name": "rice"}
+    query.callback(
+        [fake_doc("u_rice", rice)], [fake_change("ADDED", "u_rice", rice)], None
+    )
+    assert cache.get_items("u", pytest.fail) == {"u_rice": rice}
+
+    # Another process adds beans and removes the rice.
+    beans = {"name": "beans"}
+    query.callback(
+        [fake_doc("u_beans", beans)],
+        [
+            fake_change("ADDED", "u_beans", beans),
+            fake_change("REMOVED", "u_rice", rice),
+        ],
+        None,
+    )
+    clock.now = 3600
+    # Items kept up to date by a listener do not expire.
+    assert cache.get_items("u", pytest.fail) == {"u_beans": beans}
+    assert cache.get_item("u", "u_rice", pytest.fail) is None
+    assert cache.stats()["snapshot_updates"] == 2
+
+
+def test_stopped_listener_expires_items():
+    clock = FakeClock()
+    cache = sc_item_cache.ItemCache(ttl_seconds=60, listen=True, clock=clock)
+    query = FakeQuery()
+    query.watch.is_active = True
+    cache.watch("u", query)
+    rice = {"name": "rice"}
+    query.callback([fake_doc("u_rice", rice)], [], None)
+
+    clock.now = 3600
+    assert cache.get_items("u", pytest.fail) == {"u_rice": rice}
+    # Synced data is reported with its real age.
+    assert cache.stats()["staleness"]["max"] == 3600
+
+    # The listener dies, e.g. after a stream error.
+    query.watch.is_active = False
+    assert cache.get_items("u", lambda: {"u_beans": {}}) == {"u_beans": {}}
+    assert cache.stats()["listener_stops"] == 1
+
+    # The next watch starts a new listener.
+    restarted = FakeQuery()
+    cache.watch("u", restarted)
+    assert restarted.callback is not None
+
+
+def test_evicts_least_recently_used_users():
+    cache = sc_item_cache.ItemCache(max_items=3, listen=True)
+    query = FakeQuery()
+    cache.watch("a", query)
+    query.callback([fake_doc("a_1", {}), fake_doc("a_2", {})], [], None)
+    cache.get_items("b", lambda: {"b_1": {}, "b_2": {}})
+
+    stats = cache.stats()
+    assert (stats["users"], stats["items"], stats["evictions"]) == (1, 2, 1)
+    query.watch.unsubscribe.assert_called_once()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
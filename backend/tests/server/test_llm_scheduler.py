@@ -0,0 +1,207 @@
+import asyncio
+import http.server
+import json
+import pytest
+import sys
+import threading
+import time
+
+from langchain_openai import ChatOpenAI
+
+from src.server import llm_scheduler as sc_llm_scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeOpenAIHandler(http.server.BaseHTTPRequestHandler):
+    """Answers chat completions, returning 429 for the first `rate_limited` calls."""
+
+    rate_limited = 1
+    calls = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        type(self).calls += 1
+        if type(self).calls <= type(self).rate_limited:
+            body = {"error": {"message": "Rate limit reached", "type": "requests"}}
+            self._respond(429, body, {"retry-after": "0.05"})
+            return
+
+        body = {
+            "id": "chatcmpl-test",
+            "object": "chat.completion",
+            "created": 0,
+            "model": "gpt-4o-mini",
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "hello"},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {"prompt_tokens": 7, "completion_tokens": 1, "total_tokens": 8},
+        }
+        self._respond(200, body, {})
+
+    def _respond(self, status: int, body: dict, headers: dict[str, str]):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def fake_openai_server():
+    FakeOpenAIHandler.calls = 0
+    FakeOpenAIHandler.rate_limited = 1
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), FakeOpenAIHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}/v1"
+    server.shutdown()
+
+
+def test_token_bucket_refills():
+    clock = FakeClock()
+    bucket = sc_llm_scheduler.TokenBucket(rate_per_minute=60, capacity=2, clock=clock)
+
+    bucket.consume(2)
+    assert bucket.time_until(1) == pytest.approx(1.0)
+
+    clock.now += 0.5
+    assert bucket.tokens == pytest.approx(0.5)
+
+    clock.now += 10
+    assert bucket.tokens == pytest.approx(2)
+
+
+def test_token_bucket_pause():
+    clock = FakeClock()
+    bucket = sc_llm_scheduler.TokenBucket(rate_per_minute=60, clock=clock)
+
+    bucket.pause(5)
+    assert bucket.tokens == 0
+    assert bucket.time_until(1) == pytest.approx(6.0)
+
+    clock.now += 5
+    assert bucket.tokens == 0
+
+    clock.now += 1
+    assert bucket.tokens == pytest.approx(1)
+
+
+def test_acquire_non_blocking():
+    scheduler = sc_llm_scheduler.LLMScheduler(requests_per_minute=60, request_burst=1)
+
+    assert scheduler.acquire(blocking=False)
+    assert not scheduler.acquire(blocking=False)
+    assert scheduler.queue_depth == 0
+
+
+def test_record_usage_limits_tokens():
+    scheduler = sc_llm_scheduler.LLMScheduler(
+        tokens_per_minute=6000, estimated_tokens_per_request=10
+    )
+
+    assert scheduler.acquire(blocking=False)
+    scheduler.record_usage(7000)
+    assert not scheduler.acquire(blocking=False)
+
+
+def test_interactive_requests_go_first():
+    scheduler = sc_llm_scheduler.LLMScheduler(requests_per_minute=600, request_burst=1)
+    scheduler.acquire()
+    order = []
+
+    def acquire(priority):
+        scheduler.acquire(priority)
+        order.append(priority)
+
+    batch = threading.Thread(target=acquire, args=(sc_llm_scheduler.Priority.BATCH,))
+    batch.start()
+    while scheduler.queue_depth < 1:
+        time.sleep(0.001)
+    interactive = threading.Thread(
+        target=acquire, args=(sc_llm_scheduler.Priority.INTERACTIVE,)
+    )
+    interactive.start()
+    batch.join()
+    interactive.join()
+
+    assert order == [
+        sc_llm_scheduler.Priority.INTERACTIVE,
+        sc_llm_scheduler.Priority.BATCH,
+    ]
+    stats = scheduler.stats()
+    assert stats["queue_depth"] == 0
+    assert stats["wait"]["batch"]["requests"] == 1
+    assert stats["wait"]["batch"]["max_wait_seconds"] > 0
+
+
+def test_chat_model_backs_off_on_429(fake_openai_server):
+    scheduler = sc_llm_scheduler.LLMScheduler(estimated_tokens_per_request=100)
+    llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        api_key="test",
+        base_url=fake_openai_server,
+        **scheduler.chat_model_kwargs(sc_llm_scheduler.Priority.BATCH),
+    )
+
+    response = llm.invoke("hi")
+
+    assert response.content == "hello"
+    assert FakeOpenAIHandler.calls == 2
+    stats = scheduler.stats()
+    assert stats["rate_limited_responses"] == 1
+    # The retry waited for the scheduler too.
+    assert stats["wait"]["batch"]["requests"] == 2
+
+
+def test_async_chat_model_backs_off_on_429(fake_openai_server):
+    scheduler = sc_llm_scheduler.LLMScheduler(estimated_tokens_per_request=100)
+    llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        api_key="test",
+        base_url=fake_openai_server,
+        **scheduler.chat_model_kwargs(),
+    )
+
+    response = asyncio.run(llm.ainvoke("hi"))
+
+    assert response.content == "hello"
+    assert FakeOpenAIHandler.calls == 2
+    stats = scheduler.stats()
+    assert stats["rate_limited_responses"] == 1
+    assert stats["wait"]["interactive"]["requests"] == 2
+
+
+def test_retries_are_limited(fake_openai_server):
+    FakeOpenAIHandler.rate_limited = 10
+    scheduler = sc_llm_scheduler.LLMScheduler(max_retries=1)
+    llm = ChatOpenAI(
+        model="gpt-4o-mini",
+        api_key="test",
+        base_url=fake_openai_server,
+        **scheduler.chat_model_kwargs(),
+    )
+
+    with pytest.raises(Exception, match="Rate limit"):
+        llm.invoke("hi")
+    assert FakeOpenAIHandler.calls == 2
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
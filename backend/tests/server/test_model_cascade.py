@@ -0,0 +1,90 @@
+import pytest
+import sys
+
+from src.server import model_cascade as sc_model_cascade
+
+
+def parse_int(output_text: str) -> int:
+    try:
+        return int(output_text)
+    except ValueError:
+        raise ValueError(f"Not an integer: {output_text}")
+
+
+def test_cheap_tier_success_does_not_escalate():
+    strong_calls = []
+    cascade = sc_model_cascade.ModelCascade(
+        [
+            ("cheap", lambda inputs: "1"),
+            ("strong", lambda inputs: strong_calls.append(inputs) or "2"),
+        ]
+    )
+
+    assert cascade.run({}, parse_int) == 1
+    assert strong_calls == []
+
+    stats = cascade.stats()
+    assert stats["requests"] == 1
+    assert stats["escalations"] == 0
+    assert stats["tiers"]["cheap"]["calls"] == 1
+    assert stats["tiers"]["strong"]["calls"] == 0
+
+
+def test_failed_validation_escalates():
+    cascade = sc_model_cascade.ModelCascade(
+        [("cheap", lambda inputs: "not json"), ("strong", lambda inputs: "2")]
+    )
+
+    assert cascade.run({}, parse_int) == 2
+    assert cascade.run({}, parse_int) == 2
+
+    stats = cascade.stats()
+    assert stats["escalations"] == 2
+    assert stats["escalation_rate"] == 1.0
+    assert stats["tiers"]["cheap"]["failures"] == 2
+    assert stats["tiers"]["strong"]["failures"] == 0
+    assert stats["tiers"]["strong"]["mean_latency_seconds"] >= 0
+
+
+def test_all_tiers_fail():
+    cascade = sc_model_cascade.ModelCascade(
+        [("cheap", lambda inputs: "a"), ("strong", lambda inputs: "b")]
+    )
+
+    with pytest.raises(ValueError, match="b"):
+        cascade.run({}, parse_int)
+
+
+def test_inputs_are_passed_to_tiers():
+    cascade = sc_model_cascade.ModelCascade([("only", lambda inputs: inputs["value"])])
+
+    assert cascade.run({"value": "7"}, parse_int) == 7
+
+
+class FakeExecutor:
+    def __init__(self, model: str):
+        self.model = model
+
+    def invoke(self, inputs: dict, config: dict) -> dict:
+        assert config["callbacks"]
+        return {"output": inputs[self.model]}
+
+
+def test_agent_cascade_runs_executor_of_each_tier():
+    models = []
+    cascade = sc_model_cascade.agent_cascade(
+        ["cheap", "strong"], lambda model: models.append(model) or FakeExecutor(model)
+    )
+
+    assert models == ["cheap", "strong"]
+    assert cascade.run({"cheap": "a", "strong": "3"}, parse_int) == 3
+    assert cascade.stats()["escalations"] == 1
+
+
+def test_empty_cascade():
+    with pytest.raises(ValueError):
+        sc_model_cascade.ModelCascade([])
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
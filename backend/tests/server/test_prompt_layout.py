@@ -0,0 +1,66 @@
+import pytest
+import sys
+
+from langchain.prompts import ChatPromptTemplate
+
+from src.server import prompt_layout as sc_prompt_layout
+
+
+INSTRUCTIONS = ["You are a chef.", "Use the available ingredients."]
+# Format instructions contain JSON, whose braces must not become variables.
+FORMAT_INSTRUCTIONS = 'Reply with JSON: {"name": "..."}'
+HUMAN = "Preferences: {user_preferences}\nIngredients: {ingredients}"
+
+
+def format_messages(layout: sc_prompt_layout.PromptLayout, **inputs) -> list:
+    messages = sc_prompt_layout.prompt_messages(
+        "create_recipe", INSTRUCTIONS, HUMAN, layout, FORMAT_INSTRUCTIONS
+    )
+    return ChatPromptTemplate.from_messages(messages).format_messages(
+        format_instructions=FORMAT_INSTRUCTIONS, **inputs
+    )
+
+
+def test_cached_layout_has_one_static_versioned_prefix():
+    first = format_messages(
+        sc_prompt_layout.PromptLayout.CACHED, user_preferences="{}", ingredients="rice"
+    )
+    second = format_messages(
+        sc_prompt_layout.PromptLayout.CACHED,
+        user_preferences='{"vegan": true}',
+        ingredients="beans",
+    )
+
+    assert len(first) == 2
+    assert first[0].content == second[0].content
+    assert first[0].content == sc_prompt_layout.static_prompt(
+        "create_recipe", INSTRUCTIONS, FORMAT_INSTRUCTIONS
+    )
+    assert first[0].content.startswith(
+        f"Prompt: create_recipe v{sc_prompt_layout.PROMPT_VERSION}"
+    )
+    assert first[0].content.endswith(FORMAT_INSTRUCTIONS)
+    assert first[1].content == "Preferences: {}\nIngredients: rice"
+
+
+def test_split_layout():
+    messages = format_messages(
+        sc_prompt_layout.PromptLayout.SPLIT, user_preferences="{}", ingredients="rice"
+    )
+
+    assert [message.content for message in messages[:-1]] == [
+        *INSTRUCTIONS,
+        FORMAT_INSTRUCTIONS,
+    ]
+
+
+def test_prompt_key_changes_with_content():
+    key = sc_prompt_layout.prompt_key("create_recipe", "static")
+
+    assert key == sc_prompt_layout.prompt_key("create_recipe", "static")
+    assert key != sc_prompt_layout.prompt_key("create_recipe", "changed")
+    assert key.startswith(f"souchef-create_recipe-v{sc_prompt_layout.PROMPT_VERSION}-")
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
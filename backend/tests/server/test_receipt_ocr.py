@@ -0,0 +1,187 @@
+import datetime
+import pytest
+import sys
+
+from src.data_models import quantity as sc_quantity
+from src.data_models.item import Item
+from src.data_models.receipt import Receipt, ReceiptItem
+from src.server import receipt_ocr as sc_receipt_ocr
+from src.utils import types as sc_types
+
+
+RECEIPT_TEXT = """TRADER JOE'S
+123 Main Street
+BNLS CKN BRST          11.99 F
+1.50 lb @ 7.99 /lb
+BLACK BEANS             1.99 F
+BLACK BEANS             1.98 F
+2 @ 0.99
+MYSTERY SNACK           3.49
+SUBTOTAL               19.45
+TAX                     0.00
+TOTAL                  19.45
+VISA                   19.45
+"""
+
+
+@pytest.fixture
+def past_receipt():
+    return Receipt(
+        merchant="Trader Joe's",
+        items=[
+            ReceiptItem(
+                price=11.99,
+                item=Item(
+                    name="Chicken Breast",
+                    quantity=sc_quantity.Quantity(
+                        quantity=1.5,
+                        unit=sc_types.Unit.POUNDS,
+                        type=sc_types.UnitType.WEIGHT,
+                    ),
+                    shelf_life=datetime.timedelta(days=5),
+                    storage=sc_types.StorageType.FRIDGE,
+                ),
+            ),
+            ReceiptItem(
+                price=1.99,
+                item=Item(
+                    name="Black Beans",
+                    quantity=sc_quantity.Quantity(
+                        quantity=15,
+                        unit=sc_types.Unit.OUNCES,
+                        type=sc_types.UnitType.WEIGHT,
+                    ),
+                    shelf_life=datetime.timedelta(days=730),
+                    storage=sc_types.StorageType.PANTRY,
+                ),
+            ),
+        ],
+    )
+
+
+@pytest.fixture
+def template_store(past_receipt):
+    store = sc_receipt_ocr.ReceiptTemplateStore()
+    store.learn(
+        past_receipt,
+        receipt_names=["BNLS CKN BRST", None],
+        header_line="TRADER JOE'S",
+    )
+    return store
+
+
+def test_parse_receipt_text_without_template():
+    lines = sc_receipt_ocr.parse_receipt_text(RECEIPT_TEXT)
+
+    assert [line.name for line in lines] == [
+        "BNLS CKN BRST",
+        "BLACK BEANS",
+        "BLACK BEANS",
+        "MYSTERY SNACK",
+    ]
+    assert [line.price for line in lines] == [11.99, 1.99, 1.98, 3.49]
+    assert lines[0].quantity.quantity == 1.5
+    assert lines[0].quantity.unit == sc_types.Unit.POUNDS
+    assert lines[2].quantity.quantity == 2
+    assert all(line.item is None for line in lines)
+
+
+def test_parse_receipt_text_with_template(template_store):
+    template = template_store.find_merchant(["TRADER JOE'S", "123 Main Street"])
+    assert template.merchant == "Trader Joe's"
+
+    lines = sc_receipt_ocr.parse_receipt_text(RECEIPT_TEXT, template)
+
+    chicken, beans, two_beans, snack = lines
+    assert chicken.item.name == "Chicken Breast"
+    assert chicken.confidence == sc_receipt_ocr.EXACT_MATCH_CONFIDENCE
+    assert chicken.item.storage == sc_types.StorageType.FRIDGE
+    assert chicken.item.shelf_life == datetime.timedelta(days=5)
+
+    assert beans.item.name == "Black Beans"
+    assert beans.item.quantity.quantity == 15
+
+    # A printed count multiplies the usual package size.
+    assert two_beans.item.quantity.quantity == 30
+    assert two_beans.item.quantity.unit == sc_types.Unit.OUNCES
+
+    assert snack.item is None
+    assert snack.confidence == sc_receipt_ocr.UNMATCHED_CONFIDENCE
+
+
+def receipt_item(name: str, price: float) -> ReceiptItem:
+    return ReceiptItem(
+        price=price,
+        item=Item(
+            name=name,
+            quantity=sc_quantity.Quantity(
+                quantity=1, unit=sc_types.Unit.POUNDS, type=sc_types.UnitType.WEIGHT
+            ),
+            shelf_life=datetime.timedelta(days=30),
+            storage=sc_types.StorageType.PANTRY,
+        ),
+    )
+
+
+def test_merge_line_items_keeps_line_order(template_store):
+    template = template_store.get("Trader Joe's")
+    lines = sc_receipt_ocr.parse_receipt_text(RECEIPT_TEXT, template)
+    lines[1].item = None
+
+    items = sc_receipt_ocr.merge_line_items(
+        lines,
+        [receipt_item("Organic Black Beans", 1.99), receipt_item("Trail Mix", 3.49)],
+        min_confidence=0.8,
+    )
+
+    assert [item.item.name for item in items] == [
+        "Chicken Breast",
+        "Organic Black Beans",
+        "Black Beans",
+        "Trail Mix",
+    ]
+
+
+def test_merge_line_items_with_unmatched_count(template_store):
+    template = template_store.get("Trader Joe's")
+    lines = sc_receipt_ocr.parse_receipt_text(RECEIPT_TEXT, template)
+    lines[1].item = None
+
+    # Two lines were sent to the model, which returned a single item.
+    items = sc_receipt_ocr.merge_line_items(
+        lines, [receipt_item("Trail Mix", 3.49)], min_confidence=0.8
+    )
+
+    assert [item.item.name for item in items] == [
+        "Chicken Breast",
+        "Trail Mix",
+        "Black Beans",
+    ]
+
+
+def test_close_match_has_lower_confidence(template_store):
+    template = template_store.get("trader joes")
+    details, confidence = template.match("BLACK BEAN")
+
+    assert details["name"] == "Black Beans"
+    assert 0.6 < confidence < sc_receipt_ocr.EXACT_MATCH_CONFIDENCE
+
+
+def test_unknown_merchant(template_store):
+    assert template_store.find_merchant(["WHOLE FOODS MARKET"]) is None
+
+
+def test_save_and_load(tmp_path, past_receipt):
+    path = str(tmp_path / "templates.json")
+    store = sc_receipt_ocr.ReceiptTemplateStore(path)
+    store.learn(past_receipt, receipt_names=["BNLS CKN BRST", None])
+    store.save()
+
+    loaded = sc_receipt_ocr.ReceiptTemplateStore(path)
+    template = loaded.get("Trader Joe's")
+    assert template.aliases["bnls ckn brst"] == "chicken breast"
+    assert "black beans" in template.items
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,133 @@
+import datetime
+import pytest
+import sys
+
+from src.data_models import quantity as sc_quantity
+from src.data_models.item import Item
+from src.data_models.recipe import Recipe, RecipeIngredient
+from src.data_models.user import UserPreferences
+from src.server import recipe_cache as sc_recipe_cache
+from src.utils import types as sc_types
+
+
+def make_item(name: str, quantity: float, unit: sc_types.Unit) -> Item:
+    return Item(
+        name=name,
+        quantity=sc_quantity.Quantity(
+            quantity=quantity, unit=unit, type=sc_types.UNIT_TYPE_MAPPINGS[unit]
+        ),
+        shelf_life=datetime.timedelta(days=7),
+        storage=sc_types.StorageType.PANTRY,
+    )
+
+
+@pytest.fixture
+def pantry():
+    return [
+        make_item("Brown Rice", 2, sc_types.Unit.POUNDS),
+        make_item("Black Beans", 15, sc_types.Unit.OUNCES),
+        make_item("Chicken Breast", 1.5, sc_types.Unit.POUNDS),
+        make_item("Sweet Onion", 1, sc_types.Unit.POUNDS),
+        make_item("Garlic", 6, sc_types.Unit.OUNCES),
+    ]
+
+
+@pytest.fixture
+def preferences():
+    return UserPreferences(
+        dietary_restrictions=["Gluten-free"],
+        favorite_cuisines=["Mexican", "Italian"],
+        favorite_recipes=[],
+        kitchen_appliances=["Stove"],
+        number_of_people=2,
+    )
+
+
+@pytest.fixture
+def recipe():
+    return Recipe(
+        name="Rice and Beans",
+        description="Rice with black beans.",
+        ingredients=[
+            RecipeIngredient(name="Brown Rice", quantity=0.5, unit="lb"),
+            RecipeIngredient(name="Black Beans", quantity=15, unit="oz"),
+        ],
+        instructions={1: "Cook the rice.", 2: "Add the beans."},
+    )
+
+
+def test_fingerprint_buckets_quantities():
+    fingerprint = sc_recipe_cache.RecipeCache.fingerprint
+    rice = fingerprint([make_item("Brown Rice", 400, sc_types.Unit.GRAMS)])
+
+    assert fingerprint([make_item("brown rice", 450, sc_types.Unit.GRAMS)]) == rice
+    # 1 lb is 453.6g.
+    assert fingerprint([make_item("Brown Rice", 1, sc_types.Unit.POUNDS)]) == rice
+    assert fingerprint([make_item("Brown Rice", 200, sc_types.Unit.GRAMS)]) != rice
+
+
+def test_preferences_key_ignores_order_and_case(preferences):
+    reordered = preferences.model_copy(
+        update={"favorite_cuisines": ["italian", "Mexican"]}
+    )
+
+    assert sc_recipe_cache.RecipeCache.preferences_key(
+        reordered
+    ) == sc_recipe_cache.RecipeCache.preferences_key(preferences)
+
+
+def test_exact_and_near_hits(pantry, preferences, recipe):
+    cache = sc_recipe_cache.RecipeCache()
+    assert cache.get(pantry, preferences) is None
+    cache.set(pantry, preferences, recipe)
+
+    assert cache.get(pantry, preferences) == recipe
+
+    # Used up half of the chicken: a different bucket for one of five items.
+    near_pantry = pantry[:2] + [make_item("Chicken Breast", 0.7, sc_types.Unit.POUNDS)]
+    near_pantry += pantry[3:]
+    assert cache.get(near_pantry, preferences) is None
+
+    cache = sc_recipe_cache.RecipeCache(min_similarity=0.6)
+    cache.set(pantry, preferences, recipe)
+    assert cache.get(near_pantry, preferences) == recipe
+    assert (cache.hits, cache.near_hits, cache.misses) == (0, 1, 0)
+
+
+def test_other_preferences_miss(pantry, preferences, recipe):
+    cache = sc_recipe_cache.RecipeCache()
+    cache.set(pantry, preferences, recipe)
+
+    vegan = preferences.model_copy(update={"dietary_restrictions": ["Vegan"]})
+    assert cache.get(pantry, vegan) is None
+
+
+def test_infeasible_recipe_is_not_returned(pantry, preferences, recipe):
+    cache = sc_recipe_cache.RecipeCache(min_similarity=0.6)
+    cache.set(pantry, preferences, recipe)
+
+    # Not enough beans left for the cached recipe.
+    fewer_beans = [pantry[0], make_item("Black Beans", 10, sc_types.Unit.OUNCES)]
+    fewer_beans += pantry[2:]
+    assert cache.get(fewer_beans, preferences) is None
+
+
+def test_returned_recipe_is_a_copy(pantry, preferences, recipe):
+    cache = sc_recipe_cache.RecipeCache()
+    cache.set(pantry, preferences, recipe)
+
+    cache.get(pantry, preferences).name = "Changed"
+    assert cache.get(pantry, preferences).name == "Rice and Beans"
+
+
+def test_eviction(pantry, preferences, recipe):
+    cache = sc_recipe_cache.RecipeCache(max_size=2)
+    for count in [1, 2, 4]:
+        cache.set(pantry[:count], preferences, recipe)
+
+    assert len(cache) == 2
+    assert cache.get(pantry[:1], preferences) is None
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
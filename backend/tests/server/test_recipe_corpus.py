@@ -0,0 +1,129 @@
+import datetime
+import numpy as np
+import pytest
+import sys
+
+from src.data_models import quantity as sc_quantity
+from src.data_models.item import Item
+from src.data_models.recipe import Recipe, RecipeIngredient
+from src.data_models.user import UserPreferences
+from src.server import recipe_corpus as sc_recipe_corpus
+from src.utils import types as sc_types
+
+
+def make_item(name: str, quantity: float, unit: sc_types.Unit) -> Item:
+    return Item(
+        name=name,
+        quantity=sc_quantity.Quantity(
+            quantity=quantity, unit=unit, type=sc_types.UNIT_TYPE_MAPPINGS[unit]
+        ),
+        shelf_life=datetime.timedelta(days=7),
+        storage=sc_types.StorageType.PANTRY,
+    )
+
+
+def make_recipe(name: str, ingredients: list[tuple[str, float, str]]) -> Recipe:
+    return Recipe(
+        name=name,
+        description=f"A {name.lower()}.",
+        ingredients=[
+            RecipeIngredient(name=ingredient, quantity=quantity, unit=unit)
+            for ingredient, quantity, unit in ingredients
+        ],
+        instructions={1: "Cook everything.", 2: "Serve."},
+    )
+
+
+@pytest.fixture
+def recipes():
+    return [
+        make_recipe(
+            "Rice and Beans", [("Brown Rice", 0.5, "lb"), ("Black Beans", 15, "oz")]
+        ),
+        # Similar, but uses more rice than the pantry has.
+        make_recipe("Rice Bowl", [("Brown Rice", 5, "lb"), ("Black Beans", 15, "oz")]),
+        make_recipe("Peach Cobbler", [("Canned Peaches", 2, "lb"), ("Flour", 8, "oz")]),
+    ]
+
+
+@pytest.fixture
+def pantry():
+    return [
+        make_item("Brown Rice", 2, sc_types.Unit.POUNDS),
+        make_item("Black Beans", 15, sc_types.Unit.OUNCES),
+    ]
+
+
+@pytest.fixture
+def preferences():
+    return UserPreferences(
+        dietary_restrictions=[],
+        favorite_cuisines=["Mexican"],
+        favorite_recipes=[],
+        kitchen_appliances=["Stove"],
+        number_of_people=2,
+    )
+
+
+def test_search_ranks_by_similarity(monkeypatch, recipes):
+    # Score a few rows at a time to merge the best rows across chunks.
+    monkeypatch.setattr(sc_recipe_corpus, "_SEARCH_CHUNK_ROWS", 2)
+    corpus = sc_recipe_corpus.RecipeCorpus()
+    corpus.add(recipes)
+
+    results = corpus.search("Ingredients: Brown Rice, Black Beans.", top_k=2)
+
+    assert [recipe.name for _, recipe in results] == ["Rice and Beans", "Rice Bowl"]
+    assert results[0][0] >= results[1][0]
+
+
+def test_find_returns_feasible_recipe(recipes, pantry, preferences):
+    corpus = sc_recipe_corpus.RecipeCorpus()
+    corpus.add(recipes[1:])
+    # The rice bowl is similar but needs more rice than there is.
+    assert corpus.find(pantry, preferences) is None
+
+    corpus.add(recipes[:1])
+    assert corpus.find(pantry, preferences).name == "Rice and Beans"
+    assert (
+        corpus.find([make_item("Flour", 1, sc_types.Unit.POUNDS)], preferences) is None
+    )
+
+
+def test_find_is_scoped_by_user_and_restrictions(recipes, pantry, preferences):
+    vegan = preferences.model_copy(update={"dietary_restrictions": ["Vegan"]})
+    corpus = sc_recipe_corpus.RecipeCorpus()
+    corpus.add(recipes[:1], user_id="user-1", user_preferences=preferences)
+
+    assert corpus.find(pantry, preferences, user_id="user-1") is not None
+    assert corpus.find(pantry, preferences, user_id="user-2") is None
+    assert corpus.find(pantry, preferences) is None
+    assert corpus.find(pantry, vegan, user_id="user-1") is None
+
+    corpus.add(recipes[:1], user_id="user-1", user_preferences=vegan)
+    assert corpus.find(pantry, vegan, user_id="user-1") is not None
+
+
+def test_corpus_is_stored_memory_mapped(tmp_path, recipes):
+    corpus = sc_recipe_corpus.RecipeCorpus(str(tmp_path))
+    corpus.add(recipes[:2])
+    corpus.add(recipes[2:], user_id="user-1")
+
+    loaded = sc_recipe_corpus.RecipeCorpus(str(tmp_path))
+    assert len(loaded) == 3
+    assert loaded._scope_rows == {
+        (None, frozenset()): [0, 1],
+        ("user-1", frozenset()): [2],
+    }
+    assert isinstance(loaded._vectors, np.memmap)
+    assert loaded._vectors.dtype == np.float16
+    assert loaded.search("Peach Cobbler", top_k=1)[0][1].name == "Peach Cobbler"
+
+    with pytest.raises(ValueError):
+        sc_recipe_corpus.RecipeCorpus(
+            str(tmp_path), embedder=sc_recipe_corpus.HashingEmbedder(64)
+        ).add(recipes[:1])
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
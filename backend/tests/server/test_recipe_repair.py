@@ -0,0 +1,135 @@
+import datetime
+import pytest
+import sys
+
+from src.data_models import quantity as sc_quantity
+from src.data_models.item import Item
+from src.data_models.nutritional_facts import NutritionalFacts
+from src.data_models.recipe import Recipe, RecipeIngredient
+from src.server import recipe_repair as sc_recipe_repair
+from src.utils import types as sc_types
+
+
+def make_item(name: str, quantity: float, unit: sc_types.Unit) -> Item:
+    return Item(
+        name=name,
+        quantity=sc_quantity.Quantity(
+            quantity=quantity, unit=unit, type=sc_types.UNIT_TYPE_MAPPINGS[unit]
+        ),
+        shelf_life=datetime.timedelta(days=7),
+        storage=sc_types.StorageType.PANTRY,
+    )
+
+
+def make_recipe(ingredients: list[tuple[str, float, str]]) -> Recipe:
+    return Recipe(
+        name="Rice and Beans",
+        description="Rice with black beans.",
+        ingredients=[
+            RecipeIngredient(name=name, quantity=quantity, unit=unit)
+            for name, quantity, unit in ingredients
+        ],
+        instructions={1: "Cook the rice.", 2: "Add the beans."},
+    )
+
+
+@pytest.fixture
+def pantry():
+    rice = make_item("Brown Rice", 2, sc_types.Unit.POUNDS)
+    rice.nutritional_facts = NutritionalFacts(
+        serving_size=sc_quantity.Quantity(quantity=100, unit=sc_types.Unit.GRAMS),
+        calories=sc_quantity.Quantity(quantity=110, unit=sc_types.Unit.KCAL),
+    )
+    beans = make_item("Black Beans", 15, sc_types.Unit.OUNCES)
+    beans.nutritional_facts = NutritionalFacts(
+        serving_size=sc_quantity.Quantity(quantity=100, unit=sc_types.Unit.GRAMS),
+        calories=sc_quantity.Quantity(quantity=130, unit=sc_types.Unit.KCAL),
+    )
+    return [rice, beans, make_item("Sweet Onion", 1, sc_types.Unit.POUNDS)]
+
+
+def test_resolve_item(pantry):
+    assert sc_recipe_repair.resolve_item("brown rice", pantry).name == "Brown Rice"
+    assert sc_recipe_repair.resolve_item("Onions", pantry).name == "Sweet Onion"
+    assert sc_recipe_repair.resolve_item("Black Bean", pantry).name == "Black Beans"
+    assert sc_recipe_repair.resolve_item("Blak Beans", pantry).name == "Black Beans"
+    assert sc_recipe_repair.resolve_item("Chicken", pantry) is None
+
+
+def test_normalize_unit():
+    assert sc_recipe_repair.normalize_unit("Pounds") == sc_types.Unit.POUNDS
+    assert sc_recipe_repair.normalize_unit("tbsp.") == sc_types.Unit.TABLESPOON
+    assert sc_recipe_repair.normalize_unit("handful") is None
+
+
+def test_verify_recipe_repairs_names_units_and_over_use(pantry):
+    recipe = make_recipe([("rice", 2.2, "pounds"), ("Black Beans", 15, "ounces")])
+
+    verification = sc_recipe_repair.verify_recipe(recipe, pantry)
+
+    assert verification.feasible
+    repaired = verification.recipe
+    assert [(i.name, i.unit) for i in repaired.ingredients] == [
+        ("Brown Rice", "lb"),
+        ("Black Beans", "oz"),
+    ]
+    # 10% too much rice: every quantity is scaled down to fit.
+    assert repaired.ingredients[0].quantity == pytest.approx(2.2 * 0.9)
+    assert repaired.ingredients[1].quantity == pytest.approx(15 * 0.9)
+    assert repaired.check_feasibility(pantry)
+    # 1.98 lb of rice and 13.5 oz of beans, per 100 g serving.
+    assert repaired.nutritional_facts.calories.quantity == pytest.approx(
+        1.98 * 453.592 / 100 * 110 + 13.5 * 28.3495 / 100 * 130
+    )
+    # The recipe passed in is left as is.
+    assert recipe.ingredients[0].name == "rice"
+
+
+def test_verify_recipe_reports_unfixable_issues(pantry):
+    verification = sc_recipe_repair.verify_recipe(
+        make_recipe([("Brown Rice", 5, "lb"), ("Chicken", 1, "lb")]), pantry
+    )
+    assert not verification.feasible
+    assert verification.issues == ["Chicken is not among the available items."]
+
+    verification = sc_recipe_repair.verify_recipe(
+        make_recipe([("Brown Rice", 5, "lb")]), pantry
+    )
+    assert verification.issues == ["Brown Rice needs 250% of the available quantity."]
+
+
+def test_verify_recipe_allows_pantry_staples(pantry):
+    recipe = make_recipe(
+        [("Brown Rice", 1, "lb"), ("Salt", 1, "tsp"), ("Black Pepper", 1, "pinch")]
+    )
+
+    verification = sc_recipe_repair.verify_recipe(recipe, pantry)
+
+    assert verification.feasible
+    assert verification.recipe.check_feasibility(pantry)
+
+
+@pytest.mark.parametrize(
+    "ingredients",
+    [
+        # Salt is not stored, so its nutrition is unknown.
+        [("Brown Rice", 1, "lb"), ("Salt", 1, "tsp")],
+        # The onion has no serving size.
+        [("Brown Rice", 1, "lb"), ("Sweet Onion", 1, "lb")],
+    ],
+)
+def test_verify_recipe_keeps_estimated_nutrition(pantry, ingredients):
+    recipe = make_recipe(ingredients)
+    recipe.nutritional_facts = NutritionalFacts(
+        calories=sc_quantity.Quantity(quantity=900, unit=sc_types.Unit.KCAL)
+    )
+
+    verification = sc_recipe_repair.verify_recipe(recipe, pantry)
+
+    assert verification.feasible
+    assert verification.recipe.nutritional_facts.calories.quantity == 900
+    assert "Recomputed the nutritional facts." not in verification.repairs
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
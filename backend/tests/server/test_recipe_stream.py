@@ -0,0 +1,117 @@
+import json
+import pytest
+import sys
+
+from src.data_models.recipe import Recipe
+from src.server import recipe_stream as sc_recipe_stream
+
+Stage = sc_recipe_stream.RecipeStreamStage
+
+
+RECIPE_JSON = json.dumps(
+    {
+        "name": "Rice Bowl",
+        "description": "Rice, beans and tomatoes.",
+        "ingredients": [
+            {"name": "Brown Rice", "quantity": 1, "unit": "lb"},
+            {"name": "Black Beans", "quantity": 15, "unit": "oz"},
+        ],
+        "instructions": {"1": "Cook the rice.", "2": "Add the beans, then stir."},
+    }
+)
+
+
+def stream(parser, text: str, chunk_size: int = 5) -> list[tuple[int, object]]:
+    """Feeds text in chunks and returns each event with the offset it arrived at."""
+    events = []
+    for start in range(0, len(text), chunk_size):
+        for event in parser.feed(text[start : start + chunk_size]):
+            events.append((start + chunk_size, event))
+    return events
+
+
+def test_parts_are_emitted_in_stages():
+    parser = sc_recipe_stream.RecipeStreamParser()
+    events = stream(parser, RECIPE_JSON)
+    events += [
+        (len(RECIPE_JSON), event)
+        for event in parser.finish(Recipe.model_validate_json(RECIPE_JSON))
+    ]
+
+    stages = [event.stage for _, event in events]
+    assert stages == [
+        Stage.HEADER,
+        Stage.INGREDIENT,
+        Stage.INGREDIENT,
+        Stage.INSTRUCTION,
+        Stage.INSTRUCTION,
+        Stage.RECIPE,
+    ]
+    header = events[0][1]
+    assert header.name == "Rice Bowl"
+    assert header.description == "Rice, beans and tomatoes."
+    assert [event.ingredient.name for _, event in events[1:3]] == [
+        "Brown Rice",
+        "Black Beans",
+    ]
+    assert [(event.step, event.instruction) for _, event in events[3:5]] == [
+        (1, "Cook the rice."),
+        (2, "Add the beans, then stir."),
+    ]
+    assert events[-1][1].recipe.name == "Rice Bowl"
+
+    # The header and the first ingredient arrive before the output is complete.
+    assert events[0][0] < RECIPE_JSON.index("ingredients") + 20
+    assert events[1][0] < RECIPE_JSON.index("Black Beans") + 20
+
+
+def test_changed_recipe_replaces_streamed_parts():
+    recipe = Recipe.model_validate_json(RECIPE_JSON)
+    repaired = recipe.model_copy(update={"ingredients": recipe.ingredients[:1]})
+
+    parser = sc_recipe_stream.RecipeStreamParser()
+    stream(parser, RECIPE_JSON)
+    final = parser.finish(recipe, repaired)[-1]
+
+    assert final.stage == Stage.REPLACED
+    assert final.recipe.ingredients == recipe.ingredients[:1]
+
+    # Facts that are not streamed do not replace the parts.
+    parser = sc_recipe_stream.RecipeStreamParser()
+    stream(parser, RECIPE_JSON)
+    unchanged = recipe.model_copy(
+        update={"nutritional_facts": repaired.nutritional_facts}
+    )
+    assert parser.finish(recipe, unchanged)[-1].stage == Stage.RECIPE
+
+
+def test_code_fence_is_ignored():
+    parser = sc_recipe_stream.RecipeStreamParser()
+    events = stream(parser, f"```json\n{RECIPE_JSON}")
+
+    assert [event.stage for _, event in events][:2] == [Stage.HEADER, Stage.INGREDIENT]
+
+
+def test_invalid_ingredient_fails_early():
+    parser = sc_recipe_stream.RecipeStreamParser()
+    text = (
+        '{"name": "Rice Bowl", "description": "Rice.", "ingredients": '
+        '[{"name": "Brown Rice", "quantity": "a lot", "unit": "lb"}, {"name": "'
+    )
+
+    with pytest.raises(ValueError):
+        stream(parser, text)
+
+
+def test_reset_discards_output():
+    parser = sc_recipe_stream.RecipeStreamParser()
+    stream(parser, RECIPE_JSON[:60])
+    parser.reset()
+
+    events = stream(parser, RECIPE_JSON)
+
+    assert [event.stage for _, event in events].count(Stage.HEADER) == 1
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,181 @@
+import concurrent.futures
+import datetime
+import pytest
+import sqlite3
+import sys
+
+from src.data_models.item import Item
+from src.data_models.quantity import Quantity
+from src.data_models.recipe import Recipe, RecipeIngredient
+from src.server.item_storage import ItemStorage
+from src.server.sqlite_store_items import SqliteItemStore
+from src.utils import types as sc_types
+
+
+def make_item(
+    name: str,
+    quantity: float = 1.0,
+    days: float = 7,
+    unit: str = "lb",
+    storage: sc_types.StorageType = sc_types.StorageType.PANTRY,
+) -> Item:
+    return Item(
+        name=name,
+        quantity=Quantity(quantity=quantity, unit=unit),
+        shelf_life=datetime.timedelta(days=days),
+        storage=storage,
+    )
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "items.db")
+
+
+def test_crud(path):
+    store = SqliteItemStore(user_id="test_user", path=path)
+    other = SqliteItemStore(user_id="other_user", path=path)
+    assert isinstance(store, ItemStorage)
+
+    store.add_items([make_item("rice"), make_item("beans")])
+    other.add_items([make_item("rice", quantity=5)])
+    store.update_item(make_item("rice", quantity=2))
+
+    assert [item.name for item in store.get_items()] == ["beans", "rice"]
+    assert store.get_item("rice").quantity.quantity == 2
+    assert other.get_item("rice").quantity.quantity == 5
+    items = store.get_items_by_names(["rice", "salt", "beans"])
+    assert [item and item.name for item in items] == ["rice", None, "beans"]
+
+    store.delete_item("rice")
+    with pytest.raises(KeyError):
+        store.get_item("rice")
+    assert [item.name for item in other.get_items()] == ["rice"]
+    store.close()
+    other.close()
+
+
+def test_changes_since(path):
+    store = SqliteItemStore(user_id="test_user", path=path)
+    store.add_items([make_item("rice"), make_item("beans")])
+    first = store.get_changes_since()
+    assert [item.name for item in first.items] == ["rice", "beans"]
+
+    store.update_item(make_item("rice", quantity=2))
+    store.delete_item("beans")
+    store.add_items([make_item("salt")])
+    changes = store.get_changes_since(first.token)
+    assert [item.name for item in changes.items] == ["rice", "salt"]
+    assert changes.deleted == ["beans"]
+
+    assert store.get_changes_since(changes.token).items == []
+    assert store.get_changes_since(changes.token).token == changes.token
+
+    # The latest change is kept so the next sequence is not reused.
+    store.delete_item("salt")
+    assert store.purge_tombstones(datetime.timedelta(0)) == 1
+    store.update_item(make_item("salt"))
+    latest = store.get_changes_since(changes.token)
+    assert sorted(item.name for item in latest.items) == ["salt"]
+    store.close()
+
+
+def test_get_expiring_items(path):
+    store = SqliteItemStore(user_id="test_user", path=path)
+    fridge = sc_types.StorageType.FRIDGE
+    store.add_items(
+        [
+            make_item("rice", days=300),
+            make_item("milk", days=2, storage=fridge),
+            make_item("bread", days=1),
+            make_item("yogurt", days=0, storage=fridge),
+            make_item("eggs", days=3, storage=fridge),
+        ]
+    )
+    store.delete_item("bread")
+
+    expiring = store.get_expiring_items(within_days=3)
+    assert [item.name for item in expiring] == ["yogurt", "milk", "eggs"]
+    assert expiring[0].expiration_date == datetime.datetime.now().date()
+    assert [item.name for item in store.get_expiring_items(2, limit=1)] == ["yogurt"]
+    pantry = store.get_expiring_items(300, storage=sc_types.StorageType.PANTRY)
+    assert [item.name for item in pantry] == ["rice"]
+    with pytest.raises(ValueError):
+        store.get_expiring_items(-1)
+
+
+def make_recipe(ingredients: list[tuple[str, float, str]]) -> Recipe:
+    return Recipe(
+        name="Rice and Beans",
+        description="Rice with beans.",
+        ingredients=[
+            RecipeIngredient(name=name, quantity=quantity, unit=unit)
+            for name, quantity, unit in ingredients
+        ],
+        instructions={1: "Cook everything."},
+    )
+
+
+def test_cook_recipe(path):
+    store = SqliteItemStore(user_id="test_user", path=path)
+    store.add_items(
+        [make_item("rice", 2), make_item("beans", 15, unit="oz"), make_item("salt")]
+    )
+
+    # Quantities are converted to the unit of each item and added up.
+    updated = store.cook_recipe(
+        make_recipe([("rice", 8, "ounces"), ("beans", 15, "oz"), ("rice", 0.5, "lb")])
+    )
+    assert updated[0].quantity.quantity == pytest.approx(1.0)
+    assert updated[1] is None
+    assert store.get_item("rice").quantity.quantity == pytest.approx(1.0)
+    assert store.get_items_by_names(["beans"]) == [None]
+
+    # A short item fails the whole recipe, leaving every item unchanged.
+    with pytest.raises(ValueError, match="Not enough rice"):
+        store.cook_recipe(make_recipe([("salt", 0.5, "lb"), ("rice", 2, "lb")]))
+    assert store.get_item("salt").quantity.quantity == 1.0
+    with pytest.raises(ValueError, match="not in storage"):
+        store.cook_recipe(make_recipe([("beans", 1, "oz")]))
+
+    # Staples are taken from storage if they are stored, and skipped otherwise.
+    updated = store.cook_recipe(
+        make_recipe([("rice", 0.5, "lb"), ("salt", 0.5, "lb"), ("water", 2, "cup")])
+    )
+    assert updated[1].quantity.quantity == pytest.approx(0.5)
+    assert updated[2] is None
+    assert store.get_items_by_names(["water"]) == [None]
+    store.close()
+
+
+def test_iter_items_pages(path):
+    store = SqliteItemStore(user_id="test_user", path=path)
+    store.add_items([make_item(f"item {i:02}") for i in range(25)])
+
+    names = [item.name for item in store.iter_items(page_size=10)]
+    assert names == [f"item {i:02}" for i in range(25)]
+    store.close()
+
+
+def test_wal_and_concurrent_reads(path):
+    store = SqliteItemStore(user_id="test_user", path=path)
+    store.add_items([make_item(f"item {i}") for i in range(100)])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=8) as executor:
+        counts = list(executor.map(lambda _: len(store.get_items()), range(32)))
+    assert counts == [100] * 32
+    store.close()
+
+    connection = sqlite3.connect(path)
+    assert connection.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    plan = connection.execute(
+        "EXPLAIN QUERY PLAN SELECT data FROM items"
+        " WHERE user_id = ? AND deleted = 0 AND expiration_date <= ?",
+        ("test_user", "2030-01-01"),
+    ).fetchall()
+    assert "items_by_expiration" in str(plan)
+    connection.close()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -1,8 +1,14 @@
+import asyncio
+import datetime
 import pytest
 from unittest.mock import Mock, patch
 from firebase_admin import firestore
-from src.server.store_items import ItemFireStore
+from src.server.item_cache import ItemCache
+from src.server.store_items import AsyncItemFireStore, ItemFireStore
+from src.server import store_items as sc_store_items
 from src.data_models.item import Item
+from src.data_models.quantity import Quantity
+from src.utils import types as sc_types
 
 
 @pytest.fixture
@@ -29,7 +35,12 @@ def store(mock_firestore):
 @pytest.fixture
 def sample_item():
     """Create a sample Item for testing."""
-    return Item(name="test_item", user_id="test_user", quantity=1.0, unit="kg")
+    return Item(
+        name="test_item",
+        quantity=Quantity(quantity=1.0, unit="kg"),
+        shelf_life=datetime.timedelta(days=7),
+        storage=sc_types.StorageType.PANTRY,
+    )
 
 
 def test_add_items(store, mock_firestore, mock_batch, sample_item):
@@ -47,16 +58,62 @@ def test_add_items(store, mock_firestore, mock_batch, sample_item):
     mock_batch.commit.assert_called_once()
 
 
-def test_get_items(store, mock_firestore):
+def test_add_items_in_chunks(store, mock_firestore, sample_item):
+    """Test adding more items than fit in one Firestore batch."""
+    batches = [Mock(spec=firestore.WriteBatch) for _ in range(3)]
+    mock_firestore.batch.side_effect = batches
+    items = [sample_item.model_copy(update={"name": f"item_{i}"}) for i in range(1200)]
+
+    store.add_items(items)
+
+    assert [batch.set.call_count for batch in batches] == [500, 500, 200]
+    for batch in batches:
+        batch.commit.assert_called_once()
+
+
+def test_buffered_writes(mock_firestore, mock_batch, sample_item):
+    """Test that buffered writes are merged and committed on flush."""
+    mock_firestore.batch.return_value = mock_batch
+    mock_firestore.collection().document.side_effect = lambda path: Mock(path=path)
+    store = ItemFireStore(user_id="test_user", db=mock_firestore, buffered=True)
+
+    store.update_item(sample_item)
+    store.update_item(sample_item)
+    store.delete_item("old_item")
+    assert not mock_batch.commit.called
+
+    store.flush()
+    # The deletion is written as a tombstone.
+    assert mock_batch.set.call_count == 2
+    assert mock_batch.set.call_args_list[1].args[1]["deleted"] is True
+    mock_batch.commit.assert_called_once()
+    data = mock_batch.set.call_args_list[0].args[1]
+    assert data["user_id"] == "test_user"
+    assert Item.from_dict(data).to_dict() == sample_item.to_dict()
+    store.close()
+
+
+def test_cached_reads(mock_firestore, sample_item):
+    """Test that reads are cached until this store writes the item."""
+    mock_doc = Mock(exists=True)
+    mock_doc.to_dict.return_value = {**sample_item.to_dict(), "user_id": "test_user"}
+    mock_firestore.collection().document().get.return_value = mock_doc
+    store = ItemFireStore(user_id="test_user", db=mock_firestore, cache=ItemCache())
+
+    assert store.get_item("test_item").name == "test_item"
+    assert store.get_item("test_item").name == "test_item"
+    assert mock_firestore.collection().document().get.call_count == 1
+
+    store.update_item(sample_item)
+    store.get_item("test_item")
+    assert mock_firestore.collection().document().get.call_count == 2
+
+
+def test_get_items(store, mock_firestore, sample_item):
     """Test retrieving all items from Firestore."""
     # Setup
     mock_doc = Mock()
-    mock_doc.to_dict.return_value = {
-        "name": "test_item",
-        "user_id": "test_user",
-        "quantity": 1.0,
-        "unit": "kg",
-    }
+    mock_doc.to_dict.return_value = {**sample_item.to_dict(), "user_id": "test_user"}
     mock_firestore.collection().where().stream.return_value = [mock_doc]
 
     # Execute
@@ -69,12 +126,76 @@ def test_get_items(store, mock_firestore):
     mock_firestore.collection().where.assert_called_with("user_id", "==", "test_user")
 
 
+class FakeQuery:
+    """Stands in for a Firestore query over documents ordered by id."""
+
+    def __init__(self, docs, requests, after=None, count=None, fields=None):
+        self._docs = docs
+        self._requests = requests
+        self._after = after
+        self._count = count
+        self._fields = fields
+
+    def where(self, *args):
+        return self
+
+    def order_by(self, field):
+        assert field in ("__name__", "expiration_date")
+        return self
+
+    def select(self, fields):
+        return FakeQuery(self._docs, self._requests, self._after, self._count, fields)
+
+    def start_after(self, doc):
+        return FakeQuery(self._docs, self._requests, doc, self._count, self._fields)
+
+    def limit(self, count):
+        return FakeQuery(self._docs, self._requests, self._after, count, self._fields)
+
+    def stream(self):
+        self._requests.append(self._fields)
+        ids = [doc.id for doc in self._docs]
+        start = 0 if self._after is None else ids.index(self._after.id) + 1
+        for doc in self._docs[start : start + self._count]:
+            data = doc.to_dict()
+            if self._fields is not None:
+                data = {key: data[key] for key in self._fields if key in data}
+            yield Mock(id=doc.id, to_dict=Mock(return_value=data))
+
+
+def test_iter_items_pages(mock_firestore, sample_item):
+    """Test that items are read in pages with cursors and projections."""
+    docs = []
+    for i in range(5):
+        data = {**sample_item.to_dict(), "name": f"item_{i}", "user_id": "test_user"}
+        docs.append(Mock(id=f"test%5Fuser_item%5F{i}", to_dict=Mock(return_value=data)))
+    requests = []
+    mock_firestore.collection.return_value = FakeQuery(docs, requests)
+    store = ItemFireStore(user_id="test_user", db=mock_firestore)
+
+    items = store.iter_items(page_size=2, fields=[])
+    assert next(items).name == "item_0"
+    # Only the first page was read so far.
+    assert len(requests) == 1
+
+    assert [item.name for item in items] == [f"item_{i}" for i in range(1, 5)]
+    assert len(requests) == 3
+    assert requests[0] == [
+        "deleted",
+        "name",
+        "quantity",
+        "shelf_life_days",
+        "storage",
+        "user_id",
+    ]
+
+
 def test_get_item_exists(store, mock_firestore, sample_item):
     """Test retrieving a specific item that exists."""
     # Setup
     mock_doc = Mock()
     mock_doc.exists = True
-    mock_doc.to_dict.return_value = sample_item.model_dump()
+    mock_doc.to_dict.return_value = {**sample_item.to_dict(), "user_id": "test_user"}
     mock_firestore.collection().document().get.return_value = mock_doc
 
     # Execute
@@ -85,6 +206,60 @@ def test_get_item_exists(store, mock_firestore, sample_item):
     assert item.name == "test_item"
 
 
+def test_get_items_by_names(mock_firestore, sample_item):
+    """Test that items are read in one request, in the requested order."""
+
+    def doc(doc_id, name=None):
+        data = None
+        if name is not None:
+            data = {**sample_item.to_dict(), "name": name, "user_id": "test_user"}
+        return Mock(id=doc_id, exists=data is not None, to_dict=Mock(return_value=data))
+
+    mock_firestore.get_all.return_value = [
+        doc("test%5Fuser_salt"),
+        doc("test%5Fuser_rice", "rice"),
+        doc("test%5Fuser_beans", "beans"),
+    ]
+    store = ItemFireStore(user_id="test_user", db=mock_firestore, cache=ItemCache())
+
+    items = store.get_items_by_names(["beans", "salt", "rice", "beans"])
+    assert [item and item.name for item in items] == ["beans", None, "rice", "beans"]
+    mock_firestore.get_all.assert_called_once()
+    assert len(mock_firestore.get_all.call_args.args[0]) == 3
+
+    # The cache answers the same names, including the missing one.
+    store.get_items_by_names(["salt", "rice"])
+    mock_firestore.get_all.assert_called_once()
+
+
+def test_document_ids_are_unique():
+    """Test that no two users or items share a document id."""
+    assert sc_store_items._document_id("a_b", "c") != sc_store_items._document_id(
+        "a", "b_c"
+    )
+    assert sc_store_items._document_id("u", "x/y") != sc_store_items._document_id(
+        "u", "x_y"
+    )
+    assert sc_store_items._document_id("u", "x%2Fy") != sc_store_items._document_id(
+        "u", "x/y"
+    )
+    assert "/" not in sc_store_items._document_id("a/b", "c/d")
+    assert sc_store_items._document_id("user", "rice") == "user_rice"
+
+
+def test_get_item_of_other_user(store, mock_firestore, sample_item):
+    """Test that a document of another user is read as missing."""
+    data = {**sample_item.to_dict(), "user_id": "other_user"}
+    doc_id = sc_store_items._document_id("test_user", "test_item")
+    mock_doc = Mock(id=doc_id, exists=True, to_dict=Mock(return_value=data))
+    mock_firestore.collection().document().get.return_value = mock_doc
+    mock_firestore.get_all.return_value = [mock_doc]
+
+    with pytest.raises(KeyError):
+        store.get_item("test_item")
+    assert store.get_items_by_names(["test_item"]) == [None]
+
+
 def test_get_item_not_exists(store, mock_firestore):
     """Test retrieving a non-existent item."""
     # Setup
@@ -97,6 +272,23 @@ def test_get_item_not_exists(store, mock_firestore):
         store.get_item("nonexistent_item")
 
 
+def test_get_expiring_items_skips_tombstones(mock_firestore, sample_item):
+    """Test that documents without `deleted` are returned and tombstones skipped."""
+    legacy = {**sample_item.to_dict(), "user_id": "test_user"}
+    tombstone = {**legacy, "deleted": True}
+    docs = [
+        Mock(id=str(i), to_dict=Mock(return_value={**data, "name": f"item_{i}"}))
+        for i, data in enumerate([tombstone, legacy, tombstone, legacy, legacy])
+    ]
+    requests = []
+    mock_firestore.collection.return_value = FakeQuery(docs, requests)
+    store = ItemFireStore(user_id="test_user", db=mock_firestore)
+
+    items = store.get_expiring_items(300, limit=2)
+    assert [item.name for item in items] == ["item_1", "item_3"]
+    assert len(requests) == 2
+
+
 def test_update_item(store, mock_firestore, sample_item):
     """Test updating an item."""
     # Execute
@@ -111,8 +303,211 @@ def test_delete_item(store, mock_firestore):
     # Execute
     store.delete_item("test_item")
 
-    # Verify
-    mock_firestore.collection().document().delete.assert_called_once()
+    # Verify the item is kept as a tombstone.
+    mock_firestore.collection().document().set.assert_called_once()
+    data = mock_firestore.collection().document().set.call_args.args[0]
+    assert data["name"] == "test_item"
+    assert data["deleted"] is True
+
+
+def test_get_changes_since(store, mock_firestore, sample_item):
+    """Test that changes report modified items, deletions and a new token."""
+    token = "2024-01-01T00:00:00+00:00"
+    later = datetime.datetime(2024, 1, 2, tzinfo=datetime.timezone.utc)
+    docs = [
+        {
+            **sample_item.to_dict(),
+            "user_id": "test_user",
+            "deleted": False,
+            "updated_at": later,
+        },
+        {
+            "name": "old_item",
+            "user_id": "test_user",
+            "deleted": True,
+            "updated_at": later,
+        },
+    ]
+    query = mock_firestore.collection().where().where()
+    query.order_by().stream.return_value = [
+        Mock(to_dict=Mock(return_value=data)) for data in docs
+    ]
+
+    changes = store.get_changes_since(token)
+    query.order_by.assert_called_with("updated_at")
+    assert [item.name for item in changes.items] == ["test_item"]
+    assert changes.deleted == ["old_item"]
+    assert changes.token == later.isoformat()
+
+
+def test_get_expiring_items(store, mock_firestore, sample_item):
+    """Test that Firestore filters the items on expiration date and storage."""
+    query = Mock()
+    query.where.return_value = query
+    query.order_by.return_value = query
+    query.limit.return_value = query
+    query.stream.return_value = [
+        Mock(
+            to_dict=Mock(
+                return_value={
+                    **sample_item.to_dict(),
+                    "user_id": "test_user",
+                    "deleted": False,
+                }
+            )
+        )
+    ]
+    mock_firestore.collection.return_value = query
+    store = ItemFireStore(user_id="test_user", db=mock_firestore)
+
+    items = store.get_expiring_items(3, storage=sc_types.StorageType.PANTRY, limit=10)
+    assert items == [sample_item]
+    cutoff = datetime.datetime.now().date() + datetime.timedelta(days=3)
+    assert [call.args for call in query.where.call_args_list] == [
+        ("user_id", "==", "test_user"),
+        ("storage", "==", "PANTRY"),
+        ("expiration_date", "<=", cutoff.isoformat()),
+    ]
+    query.order_by.assert_called_once_with("expiration_date")
+    query.limit.assert_called_once_with(10)
+
+
+class FakeAsyncDb:
+    """Stands in for an async Firestore client, with documents in memory."""
+
+    def __init__(self):
+        self.docs = {}
+        self.commits = []
+
+    def collection(self, name):
+        return self
+
+    def document(self, doc_id):
+        return FakeAsyncDocument(self, doc_id)
+
+    def where(self, field, op, value):
+        return FakeAsyncQuery(self, value)
+
+    def batch(self):
+        return FakeAsyncBatch(self)
+
+    async def get_all(self, refs):
+        self.commits.append("get_all")
+        for ref in refs:
+            data = self.docs.get(ref.id)
+            yield Mock(
+                id=ref.id, exists=data is not None, to_dict=Mock(return_value=data)
+            )
+
+
+class FakeAsyncDocument:
+    def __init__(self, db, doc_id):
+        self._db = db
+        self.id = doc_id
+
+    async def get(self):
+        data = self._db.docs.get(self.id)
+        return Mock(exists=data is not None, to_dict=Mock(return_value=data))
+
+    async def set(self, data, merge=False):
+        self._db.docs[self.id] = {**self._db.docs.get(self.id, {}), **data}
+
+    async def delete(self):
+        self._db.docs.pop(self.id, None)
+
+
+class FakeAsyncQuery:
+    def __init__(self, db, user_id):
+        self._db = db
+        self._user_id = user_id
+
+    async def stream(self):
+        for doc_id, data in list(self._db.docs.items()):
+            if data["user_id"] == self._user_id:
+                await asyncio.sleep(0)
+                yield Mock(id=doc_id, to_dict=Mock(return_value=data))
+
+
+class FakeAsyncBatch:
+    def __init__(self, db):
+        self._db = db
+        self._writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self._writes.append((doc_ref, data))
+
+    async def commit(self):
+        assert len(self._writes) <= 500
+        await asyncio.sleep(0)
+        for doc_ref, data in self._writes:
+            await doc_ref.set(data, merge=True)
+        self._db.commits.append(len(self._writes))
+
+
+def test_async_store(sample_item):
+    """Test the async store against an in-memory client."""
+    db = FakeAsyncDb()
+    store = AsyncItemFireStore(user_id="test_user", db=db)
+    items = [sample_item.model_copy(update={"name": f"item_{i}"}) for i in range(1200)]
+
+    async def run():
+        await store.add_items(items)
+        await AsyncItemFireStore(user_id="other_user", db=db).add_items(items[:1])
+        assert len(await store.get_items()) == 1200
+
+        await store.update_item(sample_item)
+        assert (await store.get_item("test_item")).name == "test_item"
+        found = await store.get_items_by_names(["item_1", "missing", "item_0"])
+        assert [item and item.name for item in found] == ["item_1", None, "item_0"]
+        await store.delete_item("test_item")
+        with pytest.raises(KeyError):
+            await store.get_item("test_item")
+
+    asyncio.run(run())
+    assert db.commits.count("get_all") == 1
+    assert sorted(c for c in db.commits if c != "get_all") == [1, 200, 500, 500]
+
+
+def test_async_store_ignores_other_users(sample_item):
+    """Test that the async store reads documents of other users as missing."""
+    db = FakeAsyncDb()
+    store = AsyncItemFireStore(user_id="test_user", db=db)
+    doc_id = sc_store_items._document_id("test_user", "test_item")
+    db.docs[doc_id] = {**sample_item.to_dict(), "user_id": "other_user"}
+
+    async def run():
+        with pytest.raises(KeyError):
+            await store.get_item("test_item")
+        assert await store.get_items_by_names(["test_item"]) == [None]
+
+    asyncio.run(run())
+
+
+def test_fan_out_limits_concurrency(sample_item):
+    """Test that fan-out keeps the order and the concurrency limit."""
+    running = []
+    peak = []
+
+    async def call(i):
+        running.append(i)
+        peak.append(len(running))
+        await asyncio.sleep(0.01)
+        running.remove(i)
+        return i
+
+    results = asyncio.run(
+        sc_store_items.fan_out(
+            [lambda i=i: call(i) for i in range(10)], max_concurrency=3
+        )
+    )
+    assert results == list(range(10))
+    assert max(peak) == 3
+
+    db = FakeAsyncDb()
+    asyncio.run(AsyncItemFireStore(user_id="a", db=db).add_items([sample_item]))
+    inventories = asyncio.run(sc_store_items.get_inventories(["a", "b"], db))
+    assert [item.name for item in inventories["a"]] == ["test_item"]
+    assert inventories["b"] == []
 
 
 @patch("firebase_admin.credentials.ApplicationDefault")
@@ -0,0 +1,174 @@
+"""Tests ItemFireStore against the Firestore emulator.
+
+Start the emulator and point the tests at it to run them:
+
+    gcloud emulators firestore start --host-port=localhost:8080
+    FIRESTORE_EMULATOR_HOST=localhost:8080 pytest tests/server/test_store_items_emulator.py
+"""
+
+import asyncio
+import concurrent.futures
+import datetime
+import os
+import pytest
+import sys
+import time
+import uuid
+
+from src.data_models.item import Item
+from src.data_models.quantity import Quantity
+from src.data_models.recipe import Recipe, RecipeIngredient
+from src.server.item_cache import ItemCache
+from src.server.store_items import AsyncItemFireStore, ItemFireStore, get_inventories
+from src.utils import types as sc_types
+
+
+pytestmark = pytest.mark.skipif(
+    not os.environ.get("FIRESTORE_EMULATOR_HOST"),
+    reason="FIRESTORE_EMULATOR_HOST is not set.",
+)
+
+
+@pytest.fixture
+def db():
+    """Create a client of the emulator. Each test uses its own user."""
+    from google.cloud import firestore
+
+    return firestore.Client(project="souchef-test")
+
+
+def make_item(name: str, quantity: float = 1.0, days: float = 7) -> Item:
+    return Item(
+        name=name,
+        quantity=Quantity(quantity=quantity, unit="lb"),
+        shelf_life=datetime.timedelta(days=days),
+        storage=sc_types.StorageType.PANTRY,
+    )
+
+
+def test_add_more_items_than_one_batch(db):
+    store = ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+    store.add_items([make_item(f"item {i}") for i in range(1200)])
+
+    assert len(store.get_items()) == 1200
+
+
+def test_iter_items_pages_through_every_item(db):
+    store = ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+    store.add_items([make_item(f"item {i:03}") for i in range(250)])
+
+    names = [item.name for item in store.iter_items(page_size=100, fields=[])]
+    assert names == [f"item {i:03}" for i in range(250)]
+
+
+def test_buffered_writes_are_durable_after_flush(db):
+    user_id = f"user-{uuid.uuid4()}"
+    store = ItemFireStore(user_id=user_id, db=db, buffered=True, flush_interval=60)
+    store.add_items([make_item("rice"), make_item("beans")])
+    store.update_item(make_item("rice", quantity=2.0))
+    store.delete_item("beans")
+    store.close()
+
+    # A new store reads what the buffered store committed.
+    items = ItemFireStore(user_id=user_id, db=db).get_items()
+    assert [(item.name, item.quantity.quantity) for item in items] == [("rice", 2.0)]
+
+
+def test_changes_since_token(db):
+    store = ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+    store.add_items([make_item("rice"), make_item("beans")])
+    first = store.get_changes_since()
+    assert sorted(item.name for item in first.items) == ["beans", "rice"]
+
+    store.update_item(make_item("rice", quantity=2.0))
+    store.delete_item("beans")
+    changes = store.get_changes_since(first.token)
+    assert [item.name for item in changes.items] == ["rice"]
+    assert changes.deleted == ["beans"]
+    assert store.get_changes_since(changes.token).items == []
+
+
+def test_get_expiring_items(db):
+    store = ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+    store.add_items(
+        [
+            make_item("rice", days=300),
+            make_item("milk", days=2),
+            make_item("beans", days=1),
+        ]
+    )
+    store.delete_item("beans")
+
+    assert [item.name for item in store.get_expiring_items(3)] == ["milk"]
+    pantry = store.get_expiring_items(300, storage=sc_types.StorageType.PANTRY)
+    assert [item.name for item in pantry] == ["milk", "rice"]
+    assert store.get_expiring_items(300, storage=sc_types.StorageType.FRIDGE) == []
+
+
+def test_documents_without_change_fields(db):
+    """Documents written before change tracking are read as not deleted."""
+    store = ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+    data = {**make_item("milk", days=2).to_dict(), "user_id": store.user_id}
+    store.collection.document(store._document_id("milk")).set(data)
+
+    assert [item.name for item in store.get_items()] == ["milk"]
+    assert [item.name for item in store.get_expiring_items(3)] == ["milk"]
+    assert [item.name for item in store.get_changes_since().items] == ["milk"]
+
+
+def test_concurrent_cooks_retry_and_never_overdraw(db):
+    store = ItemFireStore(user_id=f"user-{uuid.uuid4()}", db=db)
+    store.add_items([make_item("rice", quantity=2.0)])
+    recipe = Recipe(
+        name="Rice",
+        description="Plain rice.",
+        ingredients=[RecipeIngredient(name="rice", quantity=8, unit="oz")],
+        instructions={1: "Cook the rice."},
+    )
+
+    def cook():
+        try:
+            return store.cook_recipe(recipe)
+        except ValueError:
+            return None
+
+    # Only four half-pound portions fit in two pounds.
+    with concurrent.futures.ThreadPoolExecutor(max_workers=6) as executor:
+        results = list(executor.map(lambda _: cook(), range(6)))
+    assert sum(result is not None for result in results) == 4
+    with pytest.raises(KeyError):
+        store.get_item("rice")
+
+
+def test_cache_follows_writes_of_other_processes(db):
+    user_id = f"user-{uuid.uuid4()}"
+    cached = ItemFireStore(user_id=user_id, db=db, cache=ItemCache(listen=True))
+    other = ItemFireStore(user_id=user_id, db=db)
+    assert cached.get_items() == []
+
+    other.add_items([make_item("rice")])
+    for _ in range(50):
+        if cached.get_items():
+            break
+        time.sleep(0.1)
+    assert [item.name for item in cached.get_items()] == ["rice"]
+
+
+def test_async_store_reads_many_users_concurrently():
+    from google.cloud import firestore
+
+    db = firestore.AsyncClient(project="souchef-test")
+    user_ids = [f"user-{uuid.uuid4()}" for _ in range(10)]
+
+    async def run() -> dict:
+        for i, user_id in enumerate(user_ids):
+            store = AsyncItemFireStore(user_id=user_id, db=db)
+            await store.add_items([make_item(f"item {j}") for j in range(i)])
+        return await get_inventories(user_ids, db)
+
+    inventories = asyncio.run(run())
+    assert [len(inventories[user_id]) for user_id in user_ids] == list(range(10))
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
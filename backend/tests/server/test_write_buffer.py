@@ -0,0 +1,145 @@
+import pytest
+import sys
+import threading
+import time
+
+from src.server import write_buffer as sc_write_buffer
+
+
+class FakeDocument:
+    def __init__(self, path: str):
+        self.path = path
+
+
+class FakeBatch:
+    def __init__(self, db: "FakeDb"):
+        self._db = db
+        self.writes = []
+
+    def set(self, doc_ref, data, merge=False):
+        self.writes.append((doc_ref.path, data, merge))
+
+    def delete(self, doc_ref):
+        self.writes.append((doc_ref.path, None, False))
+
+    def commit(self):
+        if len(self.writes) > sc_write_buffer.MAX_BATCH_WRITES:
+            raise ValueError("Too many writes in one batch.")
+        with self._db.lock:
+            if self._db.failures:
+                self._db.failures -= 1
+                raise ConnectionError("Commit failed.")
+            self._db.committed.append(self.writes)
+
+
+class FakeDb:
+    def __init__(self, failures: int = 0):
+        self.lock = threading.Lock()
+        self.failures = failures
+        self.committed = []
+
+    def batch(self) -> FakeBatch:
+        return FakeBatch(self)
+
+
+def test_buffer_merges_repeated_writes():
+    db = FakeDb()
+    buffer = sc_write_buffer.WriteBuffer(db, flush_interval=60)
+    buffer.set(FakeDocument("items/rice"), {"quantity": 1, "unit": "lb"}, merge=True)
+    buffer.set(FakeDocument("items/rice"), {"quantity": 2}, merge=True)
+    buffer.set(FakeDocument("items/beans"), {"quantity": 1})
+    buffer.delete(FakeDocument("items/beans"))
+    buffer.delete(FakeDocument("items/milk"))
+    buffer.set(FakeDocument("items/milk"), {"quantity": 3}, merge=True)
+    buffer.flush()
+
+    assert db.committed == [
+        [
+            ("items/rice", {"quantity": 2, "unit": "lb"}, True),
+            ("items/beans", None, False),
+            # A merge into a deleted document replaces it.
+            ("items/milk", {"quantity": 3}, False),
+        ]
+    ]
+    assert buffer.merged_writes == 3
+    buffer.close()
+
+
+def test_buffer_flushes_in_chunks():
+    db = FakeDb()
+    buffer = sc_write_buffer.WriteBuffer(db, flush_interval=60)
+    for i in range(1200):
+        buffer.set(FakeDocument(f"items/{i}"), {"quantity": i})
+
+    # A full buffer is flushed without waiting for the time window.
+    for _ in range(50):
+        if db.committed:
+            break
+        time.sleep(0.05)
+    assert db.committed
+    buffer.close()
+    assert sum(len(writes) for writes in db.committed) == 1200
+    assert max(len(writes) for writes in db.committed) == 500
+
+
+def test_buffer_flushes_after_time_window():
+    db = FakeDb()
+    buffer = sc_write_buffer.WriteBuffer(db, flush_interval=0.1)
+    buffer.set(FakeDocument("items/rice"), {"quantity": 1})
+
+    for _ in range(50):
+        if db.committed:
+            break
+        time.sleep(0.05)
+    assert db.committed == [[("items/rice", {"quantity": 1}, False)]]
+    buffer.close()
+
+
+def test_buffer_keeps_failed_writes():
+    db = FakeDb(failures=1)
+    buffer = sc_write_buffer.WriteBuffer(db, flush_interval=60)
+    buffer.set(FakeDocument("items/rice"), {"quantity": 1, "unit": "lb"}, merge=True)
+
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    assert len(buffer) == 1
+
+    buffer.set(FakeDocument("items/rice"), {"quantity": 2}, merge=True)
+    buffer.flush()
+    assert db.committed == [[("items/rice", {"quantity": 2, "unit": "lb"}, True)]]
+    buffer.close()
+
+
+def test_buffer_retries_only_failed_batches():
+    db = FakeDb(failures=1)
+    buffer = sc_write_buffer.WriteBuffer(db, flush_interval=60)
+    for i in range(600):
+        buffer.set(FakeDocument(f"items/{i}"), {"version": 1}, merge=True)
+
+    with pytest.raises(ConnectionError):
+        buffer.flush()
+    # One batch committed, and only the writes of the other one are kept.
+    assert len(buffer) in (100, 500)
+    assert len(buffer) + len(db.committed[0]) == 600
+
+    buffer.flush()
+    paths = [path for writes in db.committed for path, _, _ in writes]
+    assert sorted(paths) == sorted(f"items/{i}" for i in range(600))
+    buffer.close()
+
+
+def test_commit_writes_reports_failed_writes():
+    db = FakeDb(failures=1)
+    writes = [
+        sc_write_buffer.Write(FakeDocument(f"items/{i}"), {"quantity": i}, False)
+        for i in range(3)
+    ]
+    failed = []
+    with pytest.raises(ConnectionError):
+        sc_write_buffer.commit_writes(db, writes, max_batch_size=2, failed=failed)
+    assert failed == writes[:2]
+    assert db.committed == [[("items/2", {"quantity": 2}, False)]]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
@@ -0,0 +1,106 @@
+import orjson
+import pydantic
+import pytest
+import sys
+
+from src.data_models import recipe as sc_recipe
+from src.utils import json_output as sc_json_output
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"name": "Rice"}', {"name": "Rice"}),
+        ('```json\n{"name": "Rice"}\n```', {"name": "Rice"}),
+        ('Here is the recipe:\n```json\n{"name": "Rice"}\n```', {"name": "Rice"}),
+        ("```\n[1, 2]\n```", [1, 2]),
+    ],
+)
+def test_parse_json_output(text, expected):
+    assert sc_json_output.parse_json_output(text) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"name": "Chick', {"name": "Chick"}),
+        (
+            '{"name": "Rice", "ingredients": [{"name": "Rice"',
+            {
+                "name": "Rice",
+                "ingredients": [{"name": "Rice"}],
+            },
+        ),
+        ('{"a": 1, "b', {"a": 1}),
+        ('{"a": 1, "b": ', {"a": 1}),
+        ('{"a": [1, 2, 3', {"a": [1, 2, 3]}),
+        ('{"a": "x\\', {"a": "x"}),
+        ('{"a": tr', {}),
+        (
+            '{"name": "Rice", "steps": {"1": "Boil',
+            {
+                "name": "Rice",
+                "steps": {"1": "Boil"},
+            },
+        ),
+    ],
+)
+def test_repair_truncated_json(text, expected):
+    assert orjson.loads(sc_json_output.repair_truncated_json(text)) == expected
+
+
+@pytest.mark.parametrize(
+    "text, expected",
+    [
+        ('{"name": "Chick', {}),
+        ('{"name": "Rice", "ingredients": [{"name": "Rice"', {"name": "Rice"}),
+        ('{"a": 1, "b', {"a": 1}),
+        ('{"a": 1, "b": ', {"a": 1}),
+        ('{"a": "x,", "b": [1, 2, 3', {"a": "x,"}),
+        ('```json\n{"name": "Rice", "steps": {"1": "Boil', {"name": "Rice"}),
+    ],
+)
+def test_parse_truncated_json_output_drops_last_member(text, expected):
+    assert sc_json_output.parse_json_output(text) == expected
+
+
+def test_truncated_recipe_is_invalid():
+    recipe = {
+        "name": "Rice",
+        "description": "Boiled rice.",
+        "ingredients": [{"name": "Brown Rice", "quantity": 1, "unit": "lb"}],
+        "instructions": {"1": "Boil the rice.", "2": "Serve."},
+    }
+    text = orjson.dumps(recipe).decode()
+
+    # Cut off in the middle of the instructions, which are then missing.
+    output_json = sc_json_output.parse_json_output(text[: text.index("Serve")])
+    with pytest.raises(pydantic.ValidationError):
+        sc_recipe.Recipe.model_validate(output_json)
+
+
+def test_truncated_list_is_invalid():
+    with pytest.raises(ValueError):
+        sc_json_output.parse_json_output("[1, 2")
+
+
+def test_complete_json_is_not_changed():
+    text = '{"a": [1, {"b": "}"}]}'
+    assert sc_json_output.repair_truncated_json(text) == text
+
+
+def test_invalid_json_output():
+    with pytest.raises(ValueError):
+        sc_json_output.parse_json_output("I could not find a recipe.")
+
+
+def test_response_format():
+    response_format = sc_json_output.response_format(sc_recipe.Recipe)
+
+    assert response_format["type"] == "json_schema"
+    assert response_format["json_schema"]["name"] == "Recipe"
+    assert "ingredients" in response_format["json_schema"]["schema"]["properties"]
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())
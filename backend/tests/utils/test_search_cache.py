@@ -0,0 +1,101 @@
+import pytest
+import sys
+
+from src.utils import search_cache as sc_search_cache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.mark.parametrize(
+    "query_a, query_b",
+    [
+        ("chicken breast nutrition per 4 oz", "Chicken Breast nutrition 4oz"),
+        ("nutrition of brown rice", "brown rice nutrition"),
+        ("  black   beans, serving size ", "black beans serving size"),
+    ],
+)
+def test_normalize_query(query_a, query_b):
+    assert sc_search_cache.SearchCache.normalize_query(
+        query_a
+    ) == sc_search_cache.SearchCache.normalize_query(query_b)
+
+
+def test_wrap_caches_results(clock):
+    cache = sc_search_cache.SearchCache(clock=clock)
+    calls = []
+
+    def search(query: str) -> str:
+        calls.append(query)
+        return f"result for {query}"
+
+    cached_search = cache.wrap(search)
+
+    assert cached_search("chicken breast nutrition per 4 oz") == (
+        "result for chicken breast nutrition per 4 oz"
+    )
+    assert cached_search("Chicken breast nutrition 4oz") == (
+        "result for chicken breast nutrition per 4 oz"
+    )
+    assert len(calls) == 1
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_rate == 0.5
+
+
+def test_entries_expire(clock):
+    cache = sc_search_cache.SearchCache(ttl_seconds=60, clock=clock)
+    cache.set("garlic shelf life", "6 months")
+
+    clock.now += 59
+    assert cache.get("garlic shelf life") == "6 months"
+
+    clock.now += 2
+    assert cache.get("garlic shelf life") is None
+    assert len(cache) == 0
+
+
+def test_max_size_evicts_least_recently_used(clock):
+    cache = sc_search_cache.SearchCache(max_size=2, clock=clock)
+    cache.set("onion", "a")
+    cache.set("garlic", "b")
+    cache.get("onion")
+    cache.set("tomato", "c")
+
+    assert cache.get("garlic") is None
+    assert cache.get("onion") == "a"
+    assert cache.get("tomato") == "c"
+
+
+def test_save_and_load(tmp_path, clock):
+    path = str(tmp_path / "search_cache.json")
+    cache = sc_search_cache.SearchCache(ttl_seconds=60, path=path, clock=clock)
+    cache.set("onion", "a")
+    cache.save()
+
+    loaded = sc_search_cache.SearchCache(ttl_seconds=60, path=path, clock=clock)
+    assert loaded.get("onion") == "a"
+
+    clock.now += 61
+    expired = sc_search_cache.SearchCache(ttl_seconds=60, path=path, clock=clock)
+    assert len(expired) == 0
+
+
+def test_save_without_path():
+    cache = sc_search_cache.SearchCache()
+    with pytest.raises(ValueError):
+        cache.save()
+
+
+if __name__ == "__main__":
+    sys.exit(pytest.main())